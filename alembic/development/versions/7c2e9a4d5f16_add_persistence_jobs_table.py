@@ -0,0 +1,47 @@
+"""add persistence_jobs table
+
+Revision ID: 7c2e9a4d5f16
+Revises: e5d1a7c3b280
+Create Date: 2023-10-16 14:22:48.907315
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "7c2e9a4d5f16"
+down_revision: Union[str, None] = "e5d1a7c3b280"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "persistence_jobs",
+        sa.Column("id", sa.String(), nullable=False),
+        sa.Column("kind", sa.String(), nullable=False),
+        sa.Column("user_id", sa.String(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("result", postgresql.JSONB(), nullable=True),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_persistence_jobs_updated_at", "persistence_jobs", ["updated_at"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_persistence_jobs_updated_at", table_name="persistence_jobs")
+    op.drop_table("persistence_jobs")
@@ -0,0 +1,94 @@
+"""add indexes for the hot queries
+
+Revision ID: 9b2e7f4c1a08
+Revises: c41f0d2b7e93
+Create Date: 2023-09-20 14:03:52.918264
+
+"""
+from typing import Any, Dict, List, Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9b2e7f4c1a08"
+down_revision: Union[str, None] = "c41f0d2b7e93"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, table, columns, extra create_index kwargs), kept in sync with the
+# Index / index=True declarations of app/models/db
+INDEXES: List[tuple[str, str, List[Any], Dict[str, Any]]] = [
+    (
+        "ix_category_user_id_created_at",
+        "category",
+        ["user_id", sa.text("created_at DESC"), sa.text("id DESC")],
+        {},
+    ),
+    (
+        "ix_vocabulary_prompts_history",
+        "vocabulary_prompts",
+        [
+            "category_id",
+            "language_id",
+            sa.text("created_at DESC"),
+            sa.text("id DESC"),
+        ],
+        {"postgresql_where": sa.text("is_valid")},
+    ),
+    ("ix_vocabulary_questions_prompt_id", "vocabulary_questions", ["prompt_id"], {}),
+    ("ix_vocabulary_answers_question_id", "vocabulary_answers", ["question_id"], {}),
+    (
+        "ix_vocabulary_prompt_translations_prompt_id",
+        "vocabulary_prompt_translations",
+        ["prompt_id"],
+        {},
+    ),
+    (
+        "ix_vocabulary_question_translations_question_id",
+        "vocabulary_question_translations",
+        ["question_id"],
+        {},
+    ),
+    (
+        "ix_vocabulary_answer_translations_answer_id",
+        "vocabulary_answer_translations",
+        ["answer_id"],
+        {},
+    ),
+    ("ix_image_caption_user_id", "image_caption", ["user_id"], {}),
+    (
+        "ix_image_caption_translation_caption_id",
+        "image_caption_translation",
+        ["caption_id"],
+        {},
+    ),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY does not lock the tables against writes but
+    # can not run inside a transaction. A failed build leaves an INVALID
+    # index behind: drop it and run the upgrade again.
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+                **kwargs,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
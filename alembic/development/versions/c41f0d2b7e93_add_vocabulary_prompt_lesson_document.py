@@ -0,0 +1,32 @@
+"""add vocabulary_prompts.lesson_document
+
+Revision ID: c41f0d2b7e93
+Revises: 5a6cce653bd9
+Create Date: 2023-09-18 09:12:31.442107
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c41f0d2b7e93"
+down_revision: Union[str, None] = "5a6cce653bd9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Nullable so the column is added without rewriting the table, existing
+    # lessons are filled by scripts/backfill_lesson_documents.py
+    op.add_column(
+        "vocabulary_prompts",
+        sa.Column("lesson_document", postgresql.JSONB(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("vocabulary_prompts", "lesson_document")
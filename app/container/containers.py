@@ -15,8 +15,15 @@ from app.infrastructure.auth0.auth0 import Auth0Service
 from app.infrastructure.aws.s3 import S3Service
 from app.infrastructure.db.database import Database
 from app.infrastructure.llm.caption import ChatGPTCaptionGenerator
+from app.infrastructure.llm.fake import FakeLLM
+from app.infrastructure.llm.lesson_cache import LessonCache
+from app.infrastructure.llm.single_flight import StreamCoalescer
+from app.infrastructure.llm.usage import UsageRecorder
 from app.infrastructure.llm.vocabulary import ChatGPTVocabularyGenerator
+from app.infrastructure.metrics.metrics import MetricsRegistry
 from app.infrastructure.replicate.caption import CaptionGenerator
+from app.infrastructure.replicate.fake import FakeReplicateClient
+from app.models.common.pagination import CountCache
 from app.models.db.difficulty_levels import DifficultyLevels
 from app.models.db.language import Language
 from app.models.db.vocabulary import Category, VocabularyPrompt
@@ -25,12 +32,23 @@ from app.repositories.caption_repository import (
     CaptionRepository,
     TranslatedCaptionRepository,
 )
+from app.repositories.llm_usage_repository import LLMUsageRepository
+from app.repositories.persistence_job_repository import PersistenceJobRepository
+from app.repositories.reference_data_repository import ReferenceDataRepository
 from app.repositories.user_repository import UserRepository
 from app.repositories.vocabulary_repository import VocabularyRepository
+from app.services.admission import AdmissionController
 from app.services.base_service import BaseService
-from app.services.caption_service import CaptionService
+from app.services.caption_service import CAPTION_JOB, CaptionService, CaptionWriter
+from app.services.lesson_pool import LessonPool
+from app.services.persistence_queue import PersistenceQueue
+from app.services.usage_service import UsageService
 from app.services.user_service import UserService
-from app.services.vocabulary_service import VocabularyService
+from app.services.vocabulary_service import (
+    LESSON_JOB,
+    LessonWriter,
+    VocabularyService,
+)
 
 
 class Container(containers.DeclarativeContainer):
@@ -42,6 +60,8 @@ class Container(containers.DeclarativeContainer):
             "app.routes.api_v1.endpoints.language",
             "app.routes.api_v1.endpoints.vocabulary",
             "app.routes.api_v1.endpoints.difficulty_level",
+            "app.routes.api_v1.endpoints.metrics",
+            "app.routes.api_v1.endpoints.persistence",
         ]
     )
 
@@ -61,7 +81,23 @@ class Container(containers.DeclarativeContainer):
         traces_sample_rate=1.0,
         environment=env_name,
     )
-    db = providers.Singleton(Database, db_url=config.infrastructures.db.url)
+    metrics = providers.Singleton(MetricsRegistry)
+
+    db = providers.Singleton(
+        Database,
+        db_url=config.infrastructures.db.url,
+        engine_mode=config.infrastructures.db.engine_mode,
+        pool=config.infrastructures.db.pool,
+        metrics=metrics,
+        slow_query_threshold=config.infrastructures.db.slow_query_threshold.as_float(),
+        replica_urls=config.infrastructures.db.replica_urls,
+        primary_stickiness=config.infrastructures.db.primary_stickiness.as_float(),
+    )
+
+    count_cache = providers.Singleton(
+        CountCache,
+        ttl=config.infrastructures.db.pagination.count_cache_ttl.as_float(),
+    )
 
     auth = providers.Singleton(
         Auth0Service,
@@ -74,11 +110,13 @@ class Container(containers.DeclarativeContainer):
     user_repository = providers.Factory(
         UserRepository,
         session_factory=db.provided.session,
+        async_session_factory=db.provided.async_session_factory,
     )
 
     user_service = providers.Factory(
         UserService,
         user_repository=user_repository,
+        async_mode=db.provided.is_async,
     )
 
     sts_client: Resource[BaseClient] = providers.Resource(
@@ -113,62 +151,230 @@ class Container(containers.DeclarativeContainer):
         config.infrastructures.aws.s3_image_bucket[env_name]
     )
 
-    caption_client: Resource[Client] = providers.Resource(
-        Client, api_token=config.infrastructures.replicate.access_token
+    caption_client = providers.Selector(
+        config.infrastructures.replicate.backend,
+        replicate=providers.Resource(
+            Client, api_token=config.infrastructures.replicate.access_token
+        ),
+        fake=providers.Singleton(
+            FakeReplicateClient,
+            latency=config.infrastructures.replicate.fake.latency.as_float(),
+            error_rate=config.infrastructures.replicate.fake.error_rate.as_float(),
+        ),
+    )
+
+    llm_coalescer = providers.Singleton(StreamCoalescer, metrics=metrics)
+
+    llm_usage_repository = providers.Singleton(
+        LLMUsageRepository,
+        session_factory=db.provided.session,
+        async_session_factory=db.provided.async_session_factory,
+    )
+
+    llm_usage = providers.Singleton(
+        UsageRecorder,
+        sink=llm_usage_repository.provided.add_many,
+        prompt_token_price=config.infrastructures.open_ai.usage.prompt_token_price.as_float(),
+        completion_token_price=config.infrastructures.open_ai.usage.completion_token_price.as_float(),
+        flush_interval=config.infrastructures.open_ai.usage.flush_interval.as_float(),
+        metrics=metrics,
     )
 
     caption_generator = providers.Singleton(
         CaptionGenerator,
         model_id=config.infrastructures.replicate.caption_model.model_id,
         caption_client=caption_client,
+        coalescer=llm_coalescer,
     )
-    open_ai: OpenAI = providers.Singleton(
-        OpenAI,
-        openai_api_key=config.infrastructures.open_ai.openai_api_key,
-        max_tokens=config.infrastructures.open_ai.max_tokens,
-        temperature=config.infrastructures.open_ai.temperature,
+    open_ai: OpenAI = providers.Selector(
+        config.infrastructures.open_ai.backend,
+        openai=providers.Singleton(
+            OpenAI,
+            openai_api_key=config.infrastructures.open_ai.openai_api_key,
+            max_tokens=config.infrastructures.open_ai.max_tokens,
+            temperature=config.infrastructures.open_ai.temperature,
+        ),
+        fake=providers.Singleton(
+            FakeLLM,
+            first_token_delay=config.infrastructures.open_ai.fake.first_token_delay.as_float(),
+            tokens_per_second=config.infrastructures.open_ai.fake.tokens_per_second.as_float(),
+            error_rate=config.infrastructures.open_ai.fake.error_rate.as_float(),
+            truncate_rate=config.infrastructures.open_ai.fake.truncate_rate.as_float(),
+        ),
     )
 
-    chatgpt_caption = providers.Singleton(ChatGPTCaptionGenerator, model=open_ai)
+    chatgpt_caption = providers.Singleton(
+        ChatGPTCaptionGenerator,
+        model=open_ai,
+        coalescer=llm_coalescer,
+        usage=llm_usage,
+    )
 
     chatGPT_vocabulary_generator = providers.Singleton(
-        ChatGPTVocabularyGenerator, model=open_ai
+        ChatGPTVocabularyGenerator,
+        model=open_ai,
+        coalescer=llm_coalescer,
+        usage=llm_usage,
+        generation_mode=config.infrastructures.open_ai.generation_mode,
+        lesson_format=config.infrastructures.open_ai.lesson_format,
+        max_completion_tokens=(
+            config.infrastructures.open_ai.lesson_limits.max_completion_tokens.as_int()
+        ),
+    )
+
+    lesson_cache = providers.Singleton(
+        LessonCache,
+        max_size=config.infrastructures.open_ai.lesson_cache.max_size.as_int(),
+        ttl=config.infrastructures.open_ai.lesson_cache.ttl.as_float(),
+        metrics=metrics,
+    )
+
+    admission_controller = providers.Singleton(
+        AdmissionController,
+        max_concurrent=config.infrastructures.open_ai.admission.max_concurrent.as_int(),
+        max_queue=config.infrastructures.open_ai.admission.max_queue.as_int(),
+        queue_timeout=config.infrastructures.open_ai.admission.queue_timeout.as_float(),
+        user_burst=config.infrastructures.open_ai.admission.user_burst.as_int(),
+        user_refill_seconds=config.infrastructures.open_ai.admission.user_refill_seconds.as_float(),
+        metrics=metrics,
+    )
+
+    reference_data_repository = providers.Singleton(
+        ReferenceDataRepository,
+        session_factory=db.provided.session,
+        async_session_factory=db.provided.async_session_factory,
+        refresh_interval=config.infrastructures.db.reference_data_refresh_interval.as_float(),
     )
 
     primary_caption_repository = providers.Factory(
-        CaptionRepository, session_factory=db.provided.session
+        CaptionRepository,
+        session_factory=db.provided.session,
+        async_session_factory=db.provided.async_session_factory,
+        reference_data=reference_data_repository,
     )
 
     learning_caption_repository = providers.Factory(
-        TranslatedCaptionRepository, session_factory=db.provided.session
+        TranslatedCaptionRepository,
+        session_factory=db.provided.session,
+        async_session_factory=db.provided.async_session_factory,
+        reference_data=reference_data_repository,
     )
 
     language_repository = providers.Factory(
-        BaseRepository, model=Language, session_factory=db.provided.session
+        BaseRepository,
+        model=Language,
+        session_factory=db.provided.session,
+        async_session_factory=db.provided.async_session_factory,
+        count_strategy=config.infrastructures.db.pagination.count_strategy,
+        count_cache=count_cache,
+        # The lookup of the language rows is reloaded after a write
+        after_commit=reference_data_repository.provided.invalidate,
     )
 
     category_repository = providers.Factory(
         BaseRepository[Category, Any, Any],
         model=Category,
         session_factory=db.provided.session,
+        async_session_factory=db.provided.async_session_factory,
+        count_strategy=config.infrastructures.db.pagination.count_strategy,
+        count_cache=count_cache,
+        user_scope_column="user_id",
     )
 
     difficulty_levels_repository = providers.Factory(
         BaseRepository[DifficultyLevels, Any, Any],
         model=DifficultyLevels,
         session_factory=db.provided.session,
+        async_session_factory=db.provided.async_session_factory,
+        count_strategy=config.infrastructures.db.pagination.count_strategy,
+        count_cache=count_cache,
+        after_commit=reference_data_repository.provided.invalidate,
     )
 
     vocabulary_repository = providers.Factory(
         VocabularyRepository,
         model=VocabularyPrompt,
         session_factory=db.provided.session,
+        async_session_factory=db.provided.async_session_factory,
+        count_strategy=config.infrastructures.db.pagination.count_strategy,
+        count_cache=count_cache,
+        reference_data=reference_data_repository,
+        lesson_insert_mode=config.infrastructures.db.lesson_insert_mode,
+    )
+
+    # The lesson pool runs its generations on the event loops of its worker
+    # threads, the loop bound coalescer is not shared with them. Pooled lessons
+    # of a combination are meant to differ anyway.
+    lesson_pool_generator = providers.Singleton(
+        ChatGPTVocabularyGenerator,
+        model=open_ai,
+        usage=llm_usage,
+        generation_mode=config.infrastructures.open_ai.generation_mode,
+        lesson_format=config.infrastructures.open_ai.lesson_format,
+        max_completion_tokens=(
+            config.infrastructures.open_ai.lesson_limits.max_completion_tokens.as_int()
+        ),
+    )
+
+    lesson_pool = providers.Singleton(
+        LessonPool,
+        voca_generator=lesson_pool_generator,
+        voca_repository=vocabulary_repository,
+        size=config.infrastructures.open_ai.lesson_pool.size.as_int(),
+        max_combinations=config.infrastructures.open_ai.lesson_pool.max_combinations.as_int(),
+        refresh_interval=config.infrastructures.open_ai.lesson_pool.refresh_interval.as_float(),
+        popular_window=config.infrastructures.open_ai.lesson_pool.popular_window.as_float(),
+        max_workers=config.infrastructures.open_ai.lesson_pool.max_workers.as_int(),
+        metrics=metrics,
+    )
+
+    persistence_job_repository = providers.Singleton(
+        PersistenceJobRepository, session_factory=db.provided.session
+    )
+
+    persistence_queue = providers.Singleton(
+        PersistenceQueue,
+        handlers=providers.Dict(
+            {
+                LESSON_JOB: providers.Factory(
+                    LessonWriter, voca_repository=vocabulary_repository
+                ),
+                CAPTION_JOB: providers.Factory(
+                    CaptionWriter,
+                    primary_caption_repository=primary_caption_repository,
+                    learning_caption_repository=learning_caption_repository,
+                ),
+            }
+        ),
+        journal_dir=config.infrastructures.db.persistence.journal_dir,
+        batch_size=config.infrastructures.db.persistence.batch_size.as_int(),
+        max_attempts=config.infrastructures.db.persistence.max_attempts.as_int(),
+        retry_backoff=config.infrastructures.db.persistence.retry_backoff.as_float(),
+        status_sink=persistence_job_repository.provided.save_many,
+        status_source=persistence_job_repository.provided.get,
+        metrics=metrics,
+    )
+
+    # Services store generated content inline without a queue
+    service_persistence_queue = providers.Selector(
+        config.infrastructures.db.persistence.mode,
+        inline=providers.Object(None),
+        queue=persistence_queue,
     )
 
     vocabulary_service = providers.Factory(
         VocabularyService,
         voca_generator=chatGPT_vocabulary_generator,
         voca_repository=vocabulary_repository,
+        async_mode=db.provided.is_async,
+        lesson_cache=lesson_cache,
+        lesson_pool=lesson_pool,
+        batch_fan_out=config.infrastructures.open_ai.batch.fan_out.as_int(),
+        batch_max_lessons=config.infrastructures.open_ai.batch.max_lessons.as_int(),
+        max_questions=config.infrastructures.open_ai.lesson_limits.max_questions.as_int(),
+        max_answers=config.infrastructures.open_ai.lesson_limits.max_answers.as_int(),
+        persistence_queue=service_persistence_queue,
+        metrics=metrics,
     )
 
     caption_service = providers.Factory(
@@ -177,12 +383,30 @@ class Container(containers.DeclarativeContainer):
         primary_caption_repository=primary_caption_repository,
         caption_generator=caption_generator,
         chatgpt_caption=chatgpt_caption,
+        async_mode=db.provided.is_async,
+        persistence_queue=service_persistence_queue,
     )
 
-    category_service = providers.Factory(BaseService, repository=category_repository)
+    usage_service = providers.Factory(
+        UsageService,
+        usage_repository=llm_usage_repository,
+        async_mode=db.provided.is_async,
+    )
+
+    category_service = providers.Factory(
+        BaseService,
+        repository=category_repository,
+        async_mode=db.provided.is_async,
+    )
 
-    language_service = providers.Factory(BaseService, repository=language_repository)
+    language_service = providers.Factory(
+        BaseService,
+        repository=language_repository,
+        async_mode=db.provided.is_async,
+    )
 
     difficulty_levels_service = providers.Factory(
-        BaseService, repository=difficulty_levels_repository
+        BaseService,
+        repository=difficulty_levels_repository,
+        async_mode=db.provided.is_async,
     )
@@ -1,47 +1,195 @@
+import itertools
 import logging
-from contextlib import AbstractContextManager, contextmanager
-from typing import Callable
+from contextlib import (
+    AbstractAsyncContextManager,
+    AbstractContextManager,
+    asynccontextmanager,
+    contextmanager,
+)
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Union
 
-from sqlalchemy import create_engine, create_mock_engine, orm
+from sqlalchemy import (
+    Engine,
+    create_engine,
+    create_mock_engine,
+    event,
+    make_url,
+    orm,
+)
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session
 
+from app.infrastructure.db.instrumentation import QueryInstrumentation
+from app.infrastructure.db.pool import PoolMetrics, PoolSettings
+from app.infrastructure.db.routing import ReplicaRouter
+from app.infrastructure.metrics.metrics import MetricsRegistry
+
 Base = declarative_base()
 
+SYNC_ENGINE_MODE = "sync"
+ASYNC_ENGINE_MODE = "async"
+ASYNC_DRIVER_NAME = "postgresql+asyncpg"
+
 
 def dump(sql, *multiparams, **params):  # type: ignore
     print()
 
 
+def to_async_url(db_url: str) -> str:
+    """Swap the sync driver of a postgres url (psycopg2) for asyncpg."""
+    url = make_url(db_url)
+    return url.set(drivername=ASYNC_DRIVER_NAME).render_as_string(hide_password=False)
+
+
+def parse_replica_urls(replica_urls: Union[str, List[str], None]) -> List[str]:
+    """Accept a list or a comma separated string (from the environment)."""
+    if not replica_urls:
+        return []
+    if isinstance(replica_urls, str):
+        replica_urls = replica_urls.split(",")
+    return [url.strip() for url in replica_urls if url.strip()]
+
+
 class Database:
     # TODO: naming of the package in this folder must be more consistent
     #  https://github.com/Sensay-AI/core-service/pull/9#discussion_r1306129822
 
-    def __init__(self, db_url: str) -> None:
+    def __init__(
+        self,
+        db_url: str,
+        engine_mode: str = SYNC_ENGINE_MODE,
+        pool: Optional[Dict[str, Any]] = None,
+        metrics: Optional[MetricsRegistry] = None,
+        slow_query_threshold: float = 0.5,
+        replica_urls: Union[str, List[str], None] = None,
+        primary_stickiness: float = 5,
+    ) -> None:
         self.logger = logging.getLogger(
             f"{__name__}.{self.__class__.__name__}",
         )
+        if engine_mode not in (SYNC_ENGINE_MODE, ASYNC_ENGINE_MODE):
+            raise InvalidEngineMode(engine_mode)
+        self.engine_mode = engine_mode
+        self.pool_settings = PoolSettings(**(pool or {}))
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.slow_query_threshold = slow_query_threshold
+        self.router = ReplicaRouter(primary_stickiness)
 
         self._engine = (
-            create_engine(db_url, echo=True)
+            create_engine(db_url, **self.pool_settings.engine_kwargs())
             if db_url
             else create_mock_engine("postgresql+psycopg2://", dump)
         )
+        if db_url:
+            self._instrument(self._engine, "primary")
 
-        self._session_factory = orm.scoped_session(
-            orm.sessionmaker(
-                autocommit=False,
-                autoflush=False,
-                bind=self._engine,
-            ),
+        primary_sessionmaker = orm.sessionmaker(
+            autocommit=False,
+            autoflush=False,
+            bind=self._engine,
         )
+        event.listen(primary_sessionmaker, "after_commit", self._on_primary_commit)
+        self._session_factory = orm.scoped_session(primary_sessionmaker)
+
+        # Read-only sessions are spread round robin over the replicas
+        self._replica_index = itertools.count()
+        self._replica_session_factories: List[orm.sessionmaker[Session]] = []
+        self._async_replica_session_factories: List[
+            async_sessionmaker[AsyncSession]
+        ] = []
+        replica_urls = parse_replica_urls(replica_urls) if db_url else []
+        for index, replica_url in enumerate(replica_urls):
+            replica_engine = create_engine(
+                replica_url, **self.pool_settings.engine_kwargs()
+            )
+            self._instrument(replica_engine, f"replica_{index}")
+            self._replica_session_factories.append(
+                orm.sessionmaker(
+                    autocommit=False,
+                    autoflush=False,
+                    bind=replica_engine,
+                )
+            )
+
+        # The sync engine is always kept: DDL (create_database) and the
+        # streaming endpoints, which run on the threadpool, still use it.
+        self._async_engine = None
+        self._async_session_factory: Optional[async_sessionmaker[AsyncSession]] = None
+        if self.is_async and db_url:
+            self._async_engine = create_async_engine(
+                to_async_url(db_url),
+                **self.pool_settings.engine_kwargs(is_async=True),
+            )
+            self._instrument(self._async_engine.sync_engine, "primary_async")
+            self._async_session_factory = async_sessionmaker(
+                autoflush=False,
+                # Attributes can not be lazy loaded outside of the session in
+                # asyncio, so keep the committed state on the returned objects.
+                expire_on_commit=False,
+                bind=self._async_engine,
+            )
+            for index, replica_url in enumerate(replica_urls):
+                async_replica_engine = create_async_engine(
+                    to_async_url(replica_url),
+                    **self.pool_settings.engine_kwargs(is_async=True),
+                )
+                self._instrument(
+                    async_replica_engine.sync_engine, f"replica_{index}_async"
+                )
+                self._async_replica_session_factories.append(
+                    async_sessionmaker(
+                        autoflush=False,
+                        expire_on_commit=False,
+                        bind=async_replica_engine,
+                    )
+                )
+
+    def _instrument(self, engine: Engine, engine_name: str) -> None:
+        PoolMetrics(self.metrics, engine_name).attach(engine)
+        QueryInstrumentation(
+            self.metrics, engine_name, self.slow_query_threshold
+        ).attach(engine)
+
+    def _on_primary_commit(self, session: Session) -> None:
+        self.router.record_write()
+
+    def _pick_replica(self, factories: List[Any], read_only: bool) -> Optional[Any]:
+        if not read_only or not factories or self.router.use_primary():
+            return None
+        return factories[next(self._replica_index) % len(factories)]
+
+    @property
+    def has_replicas(self) -> bool:
+        return bool(self._replica_session_factories)
+
+    @property
+    def is_async(self) -> bool:
+        return self.engine_mode == ASYNC_ENGINE_MODE
+
+    @property
+    def async_session_factory(
+        self,
+    ) -> Optional[Callable[..., AbstractAsyncContextManager[AsyncSession]]]:
+        return self.async_session if self._async_session_factory else None
 
     def create_database(self) -> None:
         Base.metadata.create_all(self._engine)
 
     @contextmanager  # type: ignore
-    def session(self) -> Callable[..., AbstractContextManager[Session]]:  # type: ignore
-        session: Session = self._session_factory()
+    def session(  # type: ignore
+        self, read_only: bool = False
+    ) -> Callable[..., AbstractContextManager[Session]]:
+        # Read-only sessions go to a replica unless the caller must see its
+        # own writes, every other session is bound to the primary.
+        replica_session_factory = self._pick_replica(
+            self._replica_session_factories, read_only
+        )
+        session: Session = (
+            replica_session_factory()
+            if replica_session_factory is not None
+            else self._session_factory()
+        )
         try:
             yield session
         except Exception:
@@ -50,3 +198,35 @@ class Database:
             raise
         finally:
             session.close()
+
+    @asynccontextmanager
+    async def async_session(
+        self, read_only: bool = False
+    ) -> AsyncIterator[AsyncSession]:
+        if self._async_session_factory is None:
+            raise InvalidEngineMode(self.engine_mode)
+        replica_session_factory = self._pick_replica(
+            self._async_replica_session_factories, read_only
+        )
+        session: AsyncSession
+        if replica_session_factory is not None:
+            session = replica_session_factory()
+        else:
+            session = self._async_session_factory()
+            event.listen(session.sync_session, "after_commit", self._on_primary_commit)
+        try:
+            yield session
+        except Exception:
+            self.logger.exception("Session rollback because of exception")
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+
+class InvalidEngineMode(Exception):
+    def __init__(self, engine_mode: str):
+        super().__init__(
+            f"Invalid db engine mode: {engine_mode}, "
+            f"only accept value: <'{SYNC_ENGINE_MODE}','{ASYNC_ENGINE_MODE}'>"
+        )
@@ -0,0 +1,110 @@
+import heapq
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Engine, event
+
+from app.infrastructure.metrics.metrics import MetricsRegistry
+
+MAX_SLOWEST_STATEMENTS = 3
+_QUERY_START_TIME = "query_start_time"
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    total_time: float = 0.0
+    slowest: List[Tuple[float, str]] = field(default_factory=list)
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.total_time += duration
+        if len(self.slowest) < MAX_SLOWEST_STATEMENTS:
+            heapq.heappush(self.slowest, (duration, statement))
+        else:
+            heapq.heappushpop(self.slowest, (duration, statement))
+
+    @property
+    def slowest_statements(self) -> List[Tuple[float, str]]:
+        return sorted(self.slowest, reverse=True)
+
+    @property
+    def max_time(self) -> float:
+        return max((duration for duration, _ in self.slowest), default=0.0)
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar(
+    "query_stats", default=None
+)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """Collect the statements executed in the current context (e.g. a request)."""
+    stats = QueryStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+class QueryInstrumentation:
+    """Time every statement of an engine through cursor execute events.
+
+    Replaces ``echo=True``: statements are only logged when they are slower
+    than ``slow_query_threshold`` seconds.
+    """
+
+    def __init__(
+        self,
+        metrics: MetricsRegistry,
+        engine_name: str,
+        slow_query_threshold: float = 0.5,
+    ) -> None:
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self.metrics = metrics
+        self.labels = {"engine": engine_name}
+        self.slow_query_threshold = slow_query_threshold
+
+    def attach(self, engine: Engine) -> None:
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(
+        self,
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        executemany: bool,
+    ) -> None:
+        conn.info.setdefault(_QUERY_START_TIME, []).append(time.perf_counter())
+
+    def _after_cursor_execute(
+        self,
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        executemany: bool,
+    ) -> None:
+        duration = time.perf_counter() - conn.info[_QUERY_START_TIME].pop()
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.record(statement, duration)
+        self.metrics.observe("db_query_seconds", duration, self.labels)
+        if duration >= self.slow_query_threshold:
+            self.metrics.increment("db_slow_queries_total", labels=self.labels)
+            self.logger.warning(
+                "Slow query (%.3fs): %s parameters: %s",
+                duration,
+                statement,
+                parameters,
+            )
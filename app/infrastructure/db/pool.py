@@ -0,0 +1,143 @@
+import time
+from typing import Any, Dict, Optional, Type
+
+from pydantic import BaseModel
+from sqlalchemy import Engine, event, exc
+from sqlalchemy.pool import (
+    AsyncAdaptedQueuePool,
+    ConnectionPoolEntry,
+    NullPool,
+    Pool,
+    PoolProxiedConnection,
+    QueuePool,
+)
+
+from app.infrastructure.metrics.metrics import MetricsRegistry
+
+QUEUE_POOL = "queue"
+NULL_POOL = "null"
+
+
+class PoolSettings(BaseModel):
+    # "queue" keeps a per-process pool, "null" opens a connection per checkout
+    # and is meant for running behind an external pooler such as PgBouncer.
+    pool_class: str = QUEUE_POOL
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30
+    pool_recycle: int = -1
+    pool_pre_ping: bool = True
+
+    def engine_kwargs(self, is_async: bool = False) -> Dict[str, Any]:
+        if self.pool_class == NULL_POOL:
+            return {"poolclass": NullPool, "pool_pre_ping": self.pool_pre_ping}
+        if self.pool_class != QUEUE_POOL:
+            raise InvalidPoolClass(self.pool_class)
+        pool_class: Type[Pool] = (
+            InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool
+        )
+        return {
+            "poolclass": pool_class,
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_timeout": self.pool_timeout,
+            "pool_recycle": self.pool_recycle,
+            "pool_pre_ping": self.pool_pre_ping,
+        }
+
+
+class PoolMetrics:
+    """Export the pool events and the live pool status of an engine."""
+
+    def __init__(self, metrics: MetricsRegistry, engine_name: str) -> None:
+        self.metrics = metrics
+        self.labels = {"engine": engine_name}
+        self._pool: Optional[Pool] = None
+
+    def attach(self, engine: Engine) -> None:
+        self._pool = engine.pool
+        if isinstance(self._pool, _WaitTimedPool):
+            self._pool.pool_metrics = self
+        event.listen(engine.pool, "connect", self._on_connect)
+        event.listen(engine.pool, "checkout", self._on_checkout)
+        event.listen(engine.pool, "checkin", self._on_checkin)
+        event.listen(engine.pool, "invalidate", self._on_invalidate)
+        event.listen(engine.pool, "soft_invalidate", self._on_invalidate)
+        self.metrics.register_collector(self.collect)
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        self.metrics.observe("db_pool_wait_seconds", seconds, self.labels)
+        if timed_out:
+            self.metrics.increment("db_pool_timeouts_total", labels=self.labels)
+
+    def collect(self, metrics: MetricsRegistry) -> None:
+        if not isinstance(self._pool, QueuePool):
+            return
+        metrics.set_gauge("db_pool_size", self._pool.size(), self.labels)
+        metrics.set_gauge("db_pool_checked_out", self._pool.checkedout(), self.labels)
+        metrics.set_gauge("db_pool_checked_in", self._pool.checkedin(), self.labels)
+        metrics.set_gauge("db_pool_overflow", self._pool.overflow(), self.labels)
+
+    def _on_connect(self, dbapi_connection: Any, record: ConnectionPoolEntry) -> None:
+        self.metrics.increment("db_pool_connects_total", labels=self.labels)
+
+    def _on_checkout(
+        self,
+        dbapi_connection: Any,
+        record: ConnectionPoolEntry,
+        proxy: PoolProxiedConnection,
+    ) -> None:
+        self.metrics.increment("db_pool_checkouts_total", labels=self.labels)
+
+    def _on_checkin(
+        self, dbapi_connection: Any, record: Optional[ConnectionPoolEntry]
+    ) -> None:
+        self.metrics.increment("db_pool_checkins_total", labels=self.labels)
+
+    def _on_invalidate(
+        self,
+        dbapi_connection: Any,
+        record: ConnectionPoolEntry,
+        exception: Optional[BaseException],
+    ) -> None:
+        self.metrics.increment("db_pool_invalidations_total", labels=self.labels)
+
+
+class _WaitTimedPool(QueuePool):
+    """QueuePool which reports how long a checkout waited for a connection.
+
+    SQLAlchemy has no pool event for the wait itself, so the blocking
+    ``_do_get`` is timed here.
+    """
+
+    pool_metrics: Optional[PoolMetrics] = None
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self._record_wait(start, timed_out=True)
+            raise
+        self._record_wait(start)
+        return record
+
+    def _record_wait(self, start: float, timed_out: bool = False) -> None:
+        if self.pool_metrics is not None:
+            self.pool_metrics.record_wait(time.perf_counter() - start, timed_out)
+
+
+class InstrumentedQueuePool(_WaitTimedPool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_WaitTimedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+class InvalidPoolClass(Exception):
+    def __init__(self, pool_class: str):
+        super().__init__(
+            f"Invalid db pool class: {pool_class}, "
+            f"only accept value: <'{QUEUE_POOL}','{NULL_POOL}'>"
+        )
@@ -0,0 +1,83 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+# Sticky entries are pruned once the map grows past this size
+MAX_STICKY_CLIENTS = 10000
+
+
+class RequestWrites:
+    """Mutable per-request state, shared by the copies of the request context
+    made for child tasks and threadpool calls."""
+
+    def __init__(self, client_key: Optional[str] = None) -> None:
+        self.client_key = client_key
+        self.wrote = False
+
+
+_current_writes: ContextVar[Optional[RequestWrites]] = ContextVar(
+    "db_request_writes", default=None
+)
+
+
+@contextmanager
+def read_your_writes(client: Optional[str] = None) -> Iterator[RequestWrites]:
+    """Scope read routing to a request, `client` identifies the caller across
+    requests (e.g. its Authorization header) and is only kept hashed."""
+    client_key = hashlib.sha256(client.encode()).hexdigest() if client else None
+    writes = RequestWrites(client_key)
+    token = _current_writes.set(writes)
+    try:
+        yield writes
+    finally:
+        _current_writes.reset(token)
+
+
+class ReplicaRouter:
+    """Decide whether the reads of the current request may use a replica.
+
+    Once a request committed on the primary, its remaining reads stay on the
+    primary. The same client also keeps reading from the primary for
+    `stickiness` seconds, so a following request (e.g. the history after a
+    lesson was generated) does not miss its write because of replication lag.
+    """
+
+    def __init__(self, stickiness: float = 5) -> None:
+        self.stickiness = stickiness
+        self._lock = threading.Lock()
+        self._sticky_until: Dict[str, float] = {}
+
+    def record_write(self) -> None:
+        writes = _current_writes.get()
+        if writes is None:
+            return
+        writes.wrote = True
+        if not writes.client_key or self.stickiness <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if len(self._sticky_until) >= MAX_STICKY_CLIENTS:
+                self._sticky_until = {
+                    key: until
+                    for key, until in self._sticky_until.items()
+                    if until > now
+                }
+            self._sticky_until[writes.client_key] = now + self.stickiness
+
+    def use_primary(self) -> bool:
+        writes = _current_writes.get()
+        if writes is None:
+            return False
+        if writes.wrote:
+            return True
+        if not writes.client_key:
+            return False
+        with self._lock:
+            until = self._sticky_until.get(writes.client_key)
+            if until is not None and until <= time.monotonic():
+                del self._sticky_until[writes.client_key]
+                until = None
+        return until is not None
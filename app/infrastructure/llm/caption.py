@@ -1,8 +1,13 @@
 import logging
-from typing import Generator
+from typing import AsyncGenerator, AsyncIterator, Optional, Tuple
 
 from langchain import OpenAI, PromptTemplate
 
+from app.infrastructure.llm.single_flight import StreamCoalescer, flight_key
+from app.infrastructure.llm.usage import UsageRecorder, llm_model_name
+
+CAPTION_ENDPOINT = "caption"
+
 
 class ChatGPTCaptionGenerator:
     _caption_template = """
@@ -18,21 +23,59 @@ class ChatGPTCaptionGenerator:
         }
     """
 
-    def __init__(self, model: OpenAI):
+    def __init__(
+        self,
+        model: OpenAI,
+        coalescer: Optional[StreamCoalescer] = None,
+        usage: Optional[UsageRecorder] = None,
+    ):
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
         self.model = model
+        self.coalescer = coalescer
+        self.usage = usage if usage is not None else UsageRecorder()
+
+    def _astream(self, prompt: str) -> Tuple[AsyncIterator[str], bool]:
+        if self.coalescer is None:
+            return self.model.astream(prompt), False
+        # Identical concurrent prompts share one completion
+        key = flight_key("caption", prompt)
+        coalesced = self.coalescer.in_flight(key)
+        return (
+            self.coalescer.stream(key, lambda: self.model.astream(prompt)),
+            coalesced,
+        )
 
-    def rewrite_caption(
+    def _build_prompt(
         self, learning_language: str, primary_language: str, caption: str
-    ) -> Generator:
+    ) -> str:
         caption_template: PromptTemplate = PromptTemplate.from_template(
             self._caption_template, template_format="jinja2"
         )
-
-        prompt = caption_template.format(
+        return caption_template.format(
             primary_language=primary_language,
             learning_language=learning_language,
             description=caption,
         )
-        for response in self.model.stream(prompt):
-            yield response
+
+    async def rewrite_caption_async(
+        self,
+        learning_language: str,
+        primary_language: str,
+        caption: str,
+        user_id: Optional[str] = None,
+    ) -> AsyncGenerator[str, None]:
+        prompt = self._build_prompt(learning_language, primary_language, caption)
+        stream, coalesced = self._astream(prompt)
+        tracker = self.usage.track(
+            CAPTION_ENDPOINT,
+            llm_model_name(self.model),
+            prompt,
+            user_id=user_id,
+            coalesced=coalesced,
+        )
+        try:
+            async for response in stream:
+                tracker.on_chunk(response)
+                yield response
+        finally:
+            tracker.finish()
@@ -0,0 +1,98 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.infrastructure.llm.json_stream import IncrementalJSONParser
+
+# The lesson, its translation and the questions, each question is
+# [question, translation, options, translated options, index of the answer]
+LESSON, TRANSLATED_LESSON, QUESTIONS = range(3)
+
+
+def decode_compact_question(
+    question: Any,
+) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """The learning and translated questions of a compact question, None when
+    it is malformed."""
+    if not isinstance(question, list) or len(question) != 5:
+        return None
+    text, translation, options, translated_options, answer = question
+    if not (
+        isinstance(text, str)
+        and isinstance(translation, str)
+        and isinstance(options, list)
+        and isinstance(translated_options, list)
+        and len(options) == len(translated_options)
+        and isinstance(answer, int)
+        and 0 <= answer < len(options)
+    ):
+        return None
+    return (
+        {"question": text, "options": options, "answer": options[answer]},
+        {
+            "question": translation,
+            "options": translated_options,
+            "answer": translated_options[answer],
+        },
+    )
+
+
+class CompactLessonDecoder:
+    """Turn a streamed compact lesson into the bilingual lesson document the
+    verbose format streams.
+
+    The compact lesson is a JSON array of positional values with the answer
+    given as an option index, which takes about 30% fewer completion tokens.
+    The learning language half of the document is streamed as its questions
+    complete, the translated half is written by `finish`. Malformed questions
+    are dropped from both languages.
+    """
+
+    def __init__(self, learning_language: str, translated_language: str) -> None:
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self.learning_language = learning_language
+        self.translated_language = translated_language
+        self.parser = IncrementalJSONParser(depths=(1, 2))
+        self.started = False
+        self.translated_lesson: Optional[str] = None
+        self.translated_questions: List[Dict[str, Any]] = []
+
+    def feed(self, text: str) -> str:
+        decoded: List[str] = []
+        for path, value in self.parser.feed(text):
+            if path == (LESSON,) and isinstance(value, str):
+                self.started = True
+                decoded.append(
+                    f'{{"{self.learning_language}": {{"lesson": {_dumps(value)}, '
+                    '"questions": ['
+                )
+            elif path == (TRANSLATED_LESSON,) and isinstance(value, str):
+                self.translated_lesson = value
+            elif len(path) == 2 and path[0] == QUESTIONS and self.started:
+                question = decode_compact_question(value)
+                if question is None:
+                    self.logger.warning(f"Drop the malformed compact question {value}")
+                    continue
+                learning, translated = question
+                separator = ", " if self.translated_questions else ""
+                decoded.append(separator + _dumps(learning))
+                self.translated_questions.append(translated)
+        return "".join(decoded)
+
+    def finish(self) -> str:
+        """The end of the document, empty when the lesson never started."""
+        if not self.started:
+            return ""
+        if not self.parser.complete:
+            self.logger.warning(
+                f"The compact lesson did not complete, keep its "
+                f"{len(self.translated_questions)} complete questions"
+            )
+        translated: Dict[str, Any] = {"questions": self.translated_questions}
+        if self.translated_lesson is not None:
+            translated = {"lesson": self.translated_lesson, **translated}
+        return f']}}, "{self.translated_language}": {_dumps(translated)}}}'
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False)
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from openai.error import ServiceUnavailableError
+
+from app.infrastructure.llm.usage import CHARS_PER_TOKEN
+
+FAKE_MODEL = "fake"
+
+_LESSON_PROMPT = re.compile(
+    r"lesson in (?P<learning>.+?) of no more than.*?teach the students "
+    r"(?P<questions>\d+) (?P<level>.+?) vocabulary words in the context of "
+    r"(?P<category>.+?)\. Then.*?with (?P<answers>\d+) possible answers",
+    re.DOTALL,
+)
+# Missing from the prompt of a lesson in the learning language only
+_PRIMARY_LANGUAGE = re.compile(r"instructions in (?P<primary>.+?) Do not")
+# The lesson is asked for in the compact format
+_COMPACT_LESSON = re.compile(r"JSON array of the lesson")
+_TRANSLATION_PROMPT = re.compile(
+    r"from (?P<learning>.+?) to (?P<primary>.+?)\. Keep the keys.*?JSON object: "
+    r"(?P<content>\{.*\})\s*$",
+    re.DOTALL,
+)
+_CAPTION_PROMPT = re.compile(
+    r"description : (?P<description>.+?) \.\s.*?two languages: "
+    r"(?P<primary>.+?) and (?P<learning>.+?) ,",
+    re.DOTALL,
+)
+
+
+def fake_lesson(
+    category: str,
+    learning_language: str,
+    primary_language: Optional[str],
+    num_questions: int,
+    num_answers: int,
+    level: str = "EASY",
+    compact: bool = False,
+) -> str:
+    def part(language: str) -> dict:
+        return {
+            "lesson": f"A {level} {language} lesson about {category}",
+            "questions": [
+                {
+                    "question": f"{language} question {question} about {category}?",
+                    "options": [
+                        f"{language} option {answer}" for answer in range(num_answers)
+                    ],
+                    "answer": f"{language} option 0",
+                }
+                for question in range(num_questions)
+            ],
+        }
+
+    if primary_language is None:
+        return json.dumps(part(learning_language))
+    if compact:
+        learning, primary = part(learning_language), part(primary_language)
+        return json.dumps(
+            [
+                learning["lesson"],
+                primary["lesson"],
+                [
+                    [
+                        question["question"],
+                        translation["question"],
+                        question["options"],
+                        translation["options"],
+                        0,
+                    ]
+                    for question, translation in zip(
+                        learning["questions"], primary["questions"]
+                    )
+                ],
+            ]
+        )
+    return json.dumps(
+        {
+            learning_language: part(learning_language),
+            primary_language: part(primary_language),
+        }
+    )
+
+
+def fake_translation(content: Any, language: str) -> Any:
+    if isinstance(content, str):
+        return f"{language}: {content}"
+    if isinstance(content, list):
+        return [fake_translation(value, language) for value in content]
+    if isinstance(content, dict):
+        return {
+            key: fake_translation(value, language) for key, value in content.items()
+        }
+    return content
+
+
+def fake_completion(prompt: str) -> str:
+    """A valid answer to a lesson, translation or caption prompt."""
+    translation = _TRANSLATION_PROMPT.search(prompt)
+    if translation is not None:
+        return json.dumps(
+            fake_translation(json.loads(translation["content"]), translation["primary"])
+        )
+    lesson = _LESSON_PROMPT.search(prompt)
+    if lesson is not None:
+        primary = _PRIMARY_LANGUAGE.search(prompt)
+        return fake_lesson(
+            category=lesson["category"],
+            learning_language=lesson["learning"],
+            primary_language=primary["primary"] if primary is not None else None,
+            num_questions=int(lesson["questions"]),
+            num_answers=int(lesson["answers"]),
+            level=lesson["level"],
+            compact=_COMPACT_LESSON.search(prompt) is not None,
+        )
+    caption = _CAPTION_PROMPT.search(prompt)
+    if caption is not None:
+        return json.dumps(
+            {
+                caption["learning"]: f"{caption['learning']}: {caption['description']}",
+                caption["primary"]: f"{caption['primary']}: {caption['description']}",
+            }
+        )
+    return json.dumps({"completion": "fake"})
+
+
+class FakeLLM:
+    """Stands in for the langchain `OpenAI` model to run the app offline.
+
+    The lesson, translation and caption prompts are answered with valid JSON, streamed a
+    token (about `CHARS_PER_TOKEN` characters) at a time: the first one after
+    `first_token_delay` seconds, then `tokens_per_second` of them. A stream
+    fails halfway with `error_rate` probability and stops halfway, leaving
+    broken JSON, with `truncate_rate` probability. A completion longer than
+    `max_tokens` is cut there.
+    """
+
+    model_name = FAKE_MODEL
+
+    def __init__(
+        self,
+        first_token_delay: float = 0.5,
+        tokens_per_second: float = 50,
+        error_rate: float = 0,
+        truncate_rate: float = 0,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self.first_token_delay = first_token_delay
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self._random = random.Random(seed)
+
+    def _tokens(self, prompt: str, max_tokens: int = -1) -> List[str]:
+        completion = fake_completion(prompt)
+        tokens = [
+            completion[index : index + CHARS_PER_TOKEN]
+            for index in range(0, len(completion), CHARS_PER_TOKEN)
+        ]
+        # The completion stops at max_tokens, the way the API cuts it
+        return tokens[:max_tokens] if max_tokens >= 0 else tokens
+
+    def _delays(self, tokens: List[str]) -> Iterator[float]:
+        """The delay before each token, raises or stops where a failure is
+        injected."""
+        fails = self._random.random() < self.error_rate
+        truncated = self._random.random() < self.truncate_rate
+        interval = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        for index in range(len(tokens)):
+            if index == len(tokens) // 2:
+                if fails:
+                    raise ServiceUnavailableError("Injected fake LLM failure")
+                if truncated:
+                    self.logger.debug("Truncate the fake completion")
+                    return
+            yield self.first_token_delay if index == 0 else interval
+
+    def stream(self, prompt: str, max_tokens: int = -1) -> Iterator[str]:
+        tokens = self._tokens(prompt, max_tokens)
+        for token, delay in zip(tokens, self._delays(tokens)):
+            time.sleep(delay)
+            yield token
+
+    async def astream(self, prompt: str, max_tokens: int = -1) -> AsyncIterator[str]:
+        tokens = self._tokens(prompt, max_tokens)
+        for token, delay in zip(tokens, self._delays(tokens)):
+            await asyncio.sleep(delay)
+            yield token
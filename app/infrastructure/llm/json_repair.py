@@ -0,0 +1,101 @@
+from typing import List, Optional
+
+from app.infrastructure.llm.json_stream import WHITESPACE
+
+CLOSERS = {"{": "}", "[": "]"}
+# Control characters the LLM writes raw inside its strings
+ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+
+class _Member:
+    """The member of an object or the element of an array being written."""
+
+    def __init__(self, opener: str, start: int) -> None:
+        self.opener = opener
+        self.start = start
+        self.expecting_key = opener == "{"
+        self.done = False
+
+
+def repair_json(text: str) -> str:
+    """Rewrite the near-valid JSON document at the start of `text` as valid
+    JSON.
+
+    Text around the document is dropped, control characters inside strings
+    are escaped and trailing commas removed. A truncated document loses its
+    incomplete members, `{"a": [1, 2], "b": "tex` becomes `{"a": [1, 2]}`,
+    and its open objects and arrays are closed. The result of a text without
+    a document is empty, the caller validates what the repaired document
+    holds.
+    """
+    out: List[str] = []
+    stack: List[_Member] = []
+    in_string = False
+    escaped = False
+    in_scalar = False
+    for char in text:
+        if not stack:
+            if out:
+                # The document is complete
+                break
+            if char in CLOSERS:
+                out.append(char)
+                stack.append(_Member(char, len(out)))
+            continue
+        member = stack[-1]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+                if member.expecting_key:
+                    member.expecting_key = False
+                else:
+                    member.done = True
+            out.append(ESCAPES.get(char, char) if char < " " else char)
+            continue
+        if in_scalar:
+            if char not in WHITESPACE + ",]}":
+                out.append(char)
+                continue
+            in_scalar = False
+            member.done = True
+        if char == '"':
+            in_string = True
+            out.append(char)
+        elif char in CLOSERS:
+            out.append(char)
+            stack.append(_Member(char, len(out)))
+        elif char in "]}":
+            _strip_trailing_comma(out)
+            out.append(CLOSERS[stack.pop().opener])
+            if stack:
+                stack[-1].done = True
+        elif char == ":":
+            out.append(char)
+        elif char == ",":
+            _strip_trailing_comma(out)
+            out.append(char)
+            stack[-1] = _Member(member.opener, len(out))
+        elif char in WHITESPACE:
+            out.append(char)
+        else:
+            in_scalar = True
+            out.append(char)
+    # Close a truncated document, a scalar cut at the end may be incomplete
+    unfinished: Optional[_Member] = stack[-1] if stack else None
+    if unfinished is not None and (in_string or in_scalar or not unfinished.done):
+        del out[unfinished.start :]
+    while stack:
+        _strip_trailing_comma(out)
+        out.append(CLOSERS[stack.pop().opener])
+    return "".join(out)
+
+
+def _strip_trailing_comma(out: List[str]) -> None:
+    while out and out[-1] in WHITESPACE:
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
@@ -0,0 +1,135 @@
+import json
+from functools import partial
+from typing import Any, Callable, Iterable, List, Optional, Tuple, Union
+
+JSONPath = Tuple[Union[str, int], ...]
+
+WHITESPACE = " \t\r\n"
+# The LLM writes raw newlines inside its strings
+lenient_loads = partial(json.loads, strict=False)
+
+
+class _Container:
+    def __init__(self, start: int, path: JSONPath, is_object: bool) -> None:
+        self.start = start
+        self.path = path
+        self.is_object = is_object
+        self.expecting_key = is_object
+        self.key: Optional[str] = None
+        self.index = 0
+
+    def child_path(self) -> JSONPath:
+        if self.is_object:
+            return self.path + (self.key if self.key is not None else "",)
+        return self.path + (self.index,)
+
+
+class IncrementalJSONParser:
+    """Scan a JSON document while it is streamed and return each value whose
+    path has one of `depths` elements as soon as the value is complete.
+
+    The top-level value has the path `()`, `{"a": [{"b": 1}]}` completes
+    `("a", 0, "b")`, then `("a", 0)`, then `("a",)` and `()`. Text before the
+    document is skipped and values which do not parse are dropped, the caller
+    decides what to do with a document which never completes.
+    """
+
+    def __init__(
+        self,
+        depths: Iterable[int],
+        loads: Callable[[str], Any] = lenient_loads,
+    ) -> None:
+        self.depths = frozenset(depths)
+        self.loads = loads
+        self.text = ""
+        self.complete = False
+        # The position in `text` after the document, once it is complete
+        self.end: Optional[int] = None
+        self._pos = 0
+        self._stack: List[_Container] = []
+        self._started = False
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._scalar_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Tuple[JSONPath, Any]]:
+        self.text += chunk
+        completed: List[Tuple[JSONPath, Any]] = []
+        while self._pos < len(self.text) and not self.complete:
+            self._scan(self.text[self._pos], completed)
+            self._pos += 1
+        return completed
+
+    def _scan(self, char: str, completed: List[Tuple[JSONPath, Any]]) -> None:
+        if not self._started:
+            if char in "{[":
+                self._started = True
+                self._stack.append(_Container(self._pos, (), char == "{"))
+            return
+        if self._in_string:
+            if self._escaped:
+                self._escaped = False
+            elif char == "\\":
+                self._escaped = True
+            elif char == '"':
+                self._in_string = False
+                self._end_string(completed)
+            return
+        if self._scalar_start is not None:
+            if char not in WHITESPACE + ",]}":
+                return
+            self._end_value(self._scalar_start, self._pos, None, completed)
+            self._scalar_start = None
+        parent = self._stack[-1]
+        if char == '"':
+            self._in_string = True
+            self._string_start = self._pos
+        elif char in "{[":
+            self._stack.append(_Container(self._pos, parent.child_path(), char == "{"))
+        elif char in "}]":
+            container = self._stack.pop()
+            self._end_value(container.start, self._pos + 1, container, completed)
+            if not self._stack:
+                self.complete = True
+                self.end = self._pos + 1
+        elif char == ":":
+            parent.expecting_key = False
+        elif char == ",":
+            if parent.is_object:
+                parent.expecting_key = True
+                parent.key = None
+            else:
+                parent.index += 1
+        elif char not in WHITESPACE:
+            self._scalar_start = self._pos
+
+    def _end_string(self, completed: List[Tuple[JSONPath, Any]]) -> None:
+        parent = self._stack[-1]
+        if parent.is_object and parent.expecting_key:
+            try:
+                parent.key = lenient_loads(
+                    self.text[self._string_start : self._pos + 1]
+                )
+            except json.JSONDecodeError:
+                parent.key = None
+            return
+        self._end_value(self._string_start, self._pos + 1, None, completed)
+
+    def _end_value(
+        self,
+        start: int,
+        end: int,
+        container: Optional[_Container],
+        completed: List[Tuple[JSONPath, Any]],
+    ) -> None:
+        if container is not None:
+            path = container.path
+        else:
+            path = self._stack[-1].child_path()
+        if len(path) not in self.depths:
+            return
+        try:
+            completed.append((path, self.loads(self.text[start:end])))
+        except json.JSONDecodeError:
+            return
@@ -0,0 +1,91 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.infrastructure.metrics.metrics import MetricsRegistry
+
+LessonKey = Tuple[str, str, str, str, int, int]
+
+
+def lesson_cache_key(
+    category: str,
+    learning_language: str,
+    translated_language: str,
+    level: str,
+    num_questions: int,
+    num_answers: int,
+) -> LessonKey:
+    """Normalize a lesson request so equivalent requests share an entry.
+
+    The languages keep their case: the generated JSON is keyed by them as they
+    were written in the request.
+    """
+    return (
+        " ".join(category.split()).casefold(),
+        learning_language.strip(),
+        translated_language.strip(),
+        level.strip().upper(),
+        num_questions,
+        num_answers,
+    )
+
+
+class LessonCache:
+    """In-process LRU cache of generated lesson responses.
+
+    Entries expire `ttl` seconds after they were written and the least
+    recently used entry is evicted past `max_size` entries. A `max_size` of 0
+    disables the cache.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 256,
+        ttl: float = 3600,
+        metrics: Optional[MetricsRegistry] = None,
+    ) -> None:
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self._lock = threading.Lock()
+        self._lessons: OrderedDict[LessonKey, Tuple[float, str]] = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, key: LessonKey) -> Optional[str]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            cached = self._lessons.get(key)
+            if cached is not None and cached[0] < time.monotonic():
+                del self._lessons[key]
+                cached = None
+            if cached is not None:
+                self._lessons.move_to_end(key)
+            size = len(self._lessons)
+        self.metrics.set_gauge("lesson_cache_size", size)
+        if cached is None:
+            self.metrics.increment("lesson_cache_misses_total")
+            return None
+        self.metrics.increment("lesson_cache_hits_total")
+        return cached[1]
+
+    def set(self, key: LessonKey, lesson: str) -> None:
+        if not self.enabled:
+            return
+        evicted = 0
+        with self._lock:
+            self._lessons[key] = (time.monotonic() + self.ttl, lesson)
+            self._lessons.move_to_end(key)
+            while len(self._lessons) > self.max_size:
+                self._lessons.popitem(last=False)
+                evicted += 1
+            size = len(self._lessons)
+        self.metrics.set_gauge("lesson_cache_size", size)
+        if evicted:
+            self.metrics.increment("lesson_cache_evictions_total", evicted)
@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import logging
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    TypeVar,
+)
+
+from app.infrastructure.metrics.metrics import MetricsRegistry
+
+T = TypeVar("T")
+
+
+def flight_key(*parts: str) -> str:
+    """A short key for a (possibly long) prompt."""
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+class _StreamFlight:
+    def __init__(self) -> None:
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional["asyncio.Task[None]"] = None
+        self._changed = asyncio.Event()
+
+    def notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self) -> None:
+        await self._changed.wait()
+
+
+class StreamCoalescer:
+    """Single-flight upstream calls for identical concurrent requests.
+
+    The first caller of `stream` for a key starts the upstream stream, the
+    callers arriving while it runs attach to it: each one replays the chunks
+    streamed so far, then follows the new ones. Once the stream ended the key
+    is released and the next caller starts a new one. The upstream stream is
+    cancelled when all of its subscribers went away.
+    """
+
+    def __init__(self, metrics: Optional[MetricsRegistry] = None) -> None:
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self._streams: Dict[str, _StreamFlight] = {}
+        self._calls: Dict[str, "asyncio.Future[Any]"] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._streams
+
+    async def stream(
+        self, key: str, upstream: Callable[[], AsyncIterator[str]]
+    ) -> AsyncIterator[str]:
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = _StreamFlight()
+            self._streams[key] = flight
+            flight.task = asyncio.create_task(self._produce(key, flight, upstream))
+            self.metrics.increment("llm_upstream_streams_total")
+        else:
+            self.logger.debug(f"Attach to the in-flight stream {key}")
+            self.metrics.increment("llm_coalesced_streams_total")
+        self.metrics.set_gauge("llm_inflight_streams", len(self._streams))
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(flight.chunks):
+                    yield flight.chunks[index]
+                    index += 1
+                if flight.done:
+                    break
+                await flight.wait()
+        finally:
+            flight.subscribers -= 1
+            if not flight.subscribers and not flight.done and flight.task:
+                flight.task.cancel()
+        if flight.error is not None:
+            raise flight.error
+
+    async def _produce(
+        self,
+        key: str,
+        flight: _StreamFlight,
+        upstream: Callable[[], AsyncIterator[str]],
+    ) -> None:
+        try:
+            async for chunk in upstream():
+                flight.chunks.append(chunk)
+                flight.notify()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+            self.metrics.set_gauge("llm_inflight_streams", len(self._streams))
+            flight.notify()
+
+    async def run(self, key: str, upstream: Callable[[], Awaitable[T]]) -> T:
+        """Single-flight a call which returns one value."""
+        call = self._calls.get(key)
+        if call is not None:
+            self.metrics.increment("llm_coalesced_calls_total")
+            return await asyncio.shield(call)
+        call = asyncio.get_running_loop().create_future()
+        self._calls[key] = call
+        self.metrics.increment("llm_upstream_calls_total")
+        try:
+            result = await upstream()
+        except asyncio.CancelledError:
+            call.cancel()
+            raise
+        except Exception as e:
+            call.set_exception(e)
+            # Retrieved here, so a failure nobody else waited for is not logged
+            call.exception()
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
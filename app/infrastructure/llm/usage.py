@@ -0,0 +1,271 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import tiktoken
+
+from app.infrastructure.metrics.metrics import MetricsRegistry
+
+DEFAULT_MODEL = "text-davinci-003"
+# Rough size of a token when the tiktoken encoding can not be loaded
+CHARS_PER_TOKEN = 4
+
+UsageSink = Callable[[List["LLMCall"]], None]
+
+
+def llm_model_name(model: Any) -> str:
+    name = getattr(model, "model_name", None)
+    return name if isinstance(name, str) and name else DEFAULT_MODEL
+
+
+def lesson_shape(num_questions: int, num_answers: int) -> str:
+    return f"{num_questions}q{num_answers}a"
+
+
+@dataclass
+class LLMCall:
+    endpoint: str
+    model: str
+    user_id: Optional[str]
+    level: Optional[str]
+    shape: Optional[str]
+    prompt_tokens: int
+    completion_tokens: int
+    time_to_first_token: float
+    latency: float
+    cost: float
+    # Attached to the stream of an identical concurrent request
+    coalesced: bool = False
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+    @property
+    def tokens_per_second(self) -> float:
+        generation_time = self.latency - self.time_to_first_token
+        if generation_time <= 0:
+            return 0.0
+        return self.completion_tokens / generation_time
+
+
+class TokenCounter:
+    """Count tokens with the tiktoken encoding of a model.
+
+    tiktoken may download an encoding the first time it is loaded, so
+    `count` never loads one: it estimates the tokens from the text length
+    while the encoding loads on a background thread, and for good when the
+    encoding can not be loaded.
+    """
+
+    def __init__(self) -> None:
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self._lock = threading.Lock()
+        self._encodings: Dict[str, Optional[Any]] = {}
+        self._loading: Set[str] = set()
+
+    def count(self, text: str, model: str) -> int:
+        encoding = self._encodings.get(model)
+        if encoding is None:
+            self.load_in_background(model)
+            return len(text) // CHARS_PER_TOKEN
+        return len(encoding.encode(text))
+
+    def load_in_background(self, model: str) -> None:
+        with self._lock:
+            if model in self._encodings or model in self._loading:
+                return
+            self._loading.add(model)
+        threading.Thread(
+            target=self.load, args=(model,), name="tiktoken-load", daemon=True
+        ).start()
+
+    def load(self, model: str) -> Optional[Any]:
+        """Load the encoding of `model` on the calling thread."""
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except Exception as e:
+            self.logger.warning(f"Estimate the tokens of {model}: {e}")
+            encoding = None
+        with self._lock:
+            self._encodings[model] = encoding
+            self._loading.discard(model)
+        return encoding
+
+
+# Shared so the encodings are loaded once per process
+token_counter = TokenCounter()
+
+
+class CallTracker:
+    """Time one streamed completion, `finish` records it."""
+
+    def __init__(
+        self,
+        recorder: "UsageRecorder",
+        endpoint: str,
+        model: str,
+        prompt: str,
+        user_id: Optional[str],
+        level: Optional[str],
+        shape: Optional[str],
+        coalesced: bool,
+    ) -> None:
+        self.recorder = recorder
+        self.endpoint = endpoint
+        self.model = model
+        self.prompt = prompt
+        self.user_id = user_id
+        self.level = level
+        self.shape = shape
+        self.coalesced = coalesced
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.completion: List[str] = []
+
+    def on_chunk(self, text: str) -> None:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.completion.append(text)
+
+    def finish(self) -> LLMCall:
+        finished = time.perf_counter()
+        first_token_at = self.first_token_at or finished
+        counter = self.recorder.token_counter
+        call = LLMCall(
+            endpoint=self.endpoint,
+            model=self.model,
+            user_id=self.user_id,
+            level=self.level,
+            shape=self.shape,
+            prompt_tokens=counter.count(self.prompt, self.model),
+            completion_tokens=counter.count("".join(self.completion), self.model),
+            time_to_first_token=first_token_at - self.started,
+            latency=finished - self.started,
+            cost=0.0,
+            coalesced=self.coalesced,
+        )
+        # A coalesced request did not pay for its completion
+        if not self.coalesced:
+            call.cost = self.recorder.cost(call)
+        self.recorder.record(call)
+        return call
+
+
+class UsageRecorder:
+    """Account the tokens, cost and latency of every LLM call.
+
+    Each call is published as metrics right away, labelled by endpoint, level
+    and lesson shape, and buffered for the per-user usage table: a background
+    thread hands the buffered calls to `sink` every `flush_interval` seconds.
+    Prices are in USD per 1K tokens.
+    """
+
+    def __init__(
+        self,
+        sink: Optional[UsageSink] = None,
+        prompt_token_price: float = 0.02,
+        completion_token_price: float = 0.02,
+        flush_interval: float = 10,
+        max_buffer: int = 10000,
+        metrics: Optional[MetricsRegistry] = None,
+    ) -> None:
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self.sink = sink
+        self.prompt_token_price = prompt_token_price
+        self.completion_token_price = completion_token_price
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.token_counter = token_counter
+        self._lock = threading.Lock()
+        self._buffer: List[LLMCall] = []
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def track(
+        self,
+        endpoint: str,
+        model: str,
+        prompt: str,
+        user_id: Optional[str] = None,
+        level: Optional[str] = None,
+        shape: Optional[str] = None,
+        coalesced: bool = False,
+    ) -> CallTracker:
+        return CallTracker(
+            self, endpoint, model, prompt, user_id, level, shape, coalesced
+        )
+
+    def cost(self, call: LLMCall) -> float:
+        return (
+            call.prompt_tokens * self.prompt_token_price
+            + call.completion_tokens * self.completion_token_price
+        ) / 1000
+
+    def record(self, call: LLMCall) -> None:
+        labels = {
+            "endpoint": call.endpoint,
+            "level": call.level or "",
+            "shape": call.shape or "",
+        }
+        self.metrics.increment("llm_calls_total", labels=labels)
+        self.metrics.increment(
+            "llm_prompt_tokens_total", call.prompt_tokens, labels=labels
+        )
+        self.metrics.increment(
+            "llm_completion_tokens_total", call.completion_tokens, labels=labels
+        )
+        self.metrics.increment("llm_cost_usd_total", call.cost, labels=labels)
+        self.metrics.observe("llm_prompt_tokens", call.prompt_tokens, labels=labels)
+        self.metrics.observe(
+            "llm_completion_tokens", call.completion_tokens, labels=labels
+        )
+        self.metrics.observe(
+            "llm_time_to_first_token_seconds", call.time_to_first_token, labels=labels
+        )
+        self.metrics.observe(
+            "llm_tokens_per_second", call.tokens_per_second, labels=labels
+        )
+        self.metrics.observe("llm_latency_seconds", call.latency, labels=labels)
+        self.logger.debug(
+            f"{call.endpoint} call: {call.prompt_tokens}+{call.completion_tokens} "
+            f"tokens in {call.latency:.2f}s, first token after "
+            f"{call.time_to_first_token:.2f}s"
+        )
+        if self.sink is None:
+            return
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self.metrics.increment("llm_usage_dropped_total")
+                return
+            self._buffer.append(call)
+
+    def start(self) -> None:
+        # Ready before the first call, which would count with an estimate
+        self.token_counter.load_in_background(DEFAULT_MODEL)
+        if self.sink is None or self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="llm-usage-flush", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            calls, self._buffer = self._buffer, []
+        if not calls or self.sink is None:
+            return
+        try:
+            self.sink(calls)
+        except Exception:
+            self.metrics.increment("llm_usage_dropped_total", len(calls))
+            self.logger.exception(f"Can not store the usage of {len(calls)} calls")
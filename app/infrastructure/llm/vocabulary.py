@@ -1,10 +1,72 @@
+import asyncio
+import collections.abc
+import json
 import logging
 import textwrap
-from datetime import datetime
-from typing import Generator
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
 
 from langchain import OpenAI, PromptTemplate
 
+from app.infrastructure.llm.compact_lesson import CompactLessonDecoder
+from app.infrastructure.llm.json_stream import IncrementalJSONParser
+from app.infrastructure.llm.single_flight import StreamCoalescer, flight_key
+from app.infrastructure.llm.usage import UsageRecorder, lesson_shape, llm_model_name
+
+VOCABULARY_ENDPOINT = "vocabulary"
+TRANSLATION_ENDPOINT = "vocabulary_translation"
+# One completion writes the lesson in both languages
+BILINGUAL_GENERATION = "bilingual"
+# The lesson is written in the learning language, its parts are translated
+# by concurrent completions while it streams
+SPLIT_GENERATION = "split"
+GENERATION_MODES = (BILINGUAL_GENERATION, SPLIT_GENERATION)
+# The format the bilingual completion is written in: named keys, or
+# positional arrays with the answer given as an option index. The compact
+# output is decoded to the verbose document before it is streamed.
+VERBOSE_LESSON_FORMAT = "verbose"
+COMPACT_LESSON_FORMAT = "compact"
+LESSON_FORMATS = (VERBOSE_LESSON_FORMAT, COMPACT_LESSON_FORMAT)
+
+# Completion tokens budgeted for the parts of a lesson in one language, the
+# lesson text is of no more than 300 words
+LESSON_TEXT_TOKENS = 500
+QUESTION_TOKENS = 50
+ANSWER_TOKENS = 15
+
+TranslationTask = asyncio.Task[Optional[Dict[str, Any]]]
+
+
+def lesson_token_budget(num_questions: int, num_answers: int, languages: int) -> int:
+    """The most completion tokens a lesson of this shape should take."""
+    return languages * (
+        LESSON_TEXT_TOKENS
+        + num_questions * (QUESTION_TOKENS + num_answers * ANSWER_TOKENS)
+    )
+
+
+def document_part(document: IncrementalJSONParser, text: str) -> str:
+    """Feed `text` to `document`, the part of it up to the end of the JSON
+    document."""
+    document.feed(text)
+    if document.end is None:
+        return text
+    return text[: len(text) - (len(document.text) - document.end)]
+
+
+def _json_only_instructions(enclosing: str) -> str:
+    return (
+        "Do not include any explanations, the lesson must not include a newline and special character and do not "
+        f"return anything in your response outside of {enclosing}. "
+    )
+
 
 class ChatGPTVocabularyGenerator:
     _vocabulary_format = """{
@@ -18,53 +80,413 @@ class ChatGPTVocabularyGenerator:
         ]
         }"""
 
-    _vocabulary_template = (
+    # Every lesson prompt starts with these instructions, each mode follows
+    # them with the output format of its completion only
+    _lesson_instructions = (
         "Create a short language lesson in {{ learning_language }} of no more than 300 words. You will teach the "
         "students {{ num_questions }} {{ level }} vocabulary words in the context of {{ category }}. Then, create "
         "{{ num_questions }} multiple choice questions with {{ num_answers }} possible answers for each question. "
         "Each question should elicit the meaning of the vocabulary words you just taught them. You can ask the students"
         "questions about the meaning of the word as well as questions about how the word is used in context. "
         "Make sure the the answer exists in {{ num_answers }} options. "
-        "Write the translations of the questions, answers, and instructions in {{ primary_language }} "
-        "Do not include any explanations, the lesson must not include a newline and special character and do not "
-        "return anything in your response outside of curly braces. Only provide a RFC8259 compliant JSON response "
-        "following this format without deviation: "
+    )
+    _bilingual_instructions = "Write the translations of the questions, answers, and instructions in {{ primary_language }} "
+
+    _vocabulary_template = (
+        _lesson_instructions
+        + _bilingual_instructions
+        + _json_only_instructions("curly braces")
+        + "Only provide a RFC8259 compliant JSON response following this format without deviation: "
         '{"{{ learning_language }}": {{ format_output }}, "{{ primary_language }}": {{ format_output }}}'
     )
 
-    def __init__(self, model: OpenAI):
+    _compact_vocabulary_format = """["<lesson>", "<translated lesson>", [
+        ["What is the term used for a person who runs in a race?", "<translated question>",
+        ["Swimmer", "Runner", "Cyclist",...], ["<translated option>",...], 1]
+        ]]"""
+
+    _compact_vocabulary_template = (
+        _lesson_instructions
+        + _bilingual_instructions
+        + _json_only_instructions("square brackets")
+        + "Only provide a RFC8259 compliant JSON array of the lesson, its translation and the questions, each "
+        "question being the question, its translation, the options, their translations and the index of the "
+        "answer in the options, following this format without deviation: {{ format_output }}"
+    )
+
+    # Split mode writes the learning language only, the parts are translated
+    # by separate completions
+    _learning_lesson_template = (
+        _lesson_instructions
+        + _json_only_instructions("curly braces")
+        + "Only provide a RFC8259 compliant JSON response following this format without deviation: "
+        "{{ format_output }}"
+    )
+
+    _translation_template = (
+        "Translate the values of this JSON object from {{ learning_language }} to {{ primary_language }}. "
+        "Keep the keys and the order of the lists, do not include any explanations and do not return anything "
+        "in your response outside of curly braces. Only provide a RFC8259 compliant JSON object: {{ content }}"
+    )
+
+    def __init__(
+        self,
+        model: OpenAI,
+        coalescer: Optional[StreamCoalescer] = None,
+        usage: Optional[UsageRecorder] = None,
+        generation_mode: str = BILINGUAL_GENERATION,
+        lesson_format: str = VERBOSE_LESSON_FORMAT,
+        max_completion_tokens: int = 3000,
+    ):
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
         self.model = model
+        self.coalescer = coalescer
+        self.usage = usage if usage is not None else UsageRecorder()
+        if generation_mode not in GENERATION_MODES:
+            raise ValueError(f"Unknown lesson generation mode {generation_mode}")
+        self.generation_mode = generation_mode
+        if lesson_format not in LESSON_FORMATS:
+            raise ValueError(f"Unknown lesson format {lesson_format}")
+        self.lesson_format = lesson_format
+        self.max_completion_tokens = max_completion_tokens
+
+    def _max_tokens(
+        self, num_questions: int, num_answers: int, languages: int = 2
+    ) -> Dict[str, int]:
+        """The max_tokens argument of a lesson completion."""
+        return {
+            "max_tokens": min(
+                lesson_token_budget(num_questions, num_answers, languages),
+                self.max_completion_tokens,
+            )
+        }
+
+    def _astream(
+        self, prompt: str, model_kwargs: Dict[str, Any]
+    ) -> Tuple[AsyncIterator[str], bool]:
+        """The completion stream and whether it is shared with an identical
+        request already in flight."""
+        if self.coalescer is None:
+            return self.model.astream(prompt, **model_kwargs), False
+        # Identical concurrent prompts share one completion
+        key = flight_key("vocabulary", prompt)
+        coalesced = self.coalescer.in_flight(key)
+        return (
+            self.coalescer.stream(
+                key, lambda: self.model.astream(prompt, **model_kwargs)
+            ),
+            coalesced,
+        )
 
-    def generate_vocabulary_questions(
+    async def _tracked_stream(
+        self,
+        prompt: str,
+        endpoint: str,
+        user_id: Optional[str] = None,
+        level: Optional[str] = None,
+        shape: Optional[str] = None,
+        model_kwargs: Optional[Dict[str, Any]] = None,
+    ) -> AsyncGenerator[str, None]:
+        """Stream the completion up to the end of its JSON document, the
+        upstream stream is closed there."""
+        stream, coalesced = self._astream(prompt, model_kwargs or {})
+        tracker = self.usage.track(
+            endpoint,
+            llm_model_name(self.model),
+            prompt,
+            user_id=user_id,
+            level=level,
+            shape=shape,
+            coalesced=coalesced,
+        )
+        document = IncrementalJSONParser(depths=())
+        try:
+            # Streams on the event loop, no threadpool worker is held per lesson
+            async for text in stream:
+                tracker.on_chunk(text)
+                text = document_part(document, text)
+                if text:
+                    yield text
+                if document.complete:
+                    break
+        finally:
+            tracker.finish()
+            if isinstance(stream, collections.abc.AsyncGenerator):
+                await stream.aclose()
+        self.logger.debug(f"Response: {''.join(tracker.completion)}")
+
+    def _build_prompt(
         self,
         category: str,
         translated_language: str,
         learning_language: str,
-        num_questions: int = 4,
-        num_answers: int = 5,
-        level: str = "EASY",
-    ) -> Generator:
-        start = datetime.now()
+        num_questions: int,
+        num_answers: int,
+        level: str,
+        template: Optional[str] = None,
+        format_output: Optional[str] = None,
+    ) -> str:
         prompt_template: PromptTemplate = PromptTemplate.from_template(
-            self._vocabulary_template, template_format="jinja2"
+            template or self._vocabulary_template, template_format="jinja2"
         )
-        response = ""
         prompt = prompt_template.format(
             category=category,
             primary_language=translated_language,
             learning_language=learning_language,
             num_questions=num_questions,
             num_answers=num_answers,
-            format_output=textwrap.dedent(self._vocabulary_format),
+            format_output=textwrap.dedent(format_output or self._vocabulary_format),
             level=level,
         )
+        return textwrap.dedent(prompt)
 
-        prompt = textwrap.dedent(prompt)
-        self.logger.debug(f"Request: {prompt}")
-        for text in self.model.stream(prompt):
-            response += text
+    def _build_lesson_prompt(
+        self,
+        category: str,
+        translated_language: str,
+        learning_language: str,
+        num_questions: int,
+        num_answers: int,
+        level: str,
+    ) -> str:
+        """The prompt of the bilingual completion in the lesson format."""
+        if self.lesson_format == COMPACT_LESSON_FORMAT:
+            return self._build_prompt(
+                category,
+                translated_language,
+                learning_language,
+                num_questions,
+                num_answers,
+                level,
+                template=self._compact_vocabulary_template,
+                format_output=self._compact_vocabulary_format,
+            )
+        return self._build_prompt(
+            category,
+            translated_language,
+            learning_language,
+            num_questions,
+            num_answers,
+            level,
+        )
+
+    def _decoder(
+        self, learning_language: str, translated_language: str
+    ) -> Optional[CompactLessonDecoder]:
+        if self.lesson_format != COMPACT_LESSON_FORMAT:
+            return None
+        return CompactLessonDecoder(learning_language, translated_language)
+
+    @staticmethod
+    async def _decode(
+        stream: AsyncIterator[str], decoder: CompactLessonDecoder
+    ) -> AsyncGenerator[str, None]:
+        async for text in stream:
+            decoded = decoder.feed(text)
+            if decoded:
+                yield decoded
+        yield decoder.finish()
+
+    async def generate_vocabulary_questions_async(
+        self,
+        category: str,
+        translated_language: str,
+        learning_language: str,
+        num_questions: int = 4,
+        num_answers: int = 5,
+        level: str = "EASY",
+        user_id: Optional[str] = None,
+    ) -> AsyncGenerator[str, None]:
+        if self.generation_mode == SPLIT_GENERATION:
+            stream = self._generate_split(
+                category,
+                translated_language,
+                learning_language,
+                num_questions,
+                num_answers,
+                level,
+                user_id,
+            )
+        else:
+            prompt = self._build_lesson_prompt(
+                category,
+                translated_language,
+                learning_language,
+                num_questions,
+                num_answers,
+                level,
+            )
+            self.logger.debug(f"Request: {prompt}")
+            stream = self._tracked_stream(
+                prompt,
+                VOCABULARY_ENDPOINT,
+                user_id=user_id,
+                level=level,
+                shape=lesson_shape(num_questions, num_answers),
+                model_kwargs=self._max_tokens(num_questions, num_answers),
+            )
+            decoder = self._decoder(learning_language, translated_language)
+            if decoder is not None:
+                stream = self._decode(stream, decoder)
+        async for text in stream:
             yield text
 
-        self.logger.debug(f"Execution time: {datetime.now() - start}")
-        self.logger.debug(f"Response: {response}")
+    async def _generate_split(
+        self,
+        category: str,
+        translated_language: str,
+        learning_language: str,
+        num_questions: int,
+        num_answers: int,
+        level: str,
+        user_id: Optional[str],
+    ) -> AsyncGenerator[str, None]:
+        """Stream the lesson in the learning language and translate its text
+        and each of its questions as soon as they are complete.
+
+        The translations run while the lesson is still streaming, so the
+        lesson takes about the time of a single-language completion. The
+        streamed text is the same bilingual document as the one completion
+        mode writes, the translated half follows the learning language one.
+        """
+        prompt = self._build_prompt(
+            category,
+            translated_language,
+            learning_language,
+            num_questions,
+            num_answers,
+            level,
+            template=self._learning_lesson_template,
+        )
+        self.logger.debug(f"Request: {prompt}")
+        parser = IncrementalJSONParser(depths=(1, 2))
+        learning_lesson = ""
+        lesson: Optional[TranslationTask] = None
+        questions: List[Tuple[Dict[str, Any], TranslationTask]] = []
+
+        def translate(content: Dict[str, Any]) -> TranslationTask:
+            return asyncio.create_task(
+                self._translate(
+                    content, learning_language, translated_language, user_id
+                )
+            )
+
+        try:
+            yield f'{{"{learning_language}": '
+            async for text in self._tracked_stream(
+                prompt,
+                VOCABULARY_ENDPOINT,
+                user_id=user_id,
+                level=level,
+                shape=lesson_shape(num_questions, num_answers),
+                model_kwargs=self._max_tokens(num_questions, num_answers, 1),
+            ):
+                yield text
+                for path, value in parser.feed(text):
+                    if path == ("lesson",) and isinstance(value, str):
+                        learning_lesson = value
+                        lesson = translate({"lesson": value})
+                    elif (
+                        len(path) == 2
+                        and path[0] == "questions"
+                        and isinstance(value, dict)
+                    ):
+                        # The answer is one of the options, it is not translated
+                        content = {
+                            key: value[key]
+                            for key in ("question", "options")
+                            if key in value
+                        }
+                        questions.append((value, translate(content)))
+            if not parser.complete or lesson is None:
+                self.logger.warning("The lesson did not complete, it is not translated")
+                return
+            translated = await self._translated_lesson(
+                learning_lesson, lesson, questions
+            )
+            translated_text = json.dumps(translated, ensure_ascii=False)
+            yield f', "{translated_language}": {translated_text}}}'
+        finally:
+            for _, task in questions:
+                task.cancel()
+            if lesson is not None:
+                lesson.cancel()
+
+    async def _translated_lesson(
+        self,
+        learning_lesson: str,
+        lesson: TranslationTask,
+        questions: List[Tuple[Dict[str, Any], TranslationTask]],
+    ) -> Dict[str, Any]:
+        translated_lesson = await lesson
+        if translated_lesson is None or not isinstance(
+            translated_lesson.get("lesson"), str
+        ):
+            self.logger.warning("Keep the untranslated lesson text")
+            translated_lesson = {"lesson": learning_lesson}
+        translated_questions: List[Dict[str, Any]] = []
+        for question, task in questions:
+            translated = await task
+            if translated is None or not _is_translated_question(question, translated):
+                # The questions are paired by position, the ones after a
+                # failed translation are dropped
+                self.logger.warning(
+                    f"Drop the questions from {len(translated_questions)} on, "
+                    "their translation failed"
+                )
+                break
+            index = question["options"].index(question["answer"])
+            translated["answer"] = translated["options"][index]
+            translated_questions.append(translated)
+        return {
+            "lesson": translated_lesson["lesson"],
+            "questions": translated_questions,
+        }
+
+    async def _translate(
+        self,
+        content: Dict[str, Any],
+        learning_language: str,
+        translated_language: str,
+        user_id: Optional[str],
+    ) -> Optional[Dict[str, Any]]:
+        prompt_template: PromptTemplate = PromptTemplate.from_template(
+            self._translation_template, template_format="jinja2"
+        )
+        prompt = prompt_template.format(
+            learning_language=learning_language,
+            primary_language=translated_language,
+            content=json.dumps(content, ensure_ascii=False),
+        )
+        try:
+            text = "".join(
+                [
+                    chunk
+                    async for chunk in self._tracked_stream(
+                        prompt, TRANSLATION_ENDPOINT, user_id=user_id
+                    )
+                ]
+            )
+        except Exception:
+            self.logger.exception("Translation failed")
+            return None
+        parser = IncrementalJSONParser(depths=(0,))
+        translated = [value for _, value in parser.feed(text)]
+        if not translated or not isinstance(translated[0], dict):
+            self.logger.warning(f"Can not parse the translation {text}")
+            return None
+        return translated[0]
+
+
+def _is_translated_question(
+    question: Dict[str, Any], translated: Dict[str, Any]
+) -> bool:
+    options = question.get("options")
+    translated_options = translated.get("options")
+    return (
+        isinstance(translated.get("question"), str)
+        and isinstance(options, list)
+        and isinstance(translated_options, list)
+        and len(options) == len(translated_options)
+        and question.get("answer") in options
+    )
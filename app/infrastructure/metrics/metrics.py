@@ -0,0 +1,93 @@
+import math
+import threading
+from collections import defaultdict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+Labels = Optional[Dict[str, Any]]
+Collector = Callable[["MetricsRegistry"], None]
+
+
+def metric_key(name: str, labels: Labels = None) -> str:
+    if not labels:
+        return name
+    rendered = ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+    return f"{name}{{{rendered}}}"
+
+
+class Histogram:
+    def __init__(self, max_samples: int) -> None:
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._samples: Deque[float] = deque(maxlen=max_samples)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self._samples.append(value)
+
+    def percentile(self, percent: float) -> float:
+        if not self._samples:
+            return 0.0
+        samples = sorted(self._samples)
+        index = max(math.ceil(percent / 100 * len(samples)) - 1, 0)
+        return samples[index]
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+        }
+
+
+class MetricsRegistry:
+    """In-process counters, gauges and histograms.
+
+    Collectors are called on every snapshot so they can publish live values
+    (e.g. the current state of a connection pool) as gauges.
+    """
+
+    def __init__(self, max_samples: int = 1024) -> None:
+        self._lock = threading.Lock()
+        self._max_samples = max_samples
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._histograms: Dict[str, Histogram] = {}
+        self._collectors: List[Collector] = []
+
+    def increment(self, name: str, value: float = 1, labels: Labels = None) -> None:
+        with self._lock:
+            self._counters[metric_key(name, labels)] += value
+
+    def set_gauge(self, name: str, value: float, labels: Labels = None) -> None:
+        with self._lock:
+            self._gauges[metric_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, labels: Labels = None) -> None:
+        key = metric_key(name, labels)
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(self._max_samples)
+            self._histograms[key].observe(value)
+
+    def register_collector(self, collector: Collector) -> None:
+        with self._lock:
+            self._collectors.append(collector)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        for collector in list(self._collectors):
+            collector(self)
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": {
+                    key: histogram.to_dict()
+                    for key, histogram in self._histograms.items()
+                },
+            }
@@ -1,12 +1,23 @@
+import hashlib
 from io import BytesIO
+from typing import Optional
 
 from replicate import Client
+from starlette.concurrency import run_in_threadpool
+
+from app.infrastructure.llm.single_flight import StreamCoalescer, flight_key
 
 
 class CaptionGenerator:
-    def __init__(self, caption_client: Client, model_id: str) -> None:
+    def __init__(
+        self,
+        caption_client: Client,
+        model_id: str,
+        coalescer: Optional[StreamCoalescer] = None,
+    ) -> None:
         self.caption_client = caption_client
         self.model_id = model_id
+        self.coalescer = coalescer
 
     def generate_from_image(self, image_file: BytesIO) -> str:
         caption = ""
@@ -14,3 +25,14 @@ class CaptionGenerator:
         for word in output:
             caption += word
         return caption
+
+    async def generate_from_image_async(self, image_file: BytesIO) -> str:
+        # The replicate client has no async API
+        if self.coalescer is None:
+            return await run_in_threadpool(self.generate_from_image, image_file)
+        # The same image captioned concurrently is sent to replicate once
+        image_hash = hashlib.sha256(image_file.getvalue()).hexdigest()
+        return await self.coalescer.run(
+            flight_key("image", self.model_id, image_hash),
+            lambda: run_in_threadpool(self.generate_from_image, image_file),
+        )
@@ -0,0 +1,34 @@
+import logging
+import random
+import time
+from typing import Any, Dict, Iterator, Optional
+
+from replicate.exceptions import ModelError
+
+
+class FakeReplicateClient:
+    """Stands in for the replicate `Client` to caption images offline.
+
+    `run` answers after `latency` seconds with a caption of the image size,
+    and fails with `error_rate` probability.
+    """
+
+    def __init__(
+        self,
+        latency: float = 1,
+        error_rate: float = 0,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+
+    def run(self, model_id: str, input: Dict[str, Any]) -> Iterator[str]:
+        time.sleep(self.latency)
+        if self._random.random() < self.error_rate:
+            raise ModelError("Injected fake replicate failure")
+        image = input["image"]
+        size = len(image.getvalue()) if hasattr(image, "getvalue") else 0
+        self.logger.debug(f"Caption a {size} bytes image with {model_id}")
+        return iter(["a photo ", f"of {size} bytes"])
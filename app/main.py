@@ -1,12 +1,18 @@
 import logging
 import time
+from http import HTTPStatus
 
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 from sentry_sdk import capture_exception
 from starlette.middleware.cors import CORSMiddleware
 
 from app.container.containers import Container
+from app.infrastructure.db.instrumentation import track_queries
+from app.infrastructure.db.routing import read_your_writes
+from app.models.common.pagination import InvalidCursor
 from app.routes.api_v1 import api as api_v1
+from app.services.admission import AdmissionRejected
 
 logger = logging.getLogger()
 API_V1_STR = "/api/v1"
@@ -15,9 +21,18 @@ API_V1_STR = "/api/v1"
 async def catch_exceptions_middleware(request: Request, call_next):  # type: ignore
     try:
         start_time = time.time()
-        response = await call_next(request)
+        with track_queries() as query_stats, read_your_writes(
+            request.headers.get("authorization")
+        ):
+            response = await call_next(request)
         process_time = time.time() - start_time
         response.headers["X-Process-Time"] = str(process_time)
+        # Queries run by a streaming body after the headers are sent are not counted
+        response.headers["X-DB-Query-Count"] = str(query_stats.count)
+        response.headers["X-DB-Time"] = str(query_stats.total_time)
+        response.headers["X-DB-Slowest-Query-Time"] = str(query_stats.max_time)
+        for duration, statement in query_stats.slowest_statements:
+            logger.debug(f"{request.url.path} query took {duration}s: {statement}")
         return response
     except Exception as e:
         logger.error(e)
@@ -25,6 +40,22 @@ async def catch_exceptions_middleware(request: Request, call_next):  # type: ign
         return Response("Internal server error", status_code=500)
 
 
+async def invalid_cursor_handler(request: Request, exc: InvalidCursor) -> Response:
+    return JSONResponse(
+        status_code=HTTPStatus.BAD_REQUEST, content={"detail": exc.__str__()}
+    )
+
+
+async def admission_rejected_handler(
+    request: Request, exc: AdmissionRejected
+) -> Response:
+    return JSONResponse(
+        status_code=HTTPStatus.TOO_MANY_REQUESTS,
+        content={"detail": exc.__str__()},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 def create_app() -> FastAPI:
     container = Container()
     container.config()
@@ -36,6 +67,8 @@ def create_app() -> FastAPI:
     # db.create_all() will not create database's table if DB already created.
     # So you don't have to comment on your code.
     container.db().create_database()
+    if container.config.infrastructures.db.url():
+        container.reference_data_repository().refresh()
     container.init_resources()
 
     fast_api_app = FastAPI()
@@ -50,6 +83,18 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
     fast_api_app.middleware("http")(catch_exceptions_middleware)
+    fast_api_app.add_exception_handler(InvalidCursor, invalid_cursor_handler)
+    fast_api_app.add_exception_handler(AdmissionRejected, admission_rejected_handler)
+    if container.config.infrastructures.db.url():
+        lesson_pool = container.lesson_pool()
+        fast_api_app.add_event_handler("startup", lesson_pool.start)
+        fast_api_app.add_event_handler("shutdown", lesson_pool.stop)
+        llm_usage = container.llm_usage()
+        fast_api_app.add_event_handler("startup", llm_usage.start)
+        fast_api_app.add_event_handler("shutdown", llm_usage.stop)
+        persistence_queue = container.persistence_queue()
+        fast_api_app.add_event_handler("startup", persistence_queue.start)
+        fast_api_app.add_event_handler("shutdown", persistence_queue.stop)
     logger.debug("DONE configure create_app FastAPI")
     return fast_api_app
 
@@ -1,33 +1,230 @@
+import base64
+import binascii
+import json
 import math
-from typing import Any, Generic, TypeVar
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Generic, List, Optional, Tuple, TypeVar
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from pydantic.generics import GenericModel
+from sqlalchemy import func, tuple_
+from sqlalchemy.sql.elements import ColumnElement
+
+QUERY_COUNT = "query"
+WINDOW_COUNT = "window"
+CACHED_COUNT = "cached"
+NO_COUNT = "none"
+COUNT_STRATEGIES = (QUERY_COUNT, WINDOW_COUNT, CACHED_COUNT, NO_COUNT)
 
 
 class PageParams(BaseModel):
     page: int = 1
     size: int = 10
+    cursor: Optional[str] = Field(
+        None, description="`next_cursor` of the previous page, replaces `page`"
+    )
+    include_total: bool = Field(
+        True, description="Set to false to skip counting `total` and `total_page`"
+    )
 
 
 T = TypeVar("T")
 
 
 class PagedResponseSchema(GenericModel, Generic[T]):
-    total: int
-    total_page: int
+    total: Optional[int] = None
+    total_page: Optional[int] = None
     page: int = 1
     size: int = 10
+    next_cursor: Optional[str] = None
     items: list[Any]
 
 
-def paginate(page: int, size: int, query: Any) -> PagedResponseSchema:
-    paginated_query = query.offset((page - 1) * size).limit(size).all()
-    total_records = query.count()
+@dataclass
+class Keyset:
+    """Stable (created_at, id) ordering used to seek pages instead of offsetting."""
+
+    created_at: ColumnElement[Any]
+    id: ColumnElement[Any]
+    descending: bool = True
+
+    @classmethod
+    def for_model(cls, model: Any) -> Optional["Keyset"]:
+        if not hasattr(model, "created_at") or not hasattr(model, "id"):
+            return None
+        return cls(model.created_at, model.id)
+
+    def order_by(self) -> List[Any]:
+        if self.descending:
+            return [self.created_at.desc(), self.id.desc()]
+        return [self.created_at.asc(), self.id.asc()]
+
+    def after(self, cursor: str) -> Any:
+        created_at, id = decode_cursor(cursor)
+        keys = tuple_(self.created_at, self.id)
+        if self.descending:
+            return keys < tuple_(created_at, id)
+        return keys > tuple_(created_at, id)
+
+    def cursor_of(self, item: Any) -> str:
+        return encode_cursor(
+            getattr(item, self.created_at.key), getattr(item, self.id.key)
+        )
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise InvalidCursor(cursor)
+
+
+class CountCache:
+    """Short lived in-process cache of page totals.
+
+    Entries are grouped by scope (a user or a table) so a write can drop every
+    total it may have changed. Each worker has its own cache, the TTL bounds
+    how stale a total can be after a write served by another worker.
+    """
+
+    def __init__(self, ttl: float = 30) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, Tuple[float, int]]] = defaultdict(dict)
+
+    def get(self, scope: str, key: str) -> Optional[int]:
+        with self._lock:
+            cached = self._totals[scope].get(key)
+        if cached is None or cached[0] < time.monotonic():
+            return None
+        return cached[1]
+
+    def set(self, scope: str, key: str, total: int) -> None:
+        with self._lock:
+            self._totals[scope][key] = (time.monotonic() + self.ttl, total)
+
+    def invalidate(self, scope: str) -> None:
+        with self._lock:
+            self._totals.pop(scope, None)
+
+
+@dataclass
+class PageCount:
+    """How `paginate` gets the total of the filtered query.
+
+    QUERY_COUNT runs a separate count over the query, WINDOW_COUNT adds
+    ``count(*) OVER ()`` to the page query itself, CACHED_COUNT keeps totals in
+    a CountCache under (scope, key) and NO_COUNT leaves the total empty.
+    """
+
+    strategy: str = QUERY_COUNT
+    cache: Optional[CountCache] = None
+    scope: str = ""
+    key: str = ""
+
+    def __post_init__(self) -> None:
+        if self.strategy not in COUNT_STRATEGIES:
+            raise InvalidCountStrategy(self.strategy)
+        if self.strategy == CACHED_COUNT and self.cache is None:
+            self.strategy = QUERY_COUNT
+
+
+def _fetch_page(
+    query: Any, page_query: Any, limit: int, is_first_page: bool, count: PageCount
+) -> Tuple[List[Any], Optional[int]]:
+    if count.strategy == WINDOW_COUNT:
+        rows = page_query.add_columns(func.count().over()).limit(limit).all()
+        if rows:
+            return [row[0] for row in rows], rows[0][1]
+        # Past the last page there is no row to carry the total
+        return [], 0 if is_first_page else query.count()
+
+    items = page_query.limit(limit).all()
+    if count.strategy == NO_COUNT:
+        return items, None
+    if count.strategy == CACHED_COUNT and count.cache is not None:
+        total = count.cache.get(count.scope, count.key)
+        if total is None:
+            total = query.count()
+            count.cache.set(count.scope, count.key, total)
+        return items, total
+    return items, query.count()
+
+
+def paginate(
+    page: int,
+    size: int,
+    query: Any,
+    keyset: Optional[Keyset] = None,
+    cursor: Optional[str] = None,
+    count: Optional[PageCount] = None,
+) -> PagedResponseSchema:
+    count = count or PageCount()
+    if keyset is None:
+        items, total_records = _fetch_page(
+            query, query.offset((page - 1) * size), size, page == 1, count
+        )
+        return PagedResponseSchema(
+            total=total_records,
+            total_page=total_page(total_records, size),
+            page=page,
+            size=size,
+            items=items,
+        )
+
+    # The keyset replaces any order of the query, the cursor of a page is only
+    # valid for rows sorted on the keyset alone.
+    query = query.order_by(None).order_by(*keyset.order_by())
+    if cursor:
+        # Seek past the last row of the previous page, the cost does not grow
+        # with the depth of the page and the total is not counted.
+        items, total_records = _fetch_page(
+            query,
+            query.filter(keyset.after(cursor)),
+            size + 1,
+            False,
+            PageCount(NO_COUNT),
+        )
+    else:
+        items, total_records = _fetch_page(
+            query, query.offset((page - 1) * size), size + 1, page == 1, count
+        )
+    has_more = len(items) > size
+    items = items[:size]
     return PagedResponseSchema(
         total=total_records,
-        total_page=max(math.ceil(total_records / size), 1),
+        total_page=total_page(total_records, size),
         page=page,
         size=size,
-        items=paginated_query,
+        next_cursor=keyset.cursor_of(items[-1]) if has_more else None,
+        items=items,
     )
+
+
+def total_page(total_records: Optional[int], size: int) -> Optional[int]:
+    if total_records is None:
+        return None
+    return max(math.ceil(total_records / size), 1)
+
+
+class InvalidCursor(Exception):
+    def __init__(self, cursor: str):
+        super().__init__(f"Invalid pagination cursor: {cursor} !!!")
+
+
+class InvalidCountStrategy(Exception):
+    def __init__(self, strategy: str):
+        super().__init__(
+            f"Invalid count strategy: {strategy}, "
+            f"only accept value: <{','.join(COUNT_STRATEGIES)}>"
+        )
@@ -10,7 +10,9 @@ FOREIGN_LANGUAGE_ID = "languages.id"
 class ImageCaptionPrimaryLanguage(Base):
     __tablename__ = "image_caption"
     id = Column(Integer, primary_key=True)
-    user_id = Column(String, ForeignKey("user_info.user_id"), nullable=False)
+    user_id = Column(
+        String, ForeignKey("user_info.user_id"), nullable=False, index=True
+    )
     image_bucket_path_key = Column(String, nullable=False)
     primary_language_id = Column(
         Integer, ForeignKey(FOREIGN_LANGUAGE_ID), nullable=False
@@ -28,7 +30,9 @@ class ImageCaptionLearningLanguage(Base):
     __tablename__ = "image_caption_translation"
     id = Column(Integer, primary_key=True)
     learning_language_caption = Column(String)
-    caption_id = Column(Integer, ForeignKey("image_caption.id"), nullable=False)
+    caption_id = Column(
+        Integer, ForeignKey("image_caption.id"), nullable=False, index=True
+    )
     caption = relationship(
         "ImageCaptionPrimaryLanguage", back_populates="learning_caption"
     )
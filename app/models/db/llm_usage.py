@@ -0,0 +1,28 @@
+from sqlalchemy import Boolean, Column, DateTime, Float, Index, Integer, String, func
+
+from app.infrastructure.db.database import Base
+
+
+class LLMUsage(Base):
+    """One LLM call, written in batches by the usage recorder."""
+
+    __tablename__ = "llm_usage"
+    id = Column(Integer, primary_key=True)
+    # Null for the calls made by the lesson pool warmer
+    user_id = Column(String)
+    endpoint = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    level = Column(String)
+    shape = Column(String)
+    prompt_tokens = Column(Integer, nullable=False)
+    completion_tokens = Column(Integer, nullable=False)
+    time_to_first_token = Column(Float, nullable=False)
+    latency = Column(Float, nullable=False)
+    cost = Column(Float, nullable=False)
+    coalesced = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_llm_usage_user_id_created_at", user_id, created_at.desc()),
+        Index("ix_llm_usage_created_at", created_at),
+    )
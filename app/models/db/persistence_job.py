@@ -0,0 +1,20 @@
+from sqlalchemy import JSON, Column, DateTime, Index, Integer, String, func
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.infrastructure.db.database import Base
+
+
+class PersistenceJobStatus(Base):
+    """The status of a persistence queue job, shared by the workers."""
+
+    __tablename__ = "persistence_jobs"
+    id = Column(String, primary_key=True)
+    kind = Column(String, nullable=False)
+    user_id = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    result = Column(JSON().with_variant(JSONB(), "postgresql"))
+    error = Column(String)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (Index("ix_persistence_jobs_updated_at", updated_at),)
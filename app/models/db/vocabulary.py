@@ -1,13 +1,16 @@
 from sqlalchemy import (
+    JSON,
     Boolean,
     Column,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     String,
     UniqueConstraint,
     func,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 
 from app.infrastructure.db.database import Base
@@ -29,6 +32,13 @@ class Category(Base):
         UniqueConstraint(
             "user_id", "category_name", name="uq_category_user_id_category_name"
         ),
+        # Categories of a user in keyset order
+        Index(
+            "ix_category_user_id_created_at",
+            user_id,
+            created_at.desc(),
+            id.desc(),
+        ),
     )
 
 
@@ -45,6 +55,9 @@ class VocabularyPrompt(Base):
     difficulty_level_id = Column(
         Integer, ForeignKey("difficulty_levels.id"), nullable=False
     )
+    # Denormalized copy of the lesson tree (language, difficulty level,
+    # translations, questions and answers) served by the history endpoint
+    lesson_document = Column(JSON().with_variant(JSONB(), "postgresql"))
 
     difficulty_level = relationship("DifficultyLevels")
     language = relationship("Language")
@@ -52,6 +65,18 @@ class VocabularyPrompt(Base):
     category = relationship("Category", back_populates="prompts")
     translations = relationship("VocabularyPromptTranslation", back_populates="prompt")
 
+    __table_args__ = (
+        # Lesson history of a category in keyset order
+        Index(
+            "ix_vocabulary_prompts_history",
+            category_id,
+            language_id,
+            created_at.desc(),
+            id.desc(),
+            postgresql_where=is_valid,
+        ),
+    )
+
 
 class VocabularyQuestion(Base):
     __tablename__ = "vocabulary_questions"
@@ -63,7 +88,9 @@ class VocabularyQuestion(Base):
 
     answers = relationship("VocabularyAnswer", back_populates="question")
     prompt = relationship("VocabularyPrompt", back_populates="questions")
-    prompt_id = Column(Integer, ForeignKey("vocabulary_prompts.id"), nullable=False)
+    prompt_id = Column(
+        Integer, ForeignKey("vocabulary_prompts.id"), nullable=False, index=True
+    )
     language_id = Column(Integer, ForeignKey(FOREIGN_LANGUAGE_ID), nullable=False)
     translations = relationship(
         "VocabularyQuestionTranslation", back_populates="question"
@@ -78,7 +105,9 @@ class VocabularyAnswer(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now())
 
-    question_id = Column(Integer, ForeignKey(FOREIGN_VOCA_QUESTION_ID), nullable=False)
+    question_id = Column(
+        Integer, ForeignKey(FOREIGN_VOCA_QUESTION_ID), nullable=False, index=True
+    )
     language_id = Column(Integer, ForeignKey(FOREIGN_LANGUAGE_ID), nullable=False)
     question = relationship("VocabularyQuestion", back_populates="answers")
     translations = relationship("VocabularyAnswerTranslation", back_populates="answer")
@@ -101,7 +130,9 @@ class VocabularyPromptTranslation(Base):
         Integer, ForeignKey(FOREIGN_LANGUAGE_ID), nullable=False
     )
     translated_text = Column(String)
-    prompt_id = Column(Integer, ForeignKey("vocabulary_prompts.id"), nullable=False)
+    prompt_id = Column(
+        Integer, ForeignKey("vocabulary_prompts.id"), nullable=False, index=True
+    )
     prompt = relationship("VocabularyPrompt", back_populates="translations")
     translated_language = relationship("Language")
 
@@ -113,7 +144,9 @@ class VocabularyQuestionTranslation(Base):
     translated_language_id = Column(
         Integer, ForeignKey(FOREIGN_LANGUAGE_ID), nullable=False
     )
-    question_id = Column(Integer, ForeignKey(FOREIGN_VOCA_QUESTION_ID), nullable=False)
+    question_id = Column(
+        Integer, ForeignKey(FOREIGN_VOCA_QUESTION_ID), nullable=False, index=True
+    )
     question = relationship("VocabularyQuestion", back_populates="translations")
     translated_language = relationship("Language")
 
@@ -125,6 +158,8 @@ class VocabularyAnswerTranslation(Base):
     translated_language_id = Column(
         Integer, ForeignKey(FOREIGN_LANGUAGE_ID), nullable=False
     )
-    answer_id = Column(Integer, ForeignKey(FOREIGN_VOCA_ANSWER_ID), nullable=False)
+    answer_id = Column(
+        Integer, ForeignKey(FOREIGN_VOCA_ANSWER_ID), nullable=False, index=True
+    )
     answer = relationship("VocabularyAnswer", back_populates="translations")
     translated_language = relationship("Language")
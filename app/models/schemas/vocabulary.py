@@ -1,9 +1,17 @@
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel
 from pydantic.fields import Field
 
 DIFFICULT_LEVELS = {1: "EASY", 2: "INTERMEDIATE", 3: "ADVANCED"}
+TEXT_STREAM = "text"
+NDJSON_STREAM = "ndjson"
+SSE_STREAM = "sse"
+STREAM_MEDIA_TYPES = {
+    TEXT_STREAM: "text/plain",
+    NDJSON_STREAM: "application/x-ndjson",
+    SSE_STREAM: "text/event-stream",
+}
 
 
 class GetVocabularyQuestions(BaseModel):
@@ -19,6 +27,39 @@ class GetVocabularyQuestions(BaseModel):
     learning_language: str
     num_questions: int = 5
     num_answers: int = 3
+    fresh: bool = Field(
+        False, description="Generate a new lesson instead of replaying a cached one"
+    )
+    stream_format: str = Field(
+        TEXT_STREAM,
+        description="Format of the streamed lesson, value: <'text','ndjson','sse'>. "
+        "`ndjson` and `sse` send an event per lesson text and question as soon "
+        "as it is generated",
+    )
+
+
+class VocabularyLessonSpec(BaseModel):
+    category: str
+    level_type: str = Field(
+        DIFFICULT_LEVELS[1],
+        description="Difficult level of the lesson, value: <'EASY','INTERMEDIATE','ADVANCED'>",
+    )
+    translated_language: str
+    learning_language: str
+    num_questions: int = 5
+    num_answers: int = 3
+    fresh: bool = Field(
+        False, description="Generate a new lesson instead of replaying a cached one"
+    )
+
+
+class GetVocabularyLessonBatch(BaseModel):
+    lessons: List[VocabularyLessonSpec]
+    stream_format: str = Field(
+        NDJSON_STREAM,
+        description="Format of the streamed progress, value: <'ndjson','sse'>. "
+        "Every event carries the `item` index of its lesson in `lessons`",
+    )
 
 
 class GetVocabularyHistoryQuestion(BaseModel):
@@ -1,78 +1,239 @@
 import logging
-from contextlib import AbstractContextManager
-from typing import Any, Callable, Dict, Generic, Optional, Type, TypeVar, Union
+from contextlib import AbstractAsyncContextManager, AbstractContextManager
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    Type,
+    TypeVar,
+    Union,
+)
 
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy.sql.elements import UnaryExpression
 
-from app.infrastructure.db.database import Base
-from app.models.common.pagination import PagedResponseSchema, paginate
+from app.infrastructure.db.database import Base, InvalidEngineMode
+from app.models.common.pagination import (
+    CACHED_COUNT,
+    NO_COUNT,
+    QUERY_COUNT,
+    CountCache,
+    Keyset,
+    PageCount,
+    PagedResponseSchema,
+    paginate,
+)
 
 ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
+ResultType = TypeVar("ResultType")
 
 
-class BaseRepository(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
+def user_count_scope(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+class SessionRepository:
+    """Run the same session bound query code against the sync or async engine.
+
+    Query code is written once against a sync ``Session``; the async variants
+    execute it through ``AsyncSession.run_sync`` on the asyncpg connection.
+    The ``run_read`` variants ask the factory for a read-only session, which
+    may be bound to a replica.
+    """
+
     def __init__(
         self,
-        model: Type[ModelType],
         session_factory: Callable[..., AbstractContextManager[Session]],
-    ):
-        self.model = model
+        async_session_factory: Optional[
+            Callable[..., AbstractAsyncContextManager[AsyncSession]]
+        ] = None,
+    ) -> None:
         self.session_factory = session_factory
+        self.async_session_factory = async_session_factory
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
 
-    def get(self, id: Any) -> PagedResponseSchema[ModelType]:
+    def run(
+        self, func: Callable[..., ResultType], *args: Any, **kwargs: Any
+    ) -> ResultType:
         with self.session_factory() as session:
-            query = session.query(self.model).filter(self.model.id == id)
-            return PagedResponseSchema(
-                total=query.count(),
-                total_page=1,
-                items=[query.first()],
-            )
+            return func(session, *args, **kwargs)
 
-    def query(
+    async def run_async(
+        self, func: Callable[..., ResultType], *args: Any, **kwargs: Any
+    ) -> ResultType:
+        if self.async_session_factory is None:
+            raise InvalidEngineMode("sync")
+        async with self.async_session_factory() as session:
+            return await session.run_sync(func, *args, **kwargs)
+
+    def run_read(
+        self, func: Callable[..., ResultType], *args: Any, **kwargs: Any
+    ) -> ResultType:
+        with self.session_factory(read_only=True) as session:
+            return func(session, *args, **kwargs)
+
+    async def run_read_async(
+        self, func: Callable[..., ResultType], *args: Any, **kwargs: Any
+    ) -> ResultType:
+        if self.async_session_factory is None:
+            raise InvalidEngineMode("sync")
+        async with self.async_session_factory(read_only=True) as session:
+            return await session.run_sync(func, *args, **kwargs)
+
+
+class BaseRepository(
+    SessionRepository, Generic[ModelType, CreateSchemaType, UpdateSchemaType]
+):
+    def __init__(
         self,
+        model: Type[ModelType],
+        session_factory: Callable[..., AbstractContextManager[Session]],
+        async_session_factory: Optional[
+            Callable[..., AbstractAsyncContextManager[AsyncSession]]
+        ] = None,
+        count_strategy: str = QUERY_COUNT,
+        count_cache: Optional[CountCache] = None,
+        user_scope_column: Optional[str] = None,
+        after_commit: Optional[Callable[[], None]] = None,
+    ):
+        super().__init__(session_factory, async_session_factory)
+        self.model = model
+        self.keyset = Keyset.for_model(model)
+        self.count_strategy = count_strategy
+        self.count_cache = count_cache
+        # Rows owned by a user keep their cached totals in the scope of that
+        # user, so a write only drops the totals of its owner.
+        self.user_scope_column = user_scope_column
+        # Called once a write through this repository is committed
+        self.after_commit = after_commit
+
+    def page_count(self, scope: str, key: str, include_total: bool) -> PageCount:
+        return PageCount(
+            strategy=self.count_strategy if include_total else NO_COUNT,
+            cache=self.count_cache,
+            scope=scope,
+            key=key,
+        )
+
+    def invalidate_counts(self, scope: str) -> None:
+        if self.count_cache is not None:
+            self.count_cache.invalidate(scope)
+
+    def _count_scopes(self, obj: Any) -> List[str]:
+        scopes = [self.model.__tablename__]
+        if self.user_scope_column is not None and obj is not None:
+            scopes.append(user_count_scope(getattr(obj, self.user_scope_column)))
+        return scopes
+
+    def _on_commit(self, session: Session, obj: Any) -> None:
+        # Dropped before the commit, a total could be counted again from the
+        # old rows and cached until the TTL. A rolled back write keeps them.
+        scopes = self._count_scopes(obj) if self.count_cache is not None else []
+        if not scopes and self.after_commit is None:
+            return
+
+        def committed(_: Session) -> None:
+            for scope in scopes:
+                self.invalidate_counts(scope)
+            if self.after_commit is not None:
+                self.after_commit()
+
+        event.listen(session, "after_commit", committed, once=True)
+
+    def _count_key(self, session: Session, query: Any) -> str:
+        # Compiled for the dialect of the session with its bound values kept
+        # apart, which every bind type supports unlike literal binds.
+        compiled = query.compile(dialect=session.get_bind().dialect)
+        return f"{compiled}:{sorted(compiled.params.items())!r}"
+
+    def _get(self, session: Session, id: Any) -> PagedResponseSchema[ModelType]:
+        query = session.query(self.model).filter(self.model.id == id)
+        return PagedResponseSchema(
+            total=query.count(),
+            total_page=1,
+            items=[query.first()],
+        )
+
+    def _query(
+        self,
+        session: Session,
         query: Any,
         page: int,
         size: int,
         sort_by: Optional[UnaryExpression[Any]] = None,
+        cursor: Optional[str] = None,
+        include_total: bool = True,
+        count_scope: Optional[str] = None,
     ) -> PagedResponseSchema[ModelType]:
-        with self.session_factory() as session:
-            if sort_by is not None:
-                query = session.query(self.model).filter(query).order_by(sort_by)
-            else:
-                query = session.query(self.model).filter(query)
-            return paginate(page, size, query)
+        count_key = ""
+        # The filter is only compiled to key a cached total
+        if (
+            include_total
+            and self.count_strategy == CACHED_COUNT
+            and self.count_cache is not None
+        ):
+            count_key = self._count_key(session, query)
+        query = session.query(self.model).filter(query)
+        return self._paginate(
+            query, page, size, sort_by, cursor, include_total, count_key, count_scope
+        )
 
-    def get_multi(
-        self, page: int, size: int, sort_by: Optional[UnaryExpression[Any]] = None
+    def _get_multi(
+        self,
+        session: Session,
+        page: int,
+        size: int,
+        sort_by: Optional[UnaryExpression[Any]] = None,
+        cursor: Optional[str] = None,
+        include_total: bool = True,
     ) -> PagedResponseSchema[ModelType]:
-        with self.session_factory() as session:
-            if sort_by is not None:
-                query = session.query(self.model).order_by(sort_by)
-            else:
-                query = session.query(self.model)
-            return paginate(page, size, query)
+        query = session.query(self.model)
+        return self._paginate(query, page, size, sort_by, cursor, include_total)
 
-    def create(
-        self, *, obj_in: CreateSchemaType, commit: bool = True
+    def _paginate(
+        self,
+        query: Any,
+        page: int,
+        size: int,
+        sort_by: Optional[UnaryExpression[Any]] = None,
+        cursor: Optional[str] = None,
+        include_total: bool = True,
+        count_key: str = "",
+        count_scope: Optional[str] = None,
+    ) -> PagedResponseSchema[ModelType]:
+        count = self.page_count(
+            count_scope or self.model.__tablename__, count_key, include_total
+        )
+        # Without an explicit sort the (created_at, id) keyset is used, which
+        # allows `cursor` pagination. An explicit sort only supports offsets.
+        if sort_by is not None:
+            return paginate(page, size, query.order_by(sort_by), count=count)
+        return paginate(page, size, query, self.keyset, cursor, count)
+
+    def _create(
+        self, session: Session, obj_in: CreateSchemaType, commit: bool = True
     ) -> Optional[ModelType]:
-        with self.session_factory() as session:
-            obj_in_data = jsonable_encoder(obj_in)
-            db_obj = self.model(**obj_in_data)
-            session.add(db_obj)
-            if commit:
-                session.commit()
-                session.refresh(db_obj)
-            return db_obj
+        obj_in_data = jsonable_encoder(obj_in)
+        db_obj = self.model(**obj_in_data)
+        session.add(db_obj)
+        self._on_commit(session, db_obj)
+        if commit:
+            session.commit()
+            session.refresh(db_obj)
+        return db_obj
 
-    def update(
+    def _update(
         self,
-        *,
+        session: Session,
         db_obj: ModelType,
         obj_in: Union[UpdateSchemaType, Dict[str, Any]],
         commit: bool = True,
@@ -85,17 +246,113 @@ class BaseRepository(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         for field in obj_data:
             if field in update_data:
                 setattr(db_obj, field, update_data[field])
-        with self.session_factory() as session:
-            session.add(db_obj)
-            if commit:
-                session.commit()
-                session.refresh(db_obj)
-            return db_obj
+        session.add(db_obj)
+        self._on_commit(session, db_obj)
+        if commit:
+            session.commit()
+            session.refresh(db_obj)
+        return db_obj
+
+    def _remove(
+        self, session: Session, id: int, commit: bool = True
+    ) -> Optional[ModelType]:
+        obj = session.query(self.model).get(id)
+        session.delete(obj)
+        self._on_commit(session, obj)
+        if commit:
+            session.commit()
+        return obj
+
+    def get(self, id: Any) -> PagedResponseSchema[ModelType]:
+        return self.run_read(self._get, id)
+
+    async def get_async(self, id: Any) -> PagedResponseSchema[ModelType]:
+        return await self.run_read_async(self._get, id)
+
+    def query(
+        self,
+        query: Any,
+        page: int,
+        size: int,
+        sort_by: Optional[UnaryExpression[Any]] = None,
+        cursor: Optional[str] = None,
+        include_total: bool = True,
+        count_scope: Optional[str] = None,
+    ) -> PagedResponseSchema[ModelType]:
+        return self.run_read(
+            self._query, query, page, size, sort_by, cursor, include_total, count_scope
+        )
+
+    async def query_async(
+        self,
+        query: Any,
+        page: int,
+        size: int,
+        sort_by: Optional[UnaryExpression[Any]] = None,
+        cursor: Optional[str] = None,
+        include_total: bool = True,
+        count_scope: Optional[str] = None,
+    ) -> PagedResponseSchema[ModelType]:
+        return await self.run_read_async(
+            self._query, query, page, size, sort_by, cursor, include_total, count_scope
+        )
+
+    def get_multi(
+        self,
+        page: int,
+        size: int,
+        sort_by: Optional[UnaryExpression[Any]] = None,
+        cursor: Optional[str] = None,
+        include_total: bool = True,
+    ) -> PagedResponseSchema[ModelType]:
+        return self.run_read(
+            self._get_multi, page, size, sort_by, cursor, include_total
+        )
+
+    async def get_multi_async(
+        self,
+        page: int,
+        size: int,
+        sort_by: Optional[UnaryExpression[Any]] = None,
+        cursor: Optional[str] = None,
+        include_total: bool = True,
+    ) -> PagedResponseSchema[ModelType]:
+        return await self.run_read_async(
+            self._get_multi, page, size, sort_by, cursor, include_total
+        )
+
+    def create(
+        self, *, obj_in: CreateSchemaType, commit: bool = True
+    ) -> Optional[ModelType]:
+        return self.run(self._create, obj_in, commit)
+
+    async def create_async(
+        self, *, obj_in: CreateSchemaType, commit: bool = True
+    ) -> Optional[ModelType]:
+        return await self.run_async(self._create, obj_in, commit)
+
+    def update(
+        self,
+        *,
+        db_obj: ModelType,
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]],
+        commit: bool = True,
+    ) -> Optional[ModelType]:
+        return self.run(self._update, db_obj, obj_in, commit)
+
+    async def update_async(
+        self,
+        *,
+        db_obj: ModelType,
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]],
+        commit: bool = True,
+    ) -> Optional[ModelType]:
+        return await self.run_async(self._update, db_obj, obj_in, commit)
 
     def remove(self, *, id: int, commit: bool = True) -> Optional[ModelType]:
-        with self.session_factory() as session:
-            obj = session.query(self.model).get(id)
-            session.delete(obj)
-            if commit:
-                session.commit()
-            return obj
+        return self.run(self._remove, id, commit)
+
+    async def remove_async(
+        self, *, id: int, commit: bool = True
+    ) -> Optional[ModelType]:
+        return await self.run_async(self._remove, id, commit)
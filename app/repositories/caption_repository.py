@@ -1,6 +1,7 @@
-from contextlib import AbstractContextManager
-from typing import Callable
+from contextlib import AbstractAsyncContextManager, AbstractContextManager
+from typing import Callable, Optional
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.models.db.image_caption import (
@@ -8,40 +9,73 @@ from app.models.db.image_caption import (
     ImageCaptionPrimaryLanguage,
 )
 from app.models.schemas.image_caption import ImageCaptionCreate
-from app.repositories.vocabulary_repository import check_language
+from app.repositories.base_repository import SessionRepository
+from app.repositories.reference_data_repository import (
+    ReferenceDataRepository,
+    resolve_language,
+)
 
 
-class CaptionRepository:
+class CaptionSessionRepository(SessionRepository):
     def __init__(
         self,
         session_factory: Callable[..., AbstractContextManager[Session]],
-    ):
-        self.session_factory = session_factory
+        async_session_factory: Optional[
+            Callable[..., AbstractAsyncContextManager[AsyncSession]]
+        ] = None,
+        reference_data: Optional[ReferenceDataRepository] = None,
+    ) -> None:
+        super().__init__(session_factory, async_session_factory)
+        self.reference_data = reference_data
+
+
+class CaptionRepository(CaptionSessionRepository):
+    def _add_image_caption(
+        self, session: Session, user_id: str, image_caption: ImageCaptionCreate
+    ) -> ImageCaptionPrimaryLanguage:
+        primary_language_id = resolve_language(
+            session, image_caption.primary_language, self.reference_data
+        )
+        img_caption = ImageCaptionPrimaryLanguage(
+            user_id=user_id,
+            image_bucket_path_key=image_caption.image_path,
+            caption=image_caption.caption,
+            primary_language_id=primary_language_id,
+        )
+        session.add(img_caption)
+        session.commit()
+        return img_caption
 
     def add_image_caption(
         self, user_id: str, image_caption: ImageCaptionCreate
     ) -> ImageCaptionPrimaryLanguage:
-        with self.session_factory() as session:
-            primary_language_id = check_language(
-                session, image_caption.primary_language
-            )
-            img_caption = ImageCaptionPrimaryLanguage(
-                user_id=user_id,
-                image_bucket_path_key=image_caption.image_path,
-                caption=image_caption.caption,
-                primary_language_id=primary_language_id,
-            )
-            session.add(img_caption)
-            session.commit()
-            return img_caption
-
-
-class TranslatedCaptionRepository:
-    def __init__(
+        return self.run(self._add_image_caption, user_id, image_caption)
+
+    async def add_image_caption_async(
+        self, user_id: str, image_caption: ImageCaptionCreate
+    ) -> ImageCaptionPrimaryLanguage:
+        return await self.run_async(self._add_image_caption, user_id, image_caption)
+
+
+class TranslatedCaptionRepository(CaptionSessionRepository):
+    def _add_translated_caption(
         self,
-        session_factory: Callable[..., AbstractContextManager[Session]],
-    ):
-        self.session_factory = session_factory
+        session: Session,
+        learning_caption: str,
+        learning_language: str,
+        image_caption_object: ImageCaptionPrimaryLanguage,
+    ) -> ImageCaptionLearningLanguage:
+        learning_language_id = resolve_language(
+            session, learning_language, self.reference_data
+        )
+        translated_image_caption = ImageCaptionLearningLanguage(
+            learning_language_id=learning_language_id,
+            learning_language_caption=learning_caption,
+            caption=image_caption_object,
+        )
+        session.add(translated_image_caption)
+        session.commit()
+        return translated_image_caption
 
     def add_translated_caption(
         self,
@@ -49,13 +83,22 @@ class TranslatedCaptionRepository:
         learning_language: str,
         image_caption_object: ImageCaptionPrimaryLanguage,
     ) -> ImageCaptionLearningLanguage:
-        with self.session_factory() as session:
-            learning_language_id = check_language(session, learning_language)
-            translated_image_caption = ImageCaptionLearningLanguage(
-                learning_language_id=learning_language_id,
-                learning_language_caption=learning_caption,
-                caption=image_caption_object,
-            )
-            session.add(translated_image_caption)
-            session.commit()
-            return translated_image_caption
+        return self.run(
+            self._add_translated_caption,
+            learning_caption,
+            learning_language,
+            image_caption_object,
+        )
+
+    async def add_translated_caption_async(
+        self,
+        learning_caption: str,
+        learning_language: str,
+        image_caption_object: ImageCaptionPrimaryLanguage,
+    ) -> ImageCaptionLearningLanguage:
+        return await self.run_async(
+            self._add_translated_caption,
+            learning_caption,
+            learning_language,
+            image_caption_object,
+        )
@@ -0,0 +1,100 @@
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from app.infrastructure.llm.usage import LLMCall
+from app.models.db.llm_usage import LLMUsage
+from app.repositories.base_repository import SessionRepository
+
+
+@dataclass
+class UsageSummary:
+    endpoint: str
+    level: Optional[str]
+    shape: Optional[str]
+    calls: int
+    prompt_tokens: int
+    completion_tokens: int
+    cost: float
+    avg_latency: float
+    avg_time_to_first_token: float
+    # Completion tokens over the time spent streaming them, after the first
+    tokens_per_second: float
+
+
+class LLMUsageRepository(SessionRepository):
+    def _add_many(self, session: Session, calls: List[LLMCall]) -> None:
+        # One multi-row INSERT per flush
+        session.execute(insert(LLMUsage), [asdict(call) for call in calls])
+        session.commit()
+
+    def _get_usage(
+        self, session: Session, since: datetime, user_id: Optional[str]
+    ) -> List[UsageSummary]:
+        query = session.query(
+            LLMUsage.endpoint,
+            LLMUsage.level,
+            LLMUsage.shape,
+            func.count(LLMUsage.id),
+            func.sum(LLMUsage.prompt_tokens),
+            func.sum(LLMUsage.completion_tokens),
+            func.sum(LLMUsage.cost),
+            func.avg(LLMUsage.latency),
+            func.avg(LLMUsage.time_to_first_token),
+            func.sum(LLMUsage.latency - LLMUsage.time_to_first_token),
+        ).filter(LLMUsage.created_at >= since)
+        if user_id is not None:
+            query = query.filter(LLMUsage.user_id == user_id)
+        rows = (
+            query.group_by(LLMUsage.endpoint, LLMUsage.level, LLMUsage.shape)
+            .order_by(func.sum(LLMUsage.cost).desc())
+            .all()
+        )
+        return [
+            UsageSummary(
+                endpoint=endpoint,
+                level=level,
+                shape=shape,
+                calls=calls,
+                prompt_tokens=prompt_tokens or 0,
+                completion_tokens=completion_tokens or 0,
+                cost=cost or 0.0,
+                avg_latency=avg_latency or 0.0,
+                avg_time_to_first_token=avg_time_to_first_token or 0.0,
+                tokens_per_second=(
+                    (completion_tokens or 0) / generation_time
+                    if generation_time and generation_time > 0
+                    else 0.0
+                ),
+            )
+            for (
+                endpoint,
+                level,
+                shape,
+                calls,
+                prompt_tokens,
+                completion_tokens,
+                cost,
+                avg_latency,
+                avg_time_to_first_token,
+                generation_time,
+            ) in rows
+        ]
+
+    def add_many(self, calls: List[LLMCall]) -> None:
+        self.run(self._add_many, calls)
+
+    def get_usage(
+        self, since: datetime, user_id: Optional[str] = None
+    ) -> List[UsageSummary]:
+        """Calls since `since` grouped by endpoint, level and lesson shape,
+        the most expensive first."""
+        return self.run_read(self._get_usage, since, user_id)
+
+    async def get_usage_async(
+        self, since: datetime, user_id: Optional[str] = None
+    ) -> List[UsageSummary]:
+        return await self.run_read_async(self._get_usage, since, user_id)
@@ -0,0 +1,86 @@
+from contextlib import AbstractAsyncContextManager, AbstractContextManager
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.db.persistence_job import PersistenceJobStatus
+from app.repositories.base_repository import SessionRepository
+from app.services.persistence_queue import PersistenceJob
+
+
+class PersistenceJobRepository(SessionRepository):
+    """The job statuses of the persistence queues of every worker, a status
+    is dropped `retention` seconds after its last change."""
+
+    def __init__(
+        self,
+        session_factory: Callable[..., AbstractContextManager[Session]],
+        async_session_factory: Optional[
+            Callable[..., AbstractAsyncContextManager[AsyncSession]]
+        ] = None,
+        retention: float = 24 * 3600,
+    ) -> None:
+        super().__init__(session_factory, async_session_factory)
+        self.retention = retention
+
+    def _save_many(self, session: Session, jobs: List[PersistenceJob]) -> None:
+        now = datetime.now(timezone.utc)
+        stmt = insert(PersistenceJobStatus).values(
+            [
+                {
+                    "id": job.id,
+                    "kind": job.kind,
+                    "user_id": job.user_id,
+                    "status": job.status,
+                    "attempts": job.attempts,
+                    "result": job.result,
+                    "error": job.error,
+                    "updated_at": now,
+                }
+                for job in jobs
+            ]
+        )
+        session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[PersistenceJobStatus.id],
+                set_={
+                    "status": stmt.excluded.status,
+                    "attempts": stmt.excluded.attempts,
+                    "result": stmt.excluded.result,
+                    "error": stmt.excluded.error,
+                    "updated_at": stmt.excluded.updated_at,
+                },
+            )
+        )
+        session.execute(
+            delete(PersistenceJobStatus).where(
+                PersistenceJobStatus.updated_at
+                < now - timedelta(seconds=self.retention)
+            )
+        )
+        session.commit()
+
+    def _get(self, session: Session, job_id: str) -> Optional[PersistenceJob]:
+        row = session.get(PersistenceJobStatus, job_id)
+        if row is None:
+            return None
+        return PersistenceJob(
+            id=row.id,
+            kind=row.kind,
+            user_id=row.user_id,
+            payload={},
+            status=row.status,
+            attempts=row.attempts,
+            result=row.result,
+            error=row.error,
+        )
+
+    def save_many(self, jobs: List[PersistenceJob]) -> None:
+        self.run(self._save_many, jobs)
+
+    def get(self, job_id: str) -> Optional[PersistenceJob]:
+        return self.run(self._get, job_id)
@@ -0,0 +1,183 @@
+import threading
+import time
+from contextlib import AbstractAsyncContextManager, AbstractContextManager
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.db.difficulty_levels import DifficultyLevels
+from app.models.db.language import Language
+from app.repositories.base_repository import SessionRepository
+
+# The column values of a language or difficulty level row
+ReferenceRow = Dict[str, Any]
+
+
+def reference_row(obj: Any) -> ReferenceRow:
+    return {
+        column.key: getattr(obj, column.key)
+        for column in sa_inspect(obj).mapper.column_attrs
+    }
+
+
+def check_difficulty_lesson(db: Session, difficult_name: str) -> int:
+    return find_difficulty_level(db, difficult_name)["id"]
+
+
+def find_difficulty_level(db: Session, difficult_name: str) -> ReferenceRow:
+    difficult_level: Optional[DifficultyLevels] = (
+        db.query(DifficultyLevels)
+        .filter(DifficultyLevels.name == difficult_name.upper())
+        .first()
+    )
+    if not difficult_level:
+        raise InvalidLessonLevel(difficult_name)
+    return reference_row(difficult_level)
+
+
+def check_language(db: Session, language_name: str) -> int:
+    return find_language(db, language_name)["id"]
+
+
+def find_language(db: Session, language_name: str) -> ReferenceRow:
+    language: Optional[Language] = (
+        db.query(Language)
+        .filter(Language.language_name == language_name.upper())
+        .first()
+    )
+
+    if not language:
+        raise InvalidLanguage(language_name)
+    return reference_row(language)
+
+
+class ReferenceDataRepository(SessionRepository):
+    """In-memory lookup of the language and difficulty level rows by name.
+
+    Both tables are loaded together and the lookup is versioned: it is
+    reloaded every `refresh_interval` seconds or after `invalidate()`, on the
+    session of the caller so it also works inside `AsyncSession.run_sync`.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[..., AbstractContextManager[Session]],
+        async_session_factory: Optional[
+            Callable[..., AbstractAsyncContextManager[AsyncSession]]
+        ] = None,
+        refresh_interval: float = 300,
+    ) -> None:
+        super().__init__(session_factory, async_session_factory)
+        self.refresh_interval = refresh_interval
+        self.version = 0
+        self._languages: Dict[str, ReferenceRow] = {}
+        self._difficulty_levels: Dict[str, ReferenceRow] = {}
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def is_stale(self) -> bool:
+        return time.monotonic() >= self._expires_at
+
+    def _load(self, session: Session) -> None:
+        languages = {
+            language.language_name: reference_row(language)
+            for language in session.query(Language)
+        }
+        difficulty_levels = {
+            level.name: reference_row(level)
+            for level in session.query(DifficultyLevels)
+        }
+        with self._lock:
+            self._languages = languages
+            self._difficulty_levels = difficulty_levels
+            self._expires_at = time.monotonic() + self.refresh_interval
+            self.version += 1
+        self.logger.debug(
+            f"Loaded reference data version {self.version}: "
+            f"{len(languages)} languages, {len(difficulty_levels)} levels"
+        )
+
+    def refresh(self) -> None:
+        self.run(self._load)
+
+    async def refresh_async(self) -> None:
+        await self.run_async(self._load)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._expires_at = 0.0
+
+    def language(self, session: Session, language_name: str) -> ReferenceRow:
+        if self.is_stale:
+            self._load(session)
+        language = self._languages.get(language_name.upper())
+        if language is None:
+            raise InvalidLanguage(language_name)
+        return language
+
+    def language_id(self, session: Session, language_name: str) -> int:
+        return self.language(session, language_name)["id"]
+
+    def difficulty_level(self, session: Session, difficult_name: str) -> ReferenceRow:
+        if self.is_stale:
+            self._load(session)
+        difficulty_level = self._difficulty_levels.get(difficult_name.upper())
+        if difficulty_level is None:
+            raise InvalidLessonLevel(difficult_name)
+        return difficulty_level
+
+    def difficulty_level_id(self, session: Session, difficult_name: str) -> int:
+        return self.difficulty_level(session, difficult_name)["id"]
+
+
+class InvalidLanguage(Exception):
+    def __init__(self, language: str):
+        super().__init__(f"Invalid language name: {language} !!!")
+
+
+class InvalidLessonLevel(Exception):
+    def __init__(self, language: str):
+        super().__init__(f"Invalid lesson level: {language} !!!")
+
+
+def resolve_language(
+    session: Session,
+    language_name: str,
+    reference_data: Optional[ReferenceDataRepository] = None,
+) -> int:
+    if reference_data is None:
+        return check_language(session, language_name)
+    return reference_data.language_id(session, language_name)
+
+
+def resolve_language_row(
+    session: Session,
+    language_name: str,
+    reference_data: Optional[ReferenceDataRepository] = None,
+) -> ReferenceRow:
+    if reference_data is None:
+        return find_language(session, language_name)
+    return reference_data.language(session, language_name)
+
+
+def resolve_difficulty_level(
+    session: Session,
+    difficult_name: str,
+    reference_data: Optional[ReferenceDataRepository] = None,
+) -> int:
+    if reference_data is None:
+        return check_difficulty_lesson(session, difficult_name)
+    return reference_data.difficulty_level_id(session, difficult_name)
+
+
+def resolve_difficulty_level_row(
+    session: Session,
+    difficult_name: str,
+    reference_data: Optional[ReferenceDataRepository] = None,
+) -> ReferenceRow:
+    if reference_data is None:
+        return find_difficulty_level(session, difficult_name)
+    return reference_data.difficulty_level(session, difficult_name)
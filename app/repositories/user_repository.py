@@ -1,89 +1,120 @@
 import logging
-from contextlib import AbstractContextManager
+from contextlib import AbstractAsyncContextManager, AbstractContextManager
 from typing import Callable, Iterator, Optional
 
 from psycopg2 import errors
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.models.db.users import UserInfo
+from app.repositories.base_repository import SessionRepository
 
 UniqueViolation = errors.lookup("23505")  # Correct way to Import the psycopg2 errors
 
 
-class UserRepository:
+class UserRepository(SessionRepository):
     def __init__(
-        self, session_factory: Callable[..., AbstractContextManager[Session]]
+        self,
+        session_factory: Callable[..., AbstractContextManager[Session]],
+        async_session_factory: Optional[
+            Callable[..., AbstractAsyncContextManager[AsyncSession]]
+        ] = None,
     ) -> None:
-        self.session_factory = session_factory
+        super().__init__(session_factory, async_session_factory)
         self.logger = logging.getLogger(
             f"{__name__}.{self.__class__.__name__}",
         )
 
+    def _get_all(self, session: Session) -> Iterator[UserInfo]:
+        return session.query(UserInfo).all()
+
+    def _get_by_id(self, session: Session, user_id: str) -> UserInfo:
+        user = session.query(UserInfo).filter(UserInfo.user_id == user_id).first()
+        if not user:
+            raise UserNotFoundError(user_id)
+        return user
+
+    def _add(self, session: Session, user_info: UserInfo) -> UserInfo | None:
+        try:
+            session.add(user_info)
+            session.commit()
+            session.refresh(user_info)
+            return user_info
+        except IntegrityError as err:
+            self.logger.error(err)
+            if isinstance(err.orig, UniqueViolation):
+                raise NotUniqueError(err.orig.pgcode, err.orig.pgerror)
+        except SQLAlchemyError as err:
+            self.logger.error(err)
+        return None
+
+    def _update(self, session: Session, user_info: UserInfo) -> UserInfo | None:
+        try:
+            user: Optional[UserInfo] = (
+                session.query(UserInfo)
+                .filter(UserInfo.user_id == user_info.user_id)
+                .first()
+            )
+            if user is not None:
+                user.full_name = user_info.full_name
+                user.email = user_info.email
+                user.country = user_info.country
+                user.language = user_info.language
+                user.phone_number = user_info.phone_number
+                user.nickname = user_info.nickname
+                user.date_of_birth = user_info.date_of_birth
+                user.gender = user_info.gender
+                user.picture = user_info.picture
+                session.commit()
+                session.refresh(user)
+            return user
+        except IntegrityError as err:
+            self.logger.error(err)
+            if isinstance(err.orig, UniqueViolation):
+                raise NotUniqueError(err.orig.pgcode, err.orig.pgerror)
+        except SQLAlchemyError as err:
+            self.logger.error(err)
+        return None
+
+    def _delete_by_id(self, session: Session, user_id: str) -> None:
+        entity: UserInfo = (
+            session.query(UserInfo).filter(UserInfo.user_id == user_id).first()
+        )
+        if not entity:
+            raise UserNotFoundError(user_id)
+        session.delete(entity)
+        session.commit()
+
     def get_all(self) -> Iterator[UserInfo]:
-        with self.session_factory() as session:
-            return session.query(UserInfo).all()
+        return self.run_read(self._get_all)
+
+    async def get_all_async(self) -> Iterator[UserInfo]:
+        return await self.run_read_async(self._get_all)
 
     def get_by_id(self, user_id: str) -> UserInfo:
-        with self.session_factory() as session:
-            user = session.query(UserInfo).filter(UserInfo.user_id == user_id).first()
-            if not user:
-                raise UserNotFoundError(user_id)
-            return user
+        return self.run_read(self._get_by_id, user_id)
+
+    async def get_by_id_async(self, user_id: str) -> UserInfo:
+        return await self.run_read_async(self._get_by_id, user_id)
 
     def add(self, user_info: UserInfo) -> UserInfo | None:
-        with self.session_factory() as session:
-            try:
-                session.add(user_info)
-                session.commit()
-                session.refresh(user_info)
-                return user_info
-            except IntegrityError as err:
-                self.logger.error(err)
-                if isinstance(err.orig, UniqueViolation):
-                    raise NotUniqueError(err.orig.pgcode, err.orig.pgerror)
-            except SQLAlchemyError as err:
-                self.logger.error(err)
-            return None
+        return self.run(self._add, user_info)
+
+    async def add_async(self, user_info: UserInfo) -> UserInfo | None:
+        return await self.run_async(self._add, user_info)
 
     def update(self, user_info: UserInfo) -> UserInfo | None:
-        with self.session_factory() as session:
-            try:
-                user: Optional[UserInfo] = (
-                    session.query(UserInfo)
-                    .filter(UserInfo.user_id == user_info.user_id)
-                    .first()
-                )
-                if user is not None:
-                    user.full_name = user_info.full_name
-                    user.email = user_info.email
-                    user.country = user_info.country
-                    user.language = user_info.language
-                    user.phone_number = user_info.phone_number
-                    user.nickname = user_info.nickname
-                    user.date_of_birth = user_info.date_of_birth
-                    user.gender = user_info.gender
-                    user.picture = user_info.picture
-                    session.commit()
-                    session.refresh(user)
-                return user
-            except IntegrityError as err:
-                self.logger.error(err)
-                if isinstance(err.orig, UniqueViolation):
-                    raise NotUniqueError(err.orig.pgcode, err.orig.pgerror)
-            except SQLAlchemyError as err:
-                self.logger.error(err)
-            return None
+        return self.run(self._update, user_info)
+
+    async def update_async(self, user_info: UserInfo) -> UserInfo | None:
+        return await self.run_async(self._update, user_info)
 
     def delete_by_id(self, user_id: str) -> None:
-        with self.session_factory() as session:
-            entity: UserInfo = (
-                session.query(UserInfo).filter(UserInfo.user_id == user_id).first()
-            )
-            if not entity:
-                raise UserNotFoundError(user_id)
-            session.delete(entity)
-            session.commit()
+        self.run(self._delete_by_id, user_id)
+
+    async def delete_by_id_async(self, user_id: str) -> None:
+        await self.run_async(self._delete_by_id, user_id)
 
 
 class NotFoundError(Exception):
@@ -1,11 +1,22 @@
+from contextlib import AbstractAsyncContextManager, AbstractContextManager
 from dataclasses import dataclass
-from typing import Any, List, Optional
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
-from sqlalchemy import and_
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import and_, func, select
+from sqlalchemy import inspect as sa_inspect
 from sqlalchemy.dialects.postgresql import insert
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased, joinedload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
-from app.models.common.pagination import PagedResponseSchema, paginate
+from app.models.common.pagination import (
+    QUERY_COUNT,
+    CountCache,
+    PagedResponseSchema,
+    paginate,
+)
 from app.models.db.difficulty_levels import DifficultyLevels
 from app.models.db.language import Language
 from app.models.db.vocabulary import (
@@ -21,7 +32,16 @@ from app.models.schemas.vocabulary import (
     GetVocabularyHistoryQuestion,
     VocabularyPromptCreate,
 )
-from app.repositories.base_repository import BaseRepository
+from app.repositories.base_repository import BaseRepository, user_count_scope
+from app.repositories.reference_data_repository import (
+    ReferenceDataRepository,
+    ReferenceRow,
+    resolve_difficulty_level_row,
+    resolve_language_row,
+)
+
+ORM_LESSON_INSERT = "orm"
+BULK_LESSON_INSERT = "bulk"
 
 
 @dataclass
@@ -36,27 +56,53 @@ class CreateWithCategoryResponse:
     learning_language: str
 
 
-def check_difficulty_lesson(db: Session, difficult_name: str) -> int:
-    difficult_level: Optional[DifficultyLevels] = (
-        db.query(DifficultyLevels)
-        .filter(DifficultyLevels.name == difficult_name.upper())
-        .first()
-    )
-    if not difficult_level:
-        raise InvalidLessonLevel(difficult_name)
-    return difficult_level.id
+@dataclass
+class PopularLesson:
+    category: str
+    learning_language: str
+    translated_language: str
+    level: str
+    lessons: int
 
 
-def check_language(db: Session, language_name: str) -> int:
-    language: Optional[Language] = (
-        db.query(Language)
-        .filter(Language.language_name == language_name.upper())
-        .first()
-    )
+LessonIds = Dict[Any, Iterator[int]]
 
-    if not language:
-        raise InvalidLanguage(language_name)
-    return language.id
+LESSON_MODELS = (
+    VocabularyPrompt,
+    VocabularyPromptTranslation,
+    VocabularyQuestion,
+    VocabularyQuestionTranslation,
+    VocabularyAnswer,
+    VocabularyAnswerTranslation,
+)
+
+
+def lesson_row_counts(prompt_create: VocabularyPromptCreate) -> Dict[Any, int]:
+    questions = len(prompt_create.questions)
+    answers = sum(len(question.answers) for question in prompt_create.questions)
+    return dict(zip(LESSON_MODELS, (1, 1, questions, questions, answers, answers)))
+
+
+def reserve_ids(dialect: str, model: Any, count: int) -> Any:
+    """A scalar subquery reserving ``count`` ids of the table of ``model``, to
+    be read back with :func:`reserved_ids`."""
+    if dialect == "postgresql":
+        sequence = func.pg_get_serial_sequence(model.__tablename__, "id")
+        return (
+            select(func.array_agg(func.nextval(sequence)))
+            .select_from(func.generate_series(1, count))
+            .scalar_subquery()
+        )
+    # SQLite, which the tests run on, has no sequences. Its only writer holds
+    # the database lock until the commit, so the ids after the last one are free.
+    return select(func.coalesce(func.max(model.id), 0)).scalar_subquery()
+
+
+def reserved_ids(dialect: str, value: Any, count: int) -> Iterator[int]:
+    if dialect == "postgresql":
+        # array_agg over no rows is NULL
+        return iter(value or [])
+    return iter(range(value + 1, value + 1 + count))
 
 
 def parse_question_answers(
@@ -64,104 +110,423 @@ def parse_question_answers(
     prompt_create: VocabularyPromptCreate,
     learning_language_id: int,
     translated_language_id: int,
+    ids: LessonIds,
+    now: datetime,
 ) -> QuestionWithAnswers:
     questions = []
     answers = []
 
     for question in prompt_create.questions:
         vocabulary_question = VocabularyQuestion(
+            id=next(ids[VocabularyQuestion]),
             question_text=question.question_text,
             prompt=prompt_model,
+            prompt_id=prompt_model.id,
             language_id=learning_language_id,
+            created_at=now,
+            updated_at=now,
+            is_valid=True,
         )
         vocabulary_translated_question = VocabularyQuestionTranslation(
+            id=next(ids[VocabularyQuestionTranslation]),
             translated_text=question.translation,
             translated_language_id=translated_language_id,
             question=vocabulary_question,
+            question_id=vocabulary_question.id,
         )
         questions.append(vocabulary_question)
         questions.append(vocabulary_translated_question)
 
         for answer in question.answers:
             vocabulary_answer = VocabularyAnswer(
+                id=next(ids[VocabularyAnswer]),
                 answer_text=answer.answer_text,
                 question=vocabulary_question,
+                question_id=vocabulary_question.id,
                 is_correct=answer.is_correct,
                 language_id=learning_language_id,
+                created_at=now,
+                updated_at=now,
             )
             vocabulary_translated_answer = VocabularyAnswerTranslation(
+                id=next(ids[VocabularyAnswerTranslation]),
                 translated_text=answer.translation,
                 translated_language_id=translated_language_id,
                 answer=vocabulary_answer,
+                answer_id=vocabulary_answer.id,
             )
             answers.append(vocabulary_answer)
             answers.append(vocabulary_translated_answer)
     return QuestionWithAnswers(questions=questions, answers=answers)
 
 
+def build_lesson_rows(
+    prompt_create: VocabularyPromptCreate,
+    ids: LessonIds,
+    category_id: int,
+    difficulty_level_id: int,
+    learning_language_id: int,
+    translated_language_id: int,
+) -> VocabularyPrompt:
+    """Build the rows of a lesson, not added to any session, with their ids and
+    timestamps set so the lesson document can be built before they are stored.
+    """
+    now = datetime.now(timezone.utc)
+    prompt = VocabularyPrompt(
+        id=next(ids[VocabularyPrompt]),
+        prompt=prompt_create.prompt,
+        category_id=category_id,
+        difficulty_level_id=difficulty_level_id,
+        language_id=learning_language_id,
+        created_at=now,
+        updated_at=now,
+        is_valid=True,
+    )
+    VocabularyPromptTranslation(
+        id=next(ids[VocabularyPromptTranslation]),
+        translated_language_id=translated_language_id,
+        translated_text=prompt_create.translation,
+        prompt=prompt,
+        prompt_id=prompt.id,
+    )
+    parse_question_answers(
+        prompt, prompt_create, learning_language_id, translated_language_id, ids, now
+    )
+    return prompt
+
+
+def insert_lesson_rows(session: Session, prompt: VocabularyPrompt) -> None:
+    """Insert the rows built by :func:`build_lesson_rows` with one multi-row
+    INSERT per table.
+
+    The ids are already set, so no row is read back with ``RETURNING`` and the
+    lesson document goes in with the prompt.
+    """
+    questions = list(prompt.questions)
+    answers = [answer for question in questions for answer in question.answers]
+    for rows in (
+        [prompt],
+        prompt.translations,
+        questions,
+        [
+            translation
+            for question in questions
+            for translation in question.translations
+        ],
+        answers,
+        [translation for answer in answers for translation in answer.translations],
+    ):
+        # An empty executemany is an error, a lesson may come without questions
+        if rows:
+            session.execute(insert(type(rows[0])), [_columns(row) for row in rows])
+
+
+def _columns(obj: Any, exclude: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    return {
+        column.key: getattr(obj, column.key)
+        for column in sa_inspect(obj).mapper.column_attrs
+        if column.key not in exclude
+    }
+
+
+def build_lesson_document(
+    prompt: VocabularyPrompt,
+    language: Optional[ReferenceRow] = None,
+    difficulty_level: Optional[ReferenceRow] = None,
+    translated_language: Optional[ReferenceRow] = None,
+) -> Dict[str, Any]:
+    """Serialize the child tree of a prompt the way the history endpoint
+    returned the ORM objects, so reading the document keeps the same JSON.
+
+    The language and difficulty level rows not given are loaded from the
+    relationships of the prompt.
+    """
+    return jsonable_encoder(
+        {
+            "language": language or _columns(prompt.language),
+            "difficulty_level": difficulty_level or _columns(prompt.difficulty_level),
+            "translations": [
+                {
+                    **_columns(translation),
+                    "translated_language": translated_language
+                    or _columns(translation.translated_language),
+                }
+                for translation in prompt.translations
+            ],
+            "questions": [
+                {
+                    **_columns(question),
+                    "translations": [
+                        _columns(translation) for translation in question.translations
+                    ],
+                    "answers": [
+                        {
+                            **_columns(answer),
+                            "translations": [
+                                _columns(translation)
+                                for translation in answer.translations
+                            ],
+                        }
+                        for answer in question.answers
+                    ],
+                }
+                for question in prompt.questions
+            ],
+        }
+    )
+
+
+def lesson_item(prompt: VocabularyPrompt) -> Dict[str, Any]:
+    return {
+        **jsonable_encoder(_columns(prompt, exclude=("lesson_document",))),
+        **prompt.lesson_document,
+    }
+
+
+def _load_lesson_trees(session: Session, prompt_ids: List[int]) -> None:
+    session.query(VocabularyPrompt).filter(VocabularyPrompt.id.in_(prompt_ids)).options(
+        joinedload(VocabularyPrompt.language),
+        joinedload(VocabularyPrompt.difficulty_level),
+        selectinload(VocabularyPrompt.translations).joinedload(
+            VocabularyPromptTranslation.translated_language
+        ),
+        selectinload(VocabularyPrompt.questions).options(
+            selectinload(VocabularyQuestion.translations),
+            selectinload(VocabularyQuestion.answers).selectinload(
+                VocabularyAnswer.translations
+            ),
+        ),
+    ).all()
+
+
 class VocabularyRepository(
     BaseRepository[VocabularyPrompt, VocabularyPromptCreate, Any]
 ):
-    # TODO: Refactor this code like Minh comment in the discussion here
-    #  https://github.com/Sensay-AI/core-service/pull/9#discussion_r1306123877
-    def create_with_category(
-        self, prompt_create: VocabularyPromptCreate, user_id: str
+    def __init__(
+        self,
+        model: type[VocabularyPrompt],
+        session_factory: Callable[..., AbstractContextManager[Session]],
+        async_session_factory: Optional[
+            Callable[..., AbstractAsyncContextManager[AsyncSession]]
+        ] = None,
+        count_strategy: str = QUERY_COUNT,
+        count_cache: Optional[CountCache] = None,
+        reference_data: Optional[ReferenceDataRepository] = None,
+        lesson_insert_mode: str = ORM_LESSON_INSERT,
+    ):
+        super().__init__(
+            model, session_factory, async_session_factory, count_strategy, count_cache
+        )
+        if lesson_insert_mode not in (ORM_LESSON_INSERT, BULK_LESSON_INSERT):
+            raise InvalidLessonInsertMode(lesson_insert_mode)
+        self.reference_data = reference_data
+        self.lesson_insert_mode = lesson_insert_mode
+
+    def _create_with_category(
+        self, session: Session, prompt_create: VocabularyPromptCreate, user_id: str
     ) -> CreateWithCategoryResponse:
-        self.logger.debug("Create voca lesson with category")
-        with self.session_factory() as session:
-            stmt = (
-                insert(Category)
-                .values(category_name=prompt_create.category, user_id=user_id)
-                .on_conflict_do_update(
-                    index_elements=["category_name", "user_id"],
-                    set_={"category_name": prompt_create.category},
+        # The category upsert also reserves the ids of every row of the lesson,
+        # so the lesson document is built before the INSERTs and stored with
+        # the prompt instead of by an UPDATE after them.
+        dialect = session.get_bind().dialect.name
+        counts = lesson_row_counts(prompt_create)
+        stmt = (
+            insert(Category)
+            .values(category_name=prompt_create.category, user_id=user_id)
+            .on_conflict_do_update(
+                index_elements=["category_name", "user_id"],
+                set_={"category_name": prompt_create.category},
+            )
+            .returning(
+                Category.id,
+                *(
+                    reserve_ids(dialect, model, count)
+                    for model, count in counts.items()
+                ),
+            )
+        )
+        insert_id, *reserved = session.execute(stmt).one()
+        ids = {
+            model: reserved_ids(dialect, value, count)
+            for (model, count), value in zip(counts.items(), reserved)
+        }
+
+        learning_language = resolve_language_row(
+            session, prompt_create.learning_language, self.reference_data
+        )
+        translated_language = resolve_language_row(
+            session, prompt_create.translated_language, self.reference_data
+        )
+        difficulty_level = resolve_difficulty_level_row(
+            session, prompt_create.difficulty_level, self.reference_data
+        )
+
+        prompt_obj = build_lesson_rows(
+            prompt_create,
+            ids,
+            insert_id,
+            difficulty_level["id"],
+            learning_language["id"],
+            translated_language["id"],
+        )
+        prompt_obj.lesson_document = build_lesson_document(
+            prompt_obj, learning_language, difficulty_level, translated_language
+        )
+        if self.lesson_insert_mode == BULK_LESSON_INSERT:
+            insert_lesson_rows(session, prompt_obj)
+        else:
+            # The relationships cascade the whole lesson into the session
+            session.add(prompt_obj)
+        session.commit()
+        # Categories are counted per user too, the table scope only holds
+        # the totals over every user
+        self.invalidate_counts(user_count_scope(user_id))
+        self.invalidate_counts(Category.__tablename__)
+
+        return CreateWithCategoryResponse(insert_id, prompt_create.learning_language)
+
+    def _create_many_with_category(
+        self, session: Session, lessons: List[Tuple[VocabularyPromptCreate, str]]
+    ) -> List[Union[CreateWithCategoryResponse, Exception]]:
+        results: List[Union[CreateWithCategoryResponse, Exception]] = []
+        for prompt_create, user_id in lessons:
+            try:
+                results.append(
+                    self._create_with_category(session, prompt_create, user_id)
+                )
+            except Exception as e:
+                # Only this lesson is lost, the next ones use the same session
+                session.rollback()
+                self.logger.warning(f"Can not store a lesson of {user_id}: {e}")
+                results.append(e)
+        return results
+
+    def _get_history_questions(
+        self,
+        session: Session,
+        question_input: GetVocabularyHistoryQuestion,
+        user_id: str,
+        page: int,
+        size: int,
+        cursor: Optional[str] = None,
+        include_total: bool = True,
+    ) -> PagedResponseSchema[VocabularyPrompt]:
+        # Items are served from the denormalized lesson document, the page
+        # query reads the prompt rows only and never hydrates the children.
+        query = (
+            session.query(VocabularyPrompt)
+            .join(Category)
+            .join(Language)
+            .filter(
+                and_(
+                    Category.id == question_input.category_id,
+                    Category.user_id == user_id,
+                    Language.language_name == question_input.learning_language.upper(),
+                    VocabularyPrompt.is_valid,
                 )
-                .returning(Category.id)
             )
-            result = session.execute(stmt)
-            insert_id = result.fetchone()[0]
+        )
+        count = self.page_count(
+            user_count_scope(user_id),
+            f"{question_input.category_id}:{question_input.learning_language.upper()}",
+            include_total,
+        )
+        result = paginate(page, size, query, self.keyset, cursor, count)
 
-            learning_language_id = check_language(
-                session, prompt_create.learning_language
+        # Lessons written before the document existed are rebuilt in memory
+        # until they are backfilled (see rebuild_lesson_documents).
+        missing = [prompt for prompt in result.items if prompt.lesson_document is None]
+        if missing:
+            _load_lesson_trees(session, [prompt.id for prompt in missing])
+            for prompt in missing:
+                set_committed_value(
+                    prompt, "lesson_document", build_lesson_document(prompt)
+                )
+        result.items = [lesson_item(prompt) for prompt in result.items]
+        return result
+
+    def _get_popular_lessons(
+        self, session: Session, since: datetime, limit: int
+    ) -> List[PopularLesson]:
+        translated_language = aliased(Language)
+        category_name = func.lower(Category.category_name)
+        lessons = func.count(VocabularyPrompt.id)
+        rows = (
+            session.query(
+                category_name,
+                Language.language_name,
+                translated_language.language_name,
+                DifficultyLevels.name,
+                lessons,
             )
-            translated_language_id = check_language(
-                session, prompt_create.translated_language
+            .select_from(VocabularyPrompt)
+            .join(Category)
+            .join(Language, VocabularyPrompt.language_id == Language.id)
+            .join(DifficultyLevels)
+            .join(VocabularyPrompt.translations)
+            .join(
+                translated_language,
+                VocabularyPromptTranslation.translated_language_id
+                == translated_language.id,
             )
-
-            difficult_level_id = check_difficulty_lesson(
-                session, prompt_create.difficulty_level
+            .filter(VocabularyPrompt.created_at >= since)
+            .group_by(
+                category_name,
+                Language.language_name,
+                translated_language.language_name,
+                DifficultyLevels.name,
             )
+            .order_by(lessons.desc())
+            .limit(limit)
+        )
+        return [PopularLesson(*row) for row in rows]
 
-            prompt_obj = VocabularyPrompt(
-                prompt=prompt_create.prompt,
-                category_id=insert_id,
-                difficulty_level_id=difficult_level_id,
-                language_id=learning_language_id,
-            )
+    def _rebuild_lesson_documents(self, session: Session, batch_size: int) -> int:
+        prompt_ids = [
+            id
+            for (id,) in session.query(VocabularyPrompt.id)
+            .filter(VocabularyPrompt.lesson_document.is_(None))
+            .order_by(VocabularyPrompt.id)
+            .limit(batch_size)
+        ]
+        if not prompt_ids:
+            return 0
+        _load_lesson_trees(session, prompt_ids)
+        for prompt_id in prompt_ids:
+            prompt = session.get(VocabularyPrompt, prompt_id)
+            prompt.lesson_document = build_lesson_document(prompt)
+        session.commit()
+        return len(prompt_ids)
 
-            translated_prompt_obj = VocabularyPromptTranslation(
-                translated_language_id=translated_language_id,
-                translated_text=prompt_create.translation,
-                prompt=prompt_obj,
-            )
+    def get_popular_lessons(self, since: datetime, limit: int) -> List[PopularLesson]:
+        """Most generated (category, languages, level) combinations since `since`."""
+        return self.run_read(self._get_popular_lessons, since, limit)
 
-            session.add(prompt_obj)
-            session.add(translated_prompt_obj)
+    def rebuild_lesson_documents(self, batch_size: int = 100) -> int:
+        """Write the lesson document of up to `batch_size` prompts without one,
+        returns how many were written."""
+        return self.run(self._rebuild_lesson_documents, batch_size)
 
-            questions_with_answers = parse_question_answers(
-                prompt_obj,
-                prompt_create,
-                learning_language_id,
-                translated_language_id,
-            )
+    # TODO: Refactor this code like Minh comment in the discussion here
+    #  https://github.com/Sensay-AI/core-service/pull/9#discussion_r1306123877
+    def create_with_category(
+        self, prompt_create: VocabularyPromptCreate, user_id: str
+    ) -> CreateWithCategoryResponse:
+        self.logger.debug("Create voca lesson with category")
+        return self.run(self._create_with_category, prompt_create, user_id)
 
-            session.add_all(questions_with_answers.questions)
-            session.add_all(questions_with_answers.answers)
-            session.commit()
+    async def create_with_category_async(
+        self, prompt_create: VocabularyPromptCreate, user_id: str
+    ) -> CreateWithCategoryResponse:
+        self.logger.debug("Create voca lesson with category")
+        return await self.run_async(self._create_with_category, prompt_create, user_id)
 
-            return CreateWithCategoryResponse(
-                insert_id, prompt_create.learning_language
-            )
+    def create_many_with_category(
+        self, lessons: List[Tuple[VocabularyPromptCreate, str]]
+    ) -> List[Union[CreateWithCategoryResponse, Exception]]:
+        """Store (lesson, user id) pairs in one session, each lesson in its
+        own transaction: the result of a lesson which failed is its error."""
+        return self.run(self._create_many_with_category, lessons)
 
     def get_history_questions(
         self,
@@ -169,45 +534,42 @@ class VocabularyRepository(
         user_id: str,
         page: int,
         size: int,
+        cursor: Optional[str] = None,
+        include_total: bool = True,
     ) -> PagedResponseSchema[VocabularyPrompt]:
-        with self.session_factory() as session:
-            query = (
-                session.query(VocabularyPrompt)
-                .join(Category)
-                .join(Language)
-                .join(DifficultyLevels)
-                .options(
-                    joinedload(VocabularyPrompt.language),
-                    joinedload(VocabularyPrompt.difficulty_level),
-                    joinedload(VocabularyPrompt.translations).joinedload(
-                        VocabularyPromptTranslation.translated_language
-                    ),
-                    joinedload(VocabularyPrompt.questions).options(
-                        joinedload(VocabularyQuestion.translations),
-                        joinedload(VocabularyQuestion.answers).joinedload(
-                            VocabularyAnswer.translations
-                        ),
-                    ),
-                )
-                .filter(
-                    and_(
-                        Category.id == question_input.category_id,
-                        Category.user_id == user_id,
-                        Language.language_name
-                        == question_input.learning_language.upper(),
-                        VocabularyPrompt.is_valid,
-                    )
-                )
-                .order_by(VocabularyPrompt.created_at.desc())
-            )
-            return paginate(page, size, query)
-
+        return self.run_read(
+            self._get_history_questions,
+            question_input,
+            user_id,
+            page,
+            size,
+            cursor,
+            include_total,
+        )
 
-class InvalidLanguage(Exception):
-    def __init__(self, language: str):
-        super().__init__(f"Invalid language name: {language} !!!")
+    async def get_history_questions_async(
+        self,
+        question_input: GetVocabularyHistoryQuestion,
+        user_id: str,
+        page: int,
+        size: int,
+        cursor: Optional[str] = None,
+        include_total: bool = True,
+    ) -> PagedResponseSchema[VocabularyPrompt]:
+        return await self.run_read_async(
+            self._get_history_questions,
+            question_input,
+            user_id,
+            page,
+            size,
+            cursor,
+            include_total,
+        )
 
 
-class InvalidLessonLevel(Exception):
-    def __init__(self, language: str):
-        super().__init__(f"Invalid lesson level: {language} !!!")
+class InvalidLessonInsertMode(Exception):
+    def __init__(self, lesson_insert_mode: str):
+        super().__init__(
+            f"Invalid lesson insert mode: {lesson_insert_mode}, "
+            f"only accept value: <'{ORM_LESSON_INSERT}','{BULK_LESSON_INSERT}'>"
+        )
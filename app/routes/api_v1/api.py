@@ -5,6 +5,8 @@ from app.routes.api_v1.endpoints import (
     difficulty_level,
     image,
     language,
+    metrics,
+    persistence,
     user,
     vocabulary,
 )
@@ -22,3 +24,5 @@ router.include_router(
     prefix="/lesson/difficulty_level",
     tags=["difficulty_level"],
 )
+router.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
+router.include_router(persistence.router, prefix="/persistence", tags=["persistence"])
@@ -1,7 +1,7 @@
 import logging
 
 from dependency_injector.wiring import Provide, inject
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
 from app.container.containers import Container
@@ -11,6 +11,9 @@ from app.models.schemas.users import Auth0User
 logger = logging.getLogger()
 router = APIRouter()
 
+# The permission of the operators allowed to read the service metrics
+METRICS_PERMISSION = "read:metrics"
+
 
 @router.post("/")
 @inject
@@ -19,3 +22,12 @@ def check_user(
     auth_service: Auth0Service = Depends(Provide[Container.auth]),
 ) -> Auth0User:
     return auth_service.verify_token(token.credentials)
+
+
+def check_metrics_reader(user: Auth0User = Depends(check_user)) -> Auth0User:
+    if METRICS_PERMISSION not in (user.permissions or []):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"The {METRICS_PERMISSION} permission is required",
+        )
+    return user
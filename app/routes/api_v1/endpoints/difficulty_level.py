@@ -5,7 +5,6 @@ from fastapi import APIRouter, Depends
 
 from app.container.containers import Container
 from app.models.common.pagination import PageParams
-from app.models.db.difficulty_levels import DifficultyLevels
 from app.routes.api_v1.endpoints.auth import check_user
 from app.services.base_service import BaseService
 
@@ -22,8 +21,11 @@ async def get_all_difficulty_lesson_level(
     ),
     _: Any = Depends(check_user),
 ) -> object:
-    return difficulty_levels.get_multi(
+    # Newest first through the (created_at, id) keyset of get_multi, an
+    # explicit sort_by would only allow offset pages.
+    return await difficulty_levels.get_multi(
         page=page_params.page,
         size=page_params.size,
-        sort_by=DifficultyLevels.created_at.desc(),
+        cursor=page_params.cursor,
+        include_total=page_params.include_total,
     )
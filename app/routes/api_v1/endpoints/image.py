@@ -1,12 +1,12 @@
 import io
 import pathlib
+import uuid
 from http import HTTPStatus
 from io import BytesIO
 from typing import Dict, List
 
 from dependency_injector.wiring import Provide, inject
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, status
-from fastapi.responses import StreamingResponse
 from PIL import Image, UnidentifiedImageError
 
 from app.container.containers import Container
@@ -18,6 +18,7 @@ from app.infrastructure.aws.s3 import (
 from app.models.schemas.image_caption import ImageCaptionRequest
 from app.models.schemas.users import Auth0User
 from app.routes.api_v1.endpoints.auth import check_user
+from app.services.admission import AdmissionController, AdmittedResponse
 from app.services.caption_service import CaptionService
 
 #
@@ -88,6 +89,9 @@ async def generate_caption(
     auth: Auth0User = Depends(check_user),
     s3_service: S3Service = Depends(Provide[Container.s3_service]),
     caption_service: CaptionService = Depends(Provide[Container.caption_service]),
+    admission_controller: AdmissionController = Depends(
+        Provide[Container.admission_controller]
+    ),
 ) -> object:
     image_file = s3_service.get_file(
         file_path=input_data.image_bucket_path_key,
@@ -99,9 +103,19 @@ async def generate_caption(
         "path": input_data.image_bucket_path_key,
         **input_data.dict(),
     }
-    return StreamingResponse(
-        caption_service.get_caption_from_image(
-            user_id=auth.id, caption_input=caption_input
+    # The caption is stored in the background, its status is looked up with
+    # the persistence id sent before the caption
+    persistence_id = (
+        uuid.uuid4().hex if caption_service.persistence_queue is not None else None
+    )
+    await admission_controller.acquire(auth.id)
+    return AdmittedResponse(
+        admission_controller,
+        caption_service.get_caption_from_image_async(
+            user_id=auth.id,
+            caption_input=caption_input,
+            persistence_id=persistence_id,
         ),
         media_type="text/plain",
+        headers={"X-Persistence-Id": persistence_id} if persistence_id else None,
     )
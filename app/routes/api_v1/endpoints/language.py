@@ -5,7 +5,6 @@ from fastapi import APIRouter, Depends
 
 from app.container.containers import Container
 from app.models.common.pagination import PageParams
-from app.models.db.language import Language
 from app.routes.api_v1.endpoints.auth import check_user
 from app.services.base_service import BaseService
 
@@ -20,6 +19,11 @@ async def get_supported_languages(
     language_service: BaseService = Depends(Provide[Container.language_service]),
     _: Any = Depends(check_user),
 ) -> object:
-    return language_service.get_multi(
-        page=page_params.page, size=page_params.size, sort_by=Language.created_at.desc()
+    # Newest first through the (created_at, id) keyset of get_multi, an
+    # explicit sort_by would only allow offset pages.
+    return await language_service.get_multi(
+        page=page_params.page,
+        size=page_params.size,
+        cursor=page_params.cursor,
+        include_total=page_params.include_total,
     )
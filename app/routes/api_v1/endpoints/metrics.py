@@ -0,0 +1,34 @@
+from typing import Any
+
+from dependency_injector.wiring import Provide, inject
+from fastapi import APIRouter, Depends, Query
+
+from app.container.containers import Container
+from app.infrastructure.metrics.metrics import MetricsRegistry
+from app.routes.api_v1.endpoints.auth import check_metrics_reader
+from app.services.usage_service import UsageService
+
+router = APIRouter()
+
+
+@router.get("/")
+@inject
+async def get_metrics(
+    *,
+    metrics: MetricsRegistry = Depends(Provide[Container.metrics]),
+    _: Any = Depends(check_metrics_reader),
+) -> object:
+    return metrics.snapshot()
+
+
+@router.get("/usage")
+@inject
+async def get_llm_usage(
+    *,
+    hours: float = Query(24, gt=0, description="Window of the usage, in hours"),
+    usage_service: UsageService = Depends(Provide[Container.usage_service]),
+    _: Any = Depends(check_metrics_reader),
+) -> object:
+    """LLM calls of all users grouped by endpoint, level and lesson shape, the
+    most expensive first."""
+    return {"items": await usage_service.get_usage(hours)}
@@ -0,0 +1,36 @@
+from dependency_injector.wiring import Provide, inject
+from fastapi import APIRouter, Depends, HTTPException, status
+from starlette.concurrency import run_in_threadpool
+
+from app.container.containers import Container
+from app.models.schemas.users import Auth0User
+from app.routes.api_v1.endpoints.auth import check_user
+from app.services.persistence_queue import PersistenceQueue
+
+router = APIRouter()
+
+
+@router.get("/{persistence_id}")
+@inject
+async def get_persistence_status(
+    persistence_id: str,
+    persistence_queue: PersistenceQueue = Depends(Provide[Container.persistence_queue]),
+    auth: Auth0User = Depends(check_user),
+) -> object:
+    """Whether a lesson or caption streamed with this persistence id is
+    stored yet, with its stored ids once it is."""
+    # The job of another worker is read from the database
+    job = await run_in_threadpool(persistence_queue.status, persistence_id)
+    if job is None or job.user_id != auth.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Unknown persistence id, it may be stored for too long to be tracked",
+        )
+    return {
+        "persistence_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "result": job.result,
+        "error": job.error,
+    }
@@ -1,13 +1,14 @@
 import logging
 
 from dependency_injector.wiring import Provide, inject
-from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 
 from app.container.containers import Container
 from app.models.db.users import UserInfo
 from app.models.schemas.users import Auth0User, UserUpdate
 from app.repositories.user_repository import NotFoundError, NotUniqueError
 from app.routes.api_v1.endpoints.auth import check_user
+from app.services.usage_service import UsageService
 from app.services.user_service import UserService
 
 router = APIRouter()
@@ -22,7 +23,7 @@ async def get_user_profile(
     auth: Auth0User = Depends(check_user),
 ) -> object:
     try:
-        return user_service.get_user_by_id(auth.id)
+        return await user_service.get_user_by_id(auth.id)
     except NotFoundError:
         return Response(
             "User not found or maybe new user", status_code=status.HTTP_404_NOT_FOUND
@@ -31,31 +32,42 @@ async def get_user_profile(
 
 @router.post("/create")
 @inject
-def create_user_profile(
+async def create_user_profile(
     user_input: UserUpdate,
     user_service: UserService = Depends(Provide[Container.user_service]),
     auth: Auth0User = Depends(check_user),
 ) -> object:
     logger.debug(f"Start create_user_profile with input: {user_input}")
     try:
-        return user_service.create_user(user_info_from(auth, user_input))
+        return await user_service.create_user(user_info_from(auth, user_input))
     except NotUniqueError as e:
         return HTTPException(status_code=10001, detail=e.__str__())
 
 
 @router.put("/update")
 @inject
-def update_user_profile(
+async def update_user_profile(
     user_input: UserUpdate,
     user_service: UserService = Depends(Provide[Container.user_service]),
     auth: Auth0User = Depends(check_user),
 ) -> object:
     try:
-        return user_service.update_user(user_info_from(auth, user_input))
+        return await user_service.update_user(user_info_from(auth, user_input))
     except NotUniqueError as e:
         return HTTPException(status_code=10001, detail=e.__str__())
 
 
+@router.get("/usage")
+@inject
+async def get_user_llm_usage(
+    *,
+    hours: float = Query(24 * 30, gt=0, description="Window of the usage, in hours"),
+    usage_service: UsageService = Depends(Provide[Container.usage_service]),
+    auth: Auth0User = Depends(check_user),
+) -> object:
+    return {"items": await usage_service.get_usage(hours, user_id=auth.id)}
+
+
 def user_info_from(auth: Auth0User, user_input: UserUpdate) -> UserInfo:
     return UserInfo(
         user_id=auth.id,
@@ -8,16 +8,31 @@ from app.models.db.vocabulary import Category
 from app.models.schemas.users import Auth0User
 from app.models.schemas.vocabulary import (
     DIFFICULT_LEVELS,
+    NDJSON_STREAM,
+    SSE_STREAM,
+    STREAM_MEDIA_TYPES,
     GetVocabularyHistoryQuestion,
+    GetVocabularyLessonBatch,
     GetVocabularyQuestions,
 )
+from app.repositories.base_repository import user_count_scope
 from app.routes.api_v1.endpoints.auth import check_user
+from app.services.admission import AdmissionController, AdmittedResponse
 from app.services.base_service import BaseService
 from app.services.vocabulary_service import PromptParserException, VocabularyService
 
 router = APIRouter()
 
 
+def invalid_shape(vocabulary_service: VocabularyService) -> HTTPException:
+    return HTTPException(
+        status_code=10006,
+        detail="Invalid lesson shape, only accept value: "
+        f"<1..{vocabulary_service.max_questions} questions of "
+        f"1..{vocabulary_service.max_answers} answers>",
+    )
+
+
 def get_backward_compatibility(
     user_input: GetVocabularyQuestions,
 ) -> GetVocabularyQuestions:
@@ -41,6 +56,9 @@ async def create_vocabulary_question(
         Provide[Container.vocabulary_service]
     ),
     auth: Auth0User = Depends(check_user),
+    admission_controller: AdmissionController = Depends(
+        Provide[Container.admission_controller]
+    ),
 ) -> object:
     try:
         if user_input.level_type not in DIFFICULT_LEVELS.values():
@@ -48,17 +66,91 @@ async def create_vocabulary_question(
                 status_code=10003,
                 detail="Invalid level type, only accept value: <'EASY,'INTERMEDIATE','ADVANCED'>",
             )
+        if user_input.stream_format not in STREAM_MEDIA_TYPES:
+            return HTTPException(
+                status_code=10004,
+                detail="Invalid stream format, only accept value: <'text','ndjson','sse'>",
+            )
+        if not vocabulary_service.valid_shape(
+            user_input.num_questions, user_input.num_answers
+        ):
+            return invalid_shape(vocabulary_service)
 
-        return StreamingResponse(
-            vocabulary_service.get_new_vocabulary_lessons(
-                user_id=auth.id, user_input=get_backward_compatibility(user_input)
-            ),
-            media_type="text/plain",
+        user_input = get_backward_compatibility(user_input)
+        ready = vocabulary_service.ready_lesson(user_input)
+        lesson = vocabulary_service.get_new_vocabulary_lessons_async(
+            user_id=auth.id, user_input=user_input, ready=ready
         )
+        media_type = STREAM_MEDIA_TYPES[user_input.stream_format]
+        if ready[0] is not None:
+            # A replayed lesson does not call the LLM, it is not admitted
+            return StreamingResponse(lesson, media_type=media_type)
+        await admission_controller.acquire(auth.id)
+        return AdmittedResponse(admission_controller, lesson, media_type=media_type)
     except PromptParserException as e:
         return HTTPException(status_code=10002, detail=e.__str__())
 
 
+@router.post("/question/batch")
+@inject
+async def create_vocabulary_question_batch(
+    *,
+    batch: GetVocabularyLessonBatch,
+    vocabulary_service: VocabularyService = Depends(
+        Provide[Container.vocabulary_service]
+    ),
+    auth: Auth0User = Depends(check_user),
+    admission_controller: AdmissionController = Depends(
+        Provide[Container.admission_controller]
+    ),
+) -> object:
+    # A user is charged a generation per lesson, a batch can not ask for
+    # more than the bucket of the user holds
+    max_lessons = min(
+        vocabulary_service.batch_max_lessons,
+        admission_controller.max_user_generations
+        or vocabulary_service.batch_max_lessons,
+    )
+    if not 0 < len(batch.lessons) <= max_lessons:
+        return HTTPException(
+            status_code=10005,
+            detail=f"Invalid number of lessons, only accept value: <1..{max_lessons}>",
+        )
+    if any(
+        lesson.level_type not in DIFFICULT_LEVELS.values() for lesson in batch.lessons
+    ):
+        return HTTPException(
+            status_code=10003,
+            detail="Invalid level type, only accept value: <'EASY,'INTERMEDIATE','ADVANCED'>",
+        )
+    if batch.stream_format not in (NDJSON_STREAM, SSE_STREAM):
+        return HTTPException(
+            status_code=10004,
+            detail="Invalid stream format, only accept value: <'ndjson','sse'>",
+        )
+    if not all(
+        vocabulary_service.valid_shape(lesson.num_questions, lesson.num_answers)
+        for lesson in batch.lessons
+    ):
+        return invalid_shape(vocabulary_service)
+
+    # Each lesson takes its own slot, the lessons which never run are refunded
+    admission_controller.charge_user(auth.id, len(batch.lessons))
+    lessons = [
+        GetVocabularyQuestions(**lesson.dict(), stream_format=batch.stream_format)
+        for lesson in batch.lessons
+    ]
+    return StreamingResponse(
+        vocabulary_service.get_new_vocabulary_lesson_batch_async(
+            user_id=auth.id,
+            lessons=lessons,
+            stream_format=batch.stream_format,
+            admission=admission_controller,
+        ),
+        media_type=STREAM_MEDIA_TYPES[batch.stream_format],
+    )
+
+
 @router.get("/categories")
 @inject
 async def list_categories(
@@ -67,11 +159,13 @@ async def list_categories(
     category_service: BaseService = Depends(Provide[Container.category_service]),
     auth: Auth0User = Depends(check_user),
 ) -> object:
-    return category_service.query(
+    return await category_service.query(
         query=Category.user_id == auth.id,
         page=page_params.page,
         size=page_params.size,
-        sort_by=Category.created_at.desc(),
+        cursor=page_params.cursor,
+        include_total=page_params.include_total,
+        count_scope=user_count_scope(auth.id),
     )
 
 
@@ -89,9 +183,11 @@ async def list_questions(
     user_input = GetVocabularyHistoryQuestion(
         category_id=category_id, learning_language=learning_language
     )
-    return vocabulary_service.get_history_lessons(
+    return await vocabulary_service.get_history_lessons(
         user_id=auth.id,
         user_input=user_input,
         page=page_params.page,
         size=page_params.size,
+        cursor=page_params.cursor,
+        include_total=page_params.include_total,
     )
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app.infrastructure.metrics.metrics import MetricsRegistry
+
+# Idle user buckets are pruned once the map grows past this size
+MAX_USER_BUCKETS = 10000
+QUEUE_FULL = "queue_full"
+QUEUE_TIMEOUT = "queue_timeout"
+USER_RATE = "user_rate"
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int) -> None:
+        super().__init__(
+            f"Too many generation requests ({reason}), retry after {retry_after} seconds"
+        )
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bound the LLM generations running at once in this worker.
+
+    A request first takes a token from the bucket of its user, which holds up
+    to `user_burst` tokens and gains one every `user_refill_seconds`. It then
+    takes one of the `max_concurrent` generation slots, or waits for one in a
+    queue of at most `max_queue` requests for up to `queue_timeout` seconds.
+    A rejected request gets the seconds to wait before retrying. A
+    `max_concurrent` or `user_burst` of 0 disables that limit.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 8,
+        max_queue: int = 32,
+        queue_timeout: float = 10,
+        user_burst: int = 3,
+        user_refill_seconds: float = 20,
+        metrics: Optional[MetricsRegistry] = None,
+    ) -> None:
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.user_burst = user_burst
+        self.user_refill_seconds = user_refill_seconds
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self._active = 0
+        self._waiters: Deque["asyncio.Future[None]"] = deque()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        # Moving average of how long a generation holds its slot
+        self._hold_time = 0.0
+
+    async def acquire(self, user_id: str) -> None:
+        self.charge_user(user_id)
+        try:
+            await self.acquire_slot()
+        except AdmissionRejected:
+            # The user is not charged for a generation which never ran
+            self.refund_user(user_id)
+            raise
+
+    @property
+    def max_user_generations(self) -> Optional[int]:
+        """The most generations a user can be charged for at once."""
+        return self.user_burst or None
+
+    def charge_user(self, user_id: str, generations: int = 1) -> None:
+        """Take a token per generation from the bucket of the user, all or
+        none, without a slot: each generation of a batch takes its own slot."""
+        self._take_user_tokens(user_id, generations)
+
+    def refund_user(self, user_id: str, generations: int = 1) -> None:
+        bucket = self._buckets.get(user_id)
+        if bucket is not None:
+            self._buckets[user_id] = (bucket[0] + generations, bucket[1])
+
+    async def acquire_slot(self) -> None:
+        if not self.max_concurrent:
+            self.metrics.increment("admission_admitted_total")
+            return
+        started = time.monotonic()
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+        else:
+            await self._wait_for_slot()
+        wait_time = time.monotonic() - started
+        self.metrics.observe("admission_wait_seconds", wait_time)
+        self.metrics.increment("admission_admitted_total")
+        self._publish()
+
+    def release(self, held_for: Optional[float] = None) -> None:
+        if not self.max_concurrent:
+            return
+        if held_for is not None:
+            self._hold_time = (
+                held_for
+                if not self._hold_time
+                else 0.8 * self._hold_time + 0.2 * held_for
+            )
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot goes to the oldest waiter, `_active` is unchanged
+                waiter.set_result(None)
+                self._publish()
+                return
+        self._active -= 1
+        self._publish()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold a generation slot for the body of the block."""
+        await self.acquire_slot()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def _take_user_tokens(self, user_id: str, count: int) -> None:
+        if not self.user_burst:
+            return
+        now = time.monotonic()
+        if len(self._buckets) >= MAX_USER_BUCKETS:
+            self._buckets = {
+                user: bucket
+                for user, bucket in self._buckets.items()
+                if self._tokens(bucket, now) < self.user_burst
+            }
+        tokens = self._tokens(self._buckets.get(user_id), now)
+        if tokens < count:
+            retry_after = (count - tokens) * self.user_refill_seconds
+            self._reject(USER_RATE, retry_after)
+        self._buckets[user_id] = (tokens - count, now)
+
+    def _tokens(self, bucket: Optional[Tuple[float, float]], now: float) -> float:
+        if bucket is None:
+            return self.user_burst
+        tokens, updated = bucket
+        refilled = (now - updated) / self.user_refill_seconds
+        return min(self.user_burst, tokens + refilled)
+
+    async def _wait_for_slot(self) -> None:
+        if len(self._waiters) >= self.max_queue:
+            self._reject(QUEUE_FULL, self._estimated_wait())
+        waiter: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._publish()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except BaseException as e:
+            # Gave up after the slot was handed over, pass it on
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject(QUEUE_TIMEOUT, self._estimated_wait())
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self._publish()
+
+    def _estimated_wait(self) -> float:
+        queued = len(self._waiters) + 1
+        return self._hold_time * queued / self.max_concurrent
+
+    def _reject(self, reason: str, retry_after: float) -> None:
+        self.metrics.increment("admission_rejected_total", labels={"reason": reason})
+        self.logger.debug(f"Reject a generation request: {reason}")
+        raise AdmissionRejected(reason, max(1, math.ceil(retry_after)))
+
+    def _publish(self) -> None:
+        self.metrics.set_gauge("admission_active", self._active)
+        self.metrics.set_gauge("admission_queue_depth", len(self._waiters))
+
+
+class AdmittedResponse(StreamingResponse):
+    """Stream a generation admitted by `AdmissionController.acquire` and free
+    its slot when the response is over.
+
+    The slot is freed by the response rather than by the stream, Starlette
+    never starts the stream of a client which went away before it.
+    """
+
+    def __init__(self, admission: AdmissionController, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.admission = admission
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        started = time.monotonic()
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.admission.release(time.monotonic() - started)
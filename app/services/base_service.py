@@ -2,6 +2,7 @@ import logging
 from typing import Any, Dict, Optional, Union
 
 from sqlalchemy.sql.elements import UnaryExpression
+from starlette.concurrency import run_in_threadpool
 
 from app.models.common.pagination import PagedResponseSchema
 from app.repositories.base_repository import (
@@ -14,42 +15,101 @@ from app.repositories.base_repository import (
 
 class BaseService:
     def __init__(
-        self, repository: BaseRepository[ModelType, CreateSchemaType, UpdateSchemaType]
+        self,
+        repository: BaseRepository[ModelType, CreateSchemaType, UpdateSchemaType],
+        async_mode: bool = False,
     ) -> None:
         self._repository = repository
+        self.async_mode = async_mode
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
 
-    def get(self, model_id: Any) -> PagedResponseSchema[ModelType]:
-        return self._repository.get(model_id)
+    async def get(self, model_id: Any) -> PagedResponseSchema[ModelType]:
+        if self.async_mode:
+            return await self._repository.get_async(model_id)
+        return await run_in_threadpool(self._repository.get, model_id)
 
-    def query(
+    async def query(
         self,
         query: Any,
         page: int,
         size: int,
         sort_by: Optional[UnaryExpression[Any]] = None,
+        cursor: Optional[str] = None,
+        include_total: bool = True,
+        count_scope: Optional[str] = None,
     ) -> PagedResponseSchema[ModelType]:
-        return self._repository.query(
-            query=query, page=page, size=size, sort_by=sort_by
+        if self.async_mode:
+            return await self._repository.query_async(
+                query=query,
+                page=page,
+                size=size,
+                sort_by=sort_by,
+                cursor=cursor,
+                include_total=include_total,
+                count_scope=count_scope,
+            )
+        return await run_in_threadpool(
+            self._repository.query,
+            query=query,
+            page=page,
+            size=size,
+            sort_by=sort_by,
+            cursor=cursor,
+            include_total=include_total,
+            count_scope=count_scope,
         )
 
-    def get_multi(
-        self, page: int, size: int, sort_by: Optional[UnaryExpression[Any]] = None
+    async def get_multi(
+        self,
+        page: int,
+        size: int,
+        sort_by: Optional[UnaryExpression[Any]] = None,
+        cursor: Optional[str] = None,
+        include_total: bool = True,
     ) -> PagedResponseSchema[ModelType]:
-        return self._repository.get_multi(page=page, size=size, sort_by=sort_by)
+        if self.async_mode:
+            return await self._repository.get_multi_async(
+                page=page,
+                size=size,
+                sort_by=sort_by,
+                cursor=cursor,
+                include_total=include_total,
+            )
+        return await run_in_threadpool(
+            self._repository.get_multi,
+            page=page,
+            size=size,
+            sort_by=sort_by,
+            cursor=cursor,
+            include_total=include_total,
+        )
 
-    def create(
+    async def create(
         self, obj_in: CreateSchemaType, commit: bool = True
     ) -> Optional[ModelType]:
-        return self._repository.create(obj_in=obj_in, commit=commit)
+        if self.async_mode:
+            return await self._repository.create_async(obj_in=obj_in, commit=commit)
+        return await run_in_threadpool(
+            self._repository.create, obj_in=obj_in, commit=commit
+        )
 
-    def update(
+    async def update(
         self,
         db_obj: ModelType,
         obj_in: Union[UpdateSchemaType, Dict[str, Any]],
         commit: bool = True,
     ) -> Optional[ModelType]:
-        return self._repository.update(db_obj=db_obj, obj_in=obj_in, commit=commit)
+        if self.async_mode:
+            return await self._repository.update_async(
+                db_obj=db_obj, obj_in=obj_in, commit=commit
+            )
+        return await run_in_threadpool(
+            self._repository.update, db_obj=db_obj, obj_in=obj_in, commit=commit
+        )
 
-    def remove(self, model_id: int, commit: bool = True) -> Optional[ModelType]:
-        return self._repository.remove(id=model_id, commit=commit)
+    async def remove(self, model_id: int, commit: bool = True) -> Optional[ModelType]:
+        if self.async_mode:
+            return await self._repository.remove_async(id=model_id, commit=commit)
+        return await run_in_threadpool(
+            self._repository.remove, id=model_id, commit=commit
+        )
@@ -1,5 +1,8 @@
 import json
-from typing import Generator
+import logging
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
 
 from app.infrastructure.llm.caption import ChatGPTCaptionGenerator
 from app.infrastructure.replicate.caption import CaptionGenerator
@@ -8,6 +11,43 @@ from app.repositories.caption_repository import (
     CaptionRepository,
     TranslatedCaptionRepository,
 )
+from app.services.persistence_queue import PersistenceQueue
+
+CAPTION_JOB = "caption"
+
+
+class CaptionWriter:
+    """Store the captions of a persistence queue batch."""
+
+    def __init__(
+        self,
+        primary_caption_repository: CaptionRepository,
+        learning_caption_repository: TranslatedCaptionRepository,
+    ) -> None:
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self.primary_caption_repository = primary_caption_repository
+        self.learning_caption_repository = learning_caption_repository
+
+    def __call__(self, payloads: List[Dict[str, Any]]) -> List[Any]:
+        results: List[Any] = []
+        for payload in payloads:
+            try:
+                caption_insert_object = (
+                    self.primary_caption_repository.add_image_caption(
+                        user_id=payload["user_id"],
+                        image_caption=ImageCaptionCreate(**payload["image_caption"]),
+                    )
+                )
+                self.learning_caption_repository.add_translated_caption(
+                    learning_caption=payload["learning_caption"],
+                    learning_language=payload["learning_language"],
+                    image_caption_object=caption_insert_object,
+                )
+                results.append({"image_path": payload["image_caption"]["image_path"]})
+            except Exception as e:
+                self.logger.warning(f"Can not store a caption: {e}")
+                results.append(e)
+        return results
 
 
 class CaptionService:
@@ -17,21 +57,54 @@ class CaptionService:
         learning_caption_repository: TranslatedCaptionRepository,
         caption_generator: CaptionGenerator,
         chatgpt_caption: ChatGPTCaptionGenerator,
+        async_mode: bool = False,
+        persistence_queue: Optional[PersistenceQueue] = None,
     ) -> None:
         self.primary_caption_repository = primary_caption_repository
         self.learning_caption_repository = learning_caption_repository
         self.caption_generator = caption_generator
         self.chatgpt_caption = chatgpt_caption
+        self.async_mode = async_mode
+        self.persistence_queue = persistence_queue
 
-    def get_caption_from_image(self, user_id: str, caption_input: dict) -> Generator:
-        caption = self.caption_generator.generate_from_image(
+    @staticmethod
+    def _queue_caption(
+        persistence_queue: PersistenceQueue,
+        user_id: str,
+        caption_input: dict,
+        caption_data: dict,
+        image_caption: ImageCaptionCreate,
+        persistence_id: Optional[str],
+    ) -> None:
+        persistence_queue.submit(
+            CAPTION_JOB,
+            {
+                "user_id": user_id,
+                "image_caption": image_caption.dict(),
+                "learning_caption": caption_data[caption_input["learning_language"]],
+                "learning_language": caption_input["learning_language"],
+            },
+            user_id,
+            job_id=persistence_id,
+        )
+
+    async def get_caption_from_image_async(
+        self,
+        user_id: str,
+        caption_input: dict,
+        persistence_id: Optional[str] = None,
+    ) -> AsyncGenerator[str, None]:
+        """Stream the caption, then store it. With a persistence queue the
+        caption is stored in the background under `persistence_id`."""
+        caption = await self.caption_generator.generate_from_image_async(
             image_file=caption_input["file"],
         )
         rewritten_caption = ""
-        for text in self.chatgpt_caption.rewrite_caption(
+        async for text in self.chatgpt_caption.rewrite_caption_async(
             caption=caption,
             primary_language=caption_input["primary_language"],
             learning_language=caption_input["learning_language"],
+            user_id=user_id,
         ):
             rewritten_caption += text
             yield text
@@ -41,10 +114,35 @@ class CaptionService:
             caption=caption_data[caption_input["primary_language"]],
             primary_language=caption_input["primary_language"],
         )
-        caption_insert_object = self.primary_caption_repository.add_image_caption(
-            user_id=user_id, image_caption=new_image_caption
+        if self.persistence_queue is not None:
+            self._queue_caption(
+                self.persistence_queue,
+                user_id,
+                caption_input,
+                caption_data,
+                new_image_caption,
+                persistence_id,
+            )
+            return
+        if self.async_mode:
+            caption_insert_object = (
+                await self.primary_caption_repository.add_image_caption_async(
+                    user_id=user_id, image_caption=new_image_caption
+                )
+            )
+            await self.learning_caption_repository.add_translated_caption_async(
+                learning_caption=caption_data[caption_input["learning_language"]],
+                learning_language=caption_input["learning_language"],
+                image_caption_object=caption_insert_object,
+            )
+            return
+        caption_insert_object = await run_in_threadpool(
+            self.primary_caption_repository.add_image_caption,
+            user_id=user_id,
+            image_caption=new_image_caption,
         )
-        self.learning_caption_repository.add_translated_caption(
+        await run_in_threadpool(
+            self.learning_caption_repository.add_translated_caption,
             learning_caption=caption_data[caption_input["learning_language"]],
             learning_language=caption_input["learning_language"],
             image_caption_object=caption_insert_object,
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from app.infrastructure.llm.vocabulary import ChatGPTVocabularyGenerator
+from app.infrastructure.metrics.metrics import MetricsRegistry
+from app.models.schemas.vocabulary import GetVocabularyQuestions
+from app.repositories.vocabulary_repository import PopularLesson, VocabularyRepository
+from app.services.vocabulary_service import load_lesson_json, parse_json_prompt
+
+PoolKey = Tuple[str, str, str, str]
+# The learning and translated language parts of a generated lesson
+PooledLesson = Tuple[Dict[str, Any], Dict[str, Any]]
+
+
+def pool_key(
+    category: str, learning_language: str, translated_language: str, level: str
+) -> PoolKey:
+    return (
+        " ".join(category.split()).casefold(),
+        learning_language.strip().upper(),
+        translated_language.strip().upper(),
+        level.strip().upper(),
+    )
+
+
+class LessonPool:
+    """Ready-made lessons for the most requested lesson combinations.
+
+    A background thread reloads the popular (category, languages, level)
+    combinations from the lessons stored in the last `popular_window` seconds
+    and tops up their pools to `size` lessons. A popped lesson is handed to a
+    single request and its pool is refilled in the background.
+
+    Each lesson is generated by the async generator on an event loop of its
+    worker thread, so `voca_generator` must not share a stream coalescer with
+    the request loop.
+    """
+
+    def __init__(
+        self,
+        voca_generator: ChatGPTVocabularyGenerator,
+        voca_repository: VocabularyRepository,
+        size: int = 2,
+        max_combinations: int = 20,
+        refresh_interval: float = 600,
+        popular_window: float = 7 * 24 * 3600,
+        num_questions: int = 5,
+        num_answers: int = 3,
+        max_workers: int = 2,
+        metrics: Optional[MetricsRegistry] = None,
+    ) -> None:
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self.voca_generator = voca_generator
+        self.voca_repository = voca_repository
+        self.size = size
+        self.max_combinations = max_combinations
+        self.refresh_interval = refresh_interval
+        self.popular_window = popular_window
+        self.num_questions = num_questions
+        self.num_answers = num_answers
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self._lock = threading.Lock()
+        self._combinations: Dict[PoolKey, PopularLesson] = {}
+        self._lessons: Dict[PoolKey, Deque[PooledLesson]] = {}
+        self._pending: Dict[PoolKey, int] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="lesson-pool"
+        )
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def start(self) -> None:
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="lesson-pool-warmer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                self.logger.exception("Can not refresh the popular lessons")
+            self._stopped.wait(self.refresh_interval)
+
+    def refresh(self) -> None:
+        since = datetime.now(timezone.utc) - timedelta(seconds=self.popular_window)
+        popular_lessons = self.voca_repository.get_popular_lessons(
+            since, self.max_combinations
+        )
+        combinations = {
+            pool_key(
+                popular.category,
+                popular.learning_language,
+                popular.translated_language,
+                popular.level,
+            ): popular
+            for popular in popular_lessons
+        }
+        with self._lock:
+            self._combinations = combinations
+            # Lessons of combinations which are not popular anymore are dropped
+            self._lessons = {
+                key: lessons
+                for key, lessons in self._lessons.items()
+                if key in combinations
+            }
+        self.logger.debug(f"Warm {len(combinations)} lesson combinations")
+        for key in combinations:
+            self._refill(key)
+
+    def pop(self, user_input: GetVocabularyQuestions) -> Optional[str]:
+        """A pooled lesson for the request, keyed by the languages as requested."""
+        if not self.enabled or (user_input.num_questions, user_input.num_answers) != (
+            self.num_questions,
+            self.num_answers,
+        ):
+            return None
+        key = pool_key(
+            user_input.category,
+            user_input.learning_language,
+            user_input.translated_language,
+            user_input.level_type,
+        )
+        with self._lock:
+            lessons = self._lessons.get(key)
+            lesson = lessons.popleft() if lessons else None
+            pooled = self._pooled()
+        self.metrics.set_gauge("lesson_pool_size", pooled)
+        if lesson is None:
+            self.metrics.increment("lesson_pool_misses_total")
+            return None
+        self.metrics.increment("lesson_pool_hits_total")
+        self._refill(key)
+        learning, translated = lesson
+        return json.dumps(
+            {
+                user_input.learning_language: learning,
+                user_input.translated_language: translated,
+            },
+            ensure_ascii=False,
+        )
+
+    def _pooled(self) -> int:
+        return sum(len(lessons) for lessons in self._lessons.values())
+
+    def _refill(self, key: PoolKey) -> None:
+        with self._lock:
+            if key not in self._combinations or self._stopped.is_set():
+                return
+            lessons = self._lessons.setdefault(key, deque())
+            missing = self.size - len(lessons) - self._pending.get(key, 0)
+            if missing <= 0:
+                return
+            self._pending[key] = self._pending.get(key, 0) + missing
+        for _ in range(missing):
+            self._executor.submit(self._generate, key)
+
+    async def _generate_lesson(self, popular: PopularLesson) -> str:
+        chunks = [
+            text
+            async for text in self.voca_generator.generate_vocabulary_questions_async(
+                category=popular.category,
+                translated_language=popular.translated_language,
+                learning_language=popular.learning_language,
+                num_questions=self.num_questions,
+                num_answers=self.num_answers,
+                level=popular.level,
+            )
+        ]
+        return "".join(chunks)
+
+    def _generate(self, key: PoolKey) -> None:
+        try:
+            with self._lock:
+                popular = self._combinations.get(key)
+            if popular is None:
+                return
+            lesson = asyncio.run(self._generate_lesson(popular))
+            data = load_lesson_json(lesson)
+            # Only lessons the request path can parse are pooled
+            parse_json_prompt(
+                popular.category,
+                popular.learning_language,
+                popular.translated_language,
+                data,
+                popular.level,
+            )
+            with self._lock:
+                if key in self._lessons:
+                    self._lessons[key].append(
+                        (
+                            data[popular.learning_language],
+                            data[popular.translated_language],
+                        )
+                    )
+                pooled = self._pooled()
+            self.metrics.increment("lesson_pool_generated_total")
+            self.metrics.set_gauge("lesson_pool_size", pooled)
+        except Exception:
+            self.metrics.increment("lesson_pool_failures_total")
+            self.logger.exception(f"Can not generate a pooled lesson for {key}")
+        finally:
+            with self._lock:
+                self._pending[key] = self._pending.get(key, 1) - 1
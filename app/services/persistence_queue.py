@@ -0,0 +1,314 @@
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, TextIO
+
+from app.infrastructure.metrics.metrics import MetricsRegistry
+
+PENDING = "pending"
+STORED = "stored"
+FAILED = "failed"
+JOURNAL_PATTERN = "persistence-*.jsonl"
+
+# Stores the payloads of a batch, returns the result or the exception of each
+BatchHandler = Callable[[List[Dict[str, Any]]], List[Any]]
+# Share the status of jobs with the other workers, and look one up
+StatusSink = Callable[[List["PersistenceJob"]], None]
+StatusSource = Callable[[str], Optional["PersistenceJob"]]
+
+
+@dataclass
+class PersistenceJob:
+    id: str
+    kind: str
+    user_id: str
+    payload: Dict[str, Any]
+    status: str = PENDING
+    attempts: int = 0
+    result: Any = None
+    error: Optional[str] = None
+    submitted_at: float = field(default_factory=time.time)
+    # Monotonic time before which a failed job is not retried
+    retry_at: float = 0.0
+
+
+class PersistenceQueue:
+    """Store generated content in the background, off the response stream.
+
+    `submit` queues a job and returns at once, a background thread hands the
+    queued jobs of a kind to its handler in batches of up to `batch_size`.
+    A job whose handler failed is retried up to `max_attempts` times, waiting
+    `retry_backoff` seconds doubled on each attempt. The status of a job is
+    kept until `max_finished` newer jobs finished.
+
+    The statuses of a batch are handed to `status_sink` before and after it
+    is stored, `status` looks the jobs of the other workers up in
+    `status_source`.
+
+    With a `journal_dir`, `submit` appends the job to a journal file of this
+    process and a finished job is marked there: the jobs left by a process
+    which died are stored by the next one to start. The journal is synced to
+    disk before each batch, a host crash loses the jobs submitted since.
+    """
+
+    def __init__(
+        self,
+        handlers: Dict[str, BatchHandler],
+        journal_dir: str = "",
+        batch_size: int = 20,
+        flush_interval: float = 0.5,
+        max_attempts: int = 5,
+        retry_backoff: float = 1,
+        max_finished: int = 10000,
+        status_sink: Optional[StatusSink] = None,
+        status_source: Optional[StatusSource] = None,
+        metrics: Optional[MetricsRegistry] = None,
+    ) -> None:
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self.handlers = handlers
+        self.journal_dir = journal_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.max_finished = max_finished
+        self.status_sink = status_sink
+        self.status_source = status_source
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self._changed = threading.Condition()
+        self._pending: Deque[PersistenceJob] = deque()
+        self._jobs: Dict[str, PersistenceJob] = {}
+        self._finished: Deque[str] = deque()
+        self._journal: Optional[TextIO] = None
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        user_id: str,
+        job_id: Optional[str] = None,
+    ) -> PersistenceJob:
+        if kind not in self.handlers:
+            raise ValueError(f"No persistence handler for {kind}")
+        job = PersistenceJob(
+            id=job_id or uuid.uuid4().hex, kind=kind, user_id=user_id, payload=payload
+        )
+        with self._changed:
+            self._write_journal({"submit": asdict(job)})
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._publish()
+            self._changed.notify()
+        self.metrics.increment("persistence_submitted_total", labels={"kind": kind})
+        return job
+
+    def status(self, job_id: str) -> Optional[PersistenceJob]:
+        job = self._jobs.get(job_id)
+        if job is None and self.status_source is not None:
+            # Submitted to the queue of another worker
+            return self.status_source(job_id)
+        return job
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        if self.journal_dir:
+            self._open_journal()
+        self._thread = threading.Thread(
+            target=self._run, name="persistence-queue", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 10) -> None:
+        with self._changed:
+            self._stopped = True
+            self._changed.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        # The jobs left are stored by the next process from the journal
+        if self._journal is not None:
+            self._journal.close()
+
+    def drain(self) -> None:
+        """Store the jobs due now in the calling thread."""
+        while True:
+            batch = self._next_batch(wait=False)
+            if not batch:
+                return
+            self._store(batch)
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch(wait=True)
+            if batch:
+                self._store(batch)
+            elif self._stopped:
+                return
+
+    def _next_batch(self, wait: bool) -> List[PersistenceJob]:
+        with self._changed:
+            batch = self._take_due()
+            if not batch and wait and not self._stopped:
+                self._changed.wait(self._wait_time())
+                batch = self._take_due()
+            return batch
+
+    def _take_due(self) -> List[PersistenceJob]:
+        now = time.monotonic()
+        batch: List[PersistenceJob] = []
+        waiting: Deque[PersistenceJob] = deque()
+        while self._pending:
+            job = self._pending.popleft()
+            due = job.retry_at <= now
+            if (
+                due
+                and len(batch) < self.batch_size
+                and (not batch or job.kind == batch[0].kind)
+            ):
+                batch.append(job)
+            else:
+                waiting.append(job)
+        self._pending = waiting
+        return batch
+
+    def _wait_time(self) -> float:
+        if not self._pending:
+            return self.flush_interval
+        next_retry = min(job.retry_at for job in self._pending)
+        return max(0.0, min(self.flush_interval, next_retry - time.monotonic()))
+
+    def _store(self, batch: List[PersistenceJob]) -> None:
+        kind = batch[0].kind
+        labels = {"kind": kind}
+        self._sync_journal()
+        self._share_status(batch)
+        started = time.perf_counter()
+        try:
+            results = self.handlers[kind]([job.payload for job in batch])
+        except Exception as e:
+            self.logger.exception(f"Can not store a batch of {len(batch)} {kind}")
+            results = [e] * len(batch)
+        self.metrics.observe(
+            "persistence_batch_seconds", time.perf_counter() - started, labels=labels
+        )
+        self.metrics.observe("persistence_batch_size", len(batch), labels=labels)
+        with self._changed:
+            for job, result in zip(batch, results):
+                job.attempts += 1
+                if not isinstance(result, Exception):
+                    self._finish(job, STORED, result=result)
+                elif job.attempts >= self.max_attempts:
+                    self.logger.error(f"Give up storing {kind} {job.id}: {result}")
+                    self._finish(job, FAILED, error=result.__str__())
+                else:
+                    job.error = result.__str__()
+                    job.retry_at = time.monotonic() + self.retry_backoff * 2 ** (
+                        job.attempts - 1
+                    )
+                    self._pending.append(job)
+                    self.metrics.increment("persistence_retries_total", labels=labels)
+            if not self._pending:
+                self._truncate_journal()
+            self._publish()
+        self._share_status(batch)
+
+    def _share_status(self, jobs: List[PersistenceJob]) -> None:
+        if self.status_sink is None:
+            return
+        try:
+            self.status_sink(jobs)
+        except Exception:
+            self.metrics.increment("persistence_status_errors_total")
+            self.logger.exception(f"Can not share the status of {len(jobs)} jobs")
+
+    def _finish(
+        self,
+        job: PersistenceJob,
+        status: str,
+        result: Any = None,
+        error: Optional[str] = None,
+    ) -> None:
+        job.status = status
+        job.result = result
+        job.error = error
+        self._write_journal({"done": job.id})
+        self._finished.append(job.id)
+        while len(self._finished) > self.max_finished:
+            self._jobs.pop(self._finished.popleft(), None)
+        labels = {"kind": job.kind, "status": status}
+        self.metrics.increment("persistence_finished_total", labels=labels)
+        self.metrics.observe(
+            "persistence_lag_seconds", time.time() - job.submitted_at, labels=labels
+        )
+
+    def _publish(self) -> None:
+        self.metrics.set_gauge("persistence_pending", len(self._pending))
+
+    def _open_journal(self) -> None:
+        os.makedirs(self.journal_dir, exist_ok=True)
+        journal = open(
+            os.path.join(
+                self.journal_dir, f"persistence-{os.getpid()}-{uuid.uuid4().hex}.jsonl"
+            ),
+            "a",
+        )
+        # Held while the process lives, tells the others the journal is in use
+        fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        with self._changed:
+            self._journal = journal
+            for job in self._pending:
+                self._write_journal({"submit": asdict(job)})
+        for path in glob.glob(os.path.join(self.journal_dir, JOURNAL_PATTERN)):
+            if path != journal.name:
+                self._recover(path)
+
+    def _recover(self, path: str) -> None:
+        with open(path) as orphan:
+            try:
+                fcntl.flock(orphan, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # The journal of a running process
+                return
+            jobs: Dict[str, PersistenceJob] = {}
+            for line in orphan:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line of a process killed while writing it
+                    continue
+                if "submit" in record:
+                    job = PersistenceJob(**record["submit"])
+                    job.retry_at = 0.0
+                    jobs[job.id] = job
+                else:
+                    jobs.pop(record["done"], None)
+            for job in jobs.values():
+                if job.kind in self.handlers:
+                    self.submit(job.kind, job.payload, job.user_id, job_id=job.id)
+            os.remove(path)
+        if jobs:
+            self.logger.warning(f"Recovered {len(jobs)} unsaved jobs from {path}")
+
+    def _write_journal(self, record: Dict[str, Any]) -> None:
+        if self._journal is None:
+            return
+        self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._journal.flush()
+
+    def _sync_journal(self) -> None:
+        if self._journal is not None:
+            os.fsync(self._journal.fileno())
+
+    def _truncate_journal(self) -> None:
+        # Every journaled job is finished
+        if self._journal is not None:
+            self._journal.truncate(0)
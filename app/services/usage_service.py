@@ -0,0 +1,22 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.repositories.llm_usage_repository import LLMUsageRepository, UsageSummary
+
+
+class UsageService:
+    def __init__(
+        self, usage_repository: LLMUsageRepository, async_mode: bool = False
+    ) -> None:
+        self._repository = usage_repository
+        self.async_mode = async_mode
+
+    async def get_usage(
+        self, hours: float, user_id: Optional[str] = None
+    ) -> List[UsageSummary]:
+        since = datetime.now(timezone.utc) - timedelta(hours=hours)
+        if self.async_mode:
+            return await self._repository.get_usage_async(since, user_id)
+        return await run_in_threadpool(self._repository.get_usage, since, user_id)
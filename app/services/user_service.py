@@ -1,16 +1,27 @@
+from starlette.concurrency import run_in_threadpool
+
 from app.models.db.users import UserInfo
 from app.repositories.user_repository import UserRepository
 
 
 class UserService:
-    def __init__(self, user_repository: UserRepository) -> None:
+    def __init__(
+        self, user_repository: UserRepository, async_mode: bool = False
+    ) -> None:
         self._repository: UserRepository = user_repository
+        self.async_mode = async_mode
 
-    def get_user_by_id(self, user_id: str) -> UserInfo:
-        return self._repository.get_by_id(user_id)
+    async def get_user_by_id(self, user_id: str) -> UserInfo:
+        if self.async_mode:
+            return await self._repository.get_by_id_async(user_id)
+        return await run_in_threadpool(self._repository.get_by_id, user_id)
 
-    def create_user(self, user_info: UserInfo) -> UserInfo | None:
-        return self._repository.add(user_info)
+    async def create_user(self, user_info: UserInfo) -> UserInfo | None:
+        if self.async_mode:
+            return await self._repository.add_async(user_info)
+        return await run_in_threadpool(self._repository.add, user_info)
 
-    def update_user(self, user_info: UserInfo) -> UserInfo | None:
-        return self._repository.update(user_info)
+    async def update_user(self, user_info: UserInfo) -> UserInfo | None:
+        if self.async_mode:
+            return await self._repository.update_async(user_info)
+        return await run_in_threadpool(self._repository.update, user_info)
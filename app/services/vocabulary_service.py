@@ -1,13 +1,36 @@
+import asyncio
 import json
+from contextlib import aclosing, nullcontext
 from json import JSONDecodeError
-from typing import Any, Generator
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncGenerator,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from starlette.concurrency import run_in_threadpool
 
+from app.infrastructure.llm.json_repair import repair_json
+from app.infrastructure.llm.json_stream import IncrementalJSONParser, lenient_loads
+from app.infrastructure.llm.lesson_cache import (
+    LessonCache,
+    LessonKey,
+    lesson_cache_key,
+)
 from app.infrastructure.llm.vocabulary import (
     ChatGPTVocabularyGenerator,
 )
+from app.infrastructure.metrics.metrics import MetricsRegistry
 from app.models.common.pagination import PagedResponseSchema
 from app.models.db.vocabulary import VocabularyPrompt
 from app.models.schemas.vocabulary import (
+    NDJSON_STREAM,
+    SSE_STREAM,
+    TEXT_STREAM,
     GetVocabularyHistoryQuestion,
     GetVocabularyQuestions,
     VocabularyAnswerCreate,
@@ -18,7 +41,12 @@ from app.repositories.vocabulary_repository import (
     CreateWithCategoryResponse,
     VocabularyRepository,
 )
+from app.services.admission import AdmissionController
 from app.services.base_service import BaseService
+from app.services.persistence_queue import PersistenceQueue
+
+if TYPE_CHECKING:
+    from app.services.lesson_pool import LessonPool
 
 
 def parse_json_prompt(
@@ -66,71 +94,494 @@ def parse_json_prompt(
     )
 
 
+def load_lesson_json(lesson: str) -> dict[str, Any]:
+    return lenient_loads(lesson)
+
+
+def is_complete_question(question: Any) -> bool:
+    return (
+        isinstance(question, dict)
+        and all(key in question for key in QUESTION_KEYS)
+        and isinstance(question["question"], str)
+        and isinstance(question["options"], list)
+    )
+
+
+# A lesson to replay without calling the LLM, and whether it came from the
+# lesson cache
+ReadyLesson = Tuple[Optional[str], bool]
+
+
+def user_lesson_cache_key(user_input: GetVocabularyQuestions) -> LessonKey:
+    return lesson_cache_key(
+        user_input.category,
+        user_input.learning_language,
+        user_input.translated_language,
+        user_input.level_type,
+        user_input.num_questions,
+        user_input.num_answers,
+    )
+
+
+def lesson_created_message(category: CreateWithCategoryResponse) -> str:
+    return {
+        "category_id": category.category_id,
+        "learning_language": category.learning_language,
+    }.__str__()
+
+
+def lesson_queued_message(job_id: str, learning_language: str) -> str:
+    return {
+        "persistence_id": job_id,
+        "learning_language": learning_language,
+    }.__str__()
+
+
+LESSON_JOB = "lesson"
+# Counts the lessons by how their text parsed: clean, repaired, salvaged or
+# failed
+LESSON_PARSE_METRIC = "lesson_parse_total"
+
+
+class LessonWriter:
+    """Store the lessons of a persistence queue batch."""
+
+    def __init__(self, voca_repository: VocabularyRepository) -> None:
+        self.voca_repository = voca_repository
+
+    def __call__(self, payloads: List[Dict[str, Any]]) -> List[Any]:
+        results = self.voca_repository.create_many_with_category(
+            [
+                (VocabularyPromptCreate(**payload["lesson"]), payload["user_id"])
+                for payload in payloads
+            ]
+        )
+        return [
+            result
+            if isinstance(result, Exception)
+            else {
+                "category_id": result.category_id,
+                "learning_language": result.learning_language,
+            }
+            for result in results
+        ]
+
+
+def frame_event(event: dict[str, Any], stream_format: str) -> str:
+    if stream_format == SSE_STREAM:
+        name = event.pop("event")
+        return f"event: {name}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+
+# Keys a lesson question needs to be stored
+QUESTION_KEYS = ("question", "options", "answer")
+
+
+class LessonStream:
+    """Turn the text streamed by the LLM into the chunks sent to the client.
+
+    The `text` format forwards the raw text. The `ndjson` and `sse` formats
+    send an event for the lesson text and for each question of a language as
+    soon as it is complete. In every format a lesson whose JSON is broken is
+    repaired, and a lesson cut after its first questions is salvaged.
+    The events of a lesson generated in a batch carry its `item` index.
+    """
+
+    def __init__(
+        self, user_input: GetVocabularyQuestions, item: Optional[int] = None
+    ) -> None:
+        self.user_input = user_input
+        self.stream_format = user_input.stream_format
+        self.item = item
+        self.finished = False
+        self.parser = IncrementalJSONParser(depths=(2, 3), loads=load_lesson_json)
+        # The text needed a repair to parse
+        self.repaired = False
+        # Questions were dropped because they are not complete in both languages
+        self.salvaged = False
+
+    @property
+    def text(self) -> str:
+        return self.parser.text
+
+    def feed(self, chunk: str) -> List[str]:
+        events: List[Dict[str, Any]] = []
+        for path, value in self.parser.feed(chunk):
+            language, field = path[0], path[1]
+            if not isinstance(language, str):
+                continue
+            if len(path) == 2 and field == "lesson" and isinstance(value, str):
+                events.append(
+                    {"event": "lesson", "language": language, "lesson": value}
+                )
+            elif len(path) == 3 and field == "questions" and isinstance(value, dict):
+                events.append(
+                    {
+                        "event": "question",
+                        "language": language,
+                        "index": path[2],
+                        "question": value,
+                    }
+                )
+        if self.stream_format == TEXT_STREAM:
+            return [chunk]
+        return [self._frame(event) for event in events]
+
+    def separator(self) -> List[str]:
+        return ["\n \n \n"] if self.stream_format == TEXT_STREAM else []
+
+    def load(self) -> dict[str, Any]:
+        """The lesson of the text, with the questions complete in both
+        languages. Raise ValueError when no question is."""
+        try:
+            data = load_lesson_json(self.text)
+        except JSONDecodeError:
+            data = load_lesson_json(repair_json(self.text))
+            self.repaired = True
+        lesson = self._complete(data)
+        if lesson is None:
+            raise ValueError("The lesson has no complete question")
+        return lesson
+
+    def _complete(self, data: Any) -> Optional[dict[str, Any]]:
+        languages = (
+            self.user_input.learning_language,
+            self.user_input.translated_language,
+        )
+        if not isinstance(data, dict):
+            return None
+        parts: List[Dict[str, Any]] = []
+        for language in languages:
+            part = data.get(language)
+            if not isinstance(part, dict) or not isinstance(part.get("lesson"), str):
+                return None
+            parts.append(part)
+        questions = [
+            part["questions"] if isinstance(part.get("questions"), list) else []
+            for part in parts
+        ]
+        pairs = []
+        for learning, translated in zip(*questions):
+            if not (
+                is_complete_question(learning) and is_complete_question(translated)
+            ):
+                break
+            pairs.append((learning, translated))
+        if not pairs:
+            return None
+        self.salvaged = len(pairs) < max(len(part) for part in questions)
+        return {
+            language: {
+                "lesson": part["lesson"],
+                "questions": [pair[index] for pair in pairs],
+            }
+            for index, (language, part) in enumerate(zip(languages, parts))
+        }
+
+    def created(self, category: CreateWithCategoryResponse) -> str:
+        self.finished = True
+        if self.stream_format == TEXT_STREAM:
+            return lesson_created_message(category)
+        return self._frame(
+            {
+                "event": "done",
+                "category_id": category.category_id,
+                "learning_language": category.learning_language,
+                "salvaged": self.salvaged,
+            }
+        )
+
+    def queued(self, job_id: str) -> str:
+        """The lesson is stored in the background, its status is looked up
+        with the persistence id."""
+        self.finished = True
+        learning_language = self.user_input.learning_language
+        if self.stream_format == TEXT_STREAM:
+            return lesson_queued_message(job_id, learning_language)
+        return self._frame(
+            {
+                "event": "done",
+                "persistence_id": job_id,
+                "learning_language": learning_language,
+                "salvaged": self.salvaged,
+            }
+        )
+
+    def error(self, error: Exception) -> str:
+        return self._frame({"event": "error", "detail": error.__str__()})
+
+    def _frame(self, event: dict[str, Any]) -> str:
+        if self.item is not None:
+            event["item"] = self.item
+        return frame_event(event, self.stream_format)
+
+
 class VocabularyService(BaseService):
     def __init__(
         self,
         voca_generator: ChatGPTVocabularyGenerator,
         voca_repository: VocabularyRepository,
+        async_mode: bool = False,
+        lesson_cache: Optional[LessonCache] = None,
+        lesson_pool: Optional["LessonPool"] = None,
+        batch_fan_out: int = 4,
+        batch_max_lessons: int = 20,
+        max_questions: int = 10,
+        max_answers: int = 6,
+        persistence_queue: Optional[PersistenceQueue] = None,
+        metrics: Optional[MetricsRegistry] = None,
     ):
-        super().__init__(voca_repository)
+        super().__init__(voca_repository, async_mode)
 
         self.voca_generator = voca_generator
         self.voca_repository = voca_repository
+        self.lesson_cache = lesson_cache
+        self.lesson_pool = lesson_pool
+        self.batch_fan_out = batch_fan_out
+        self.batch_max_lessons = batch_max_lessons
+        self.max_questions = max_questions
+        self.max_answers = max_answers
+        self.persistence_queue = persistence_queue
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
 
-    def get_new_vocabulary_lessons(
-        self, user_id: str, user_input: GetVocabularyQuestions
-    ) -> Generator:
-        raw_questions = ""
-        for text in self.voca_generator.generate_vocabulary_questions(
-            category=user_input.category,
-            translated_language=user_input.translated_language,
-            learning_language=user_input.learning_language,
-            num_questions=user_input.num_questions,
-            num_answers=user_input.num_answers,
-            level=user_input.level_type,
-        ):
-            raw_questions += text
-            yield text
-        yield "\n \n \n"
+    def valid_shape(self, num_questions: int, num_answers: int) -> bool:
+        """A lesson is of 1 to max_questions questions, each with 1 to
+        max_answers answers."""
+        return (
+            0 < num_questions <= self.max_questions
+            and 0 < num_answers <= self.max_answers
+        )
+
+    def ready_lesson(self, user_input: GetVocabularyQuestions) -> ReadyLesson:
+        """Take the lesson the request can be served with without calling the
+        LLM, to be passed to the stream of the request. A pooled lesson is
+        handed out only once."""
+        return self._ready_lesson(user_input, user_lesson_cache_key(user_input))
+
+    def _ready_lesson(
+        self, user_input: GetVocabularyQuestions, cache_key: LessonKey
+    ) -> ReadyLesson:
+        """A lesson which can be replayed without calling the LLM, and whether
+        it came from the lesson cache."""
+        if self.lesson_cache is not None and not user_input.fresh:
+            cached_lesson = self.lesson_cache.get(cache_key)
+            if cached_lesson is not None:
+                return cached_lesson, True
+        # A pooled lesson was never served, it also answers fresh requests
+        if self.lesson_pool is not None:
+            return self.lesson_pool.pop(user_input), False
+        return None, False
+
+    def _parse_lesson(
+        self, stream: LessonStream, cache_key: LessonKey, from_cache: bool
+    ) -> VocabularyPromptCreate:
+        user_input = stream.user_input
         try:
             self.logger.debug("Streaming process done")
-            raw_questions = raw_questions.replace("\\n", " ")
-            raw_questions = raw_questions.replace("\n", " ")
-
-            questions: dict[str, Any] = json.loads(raw_questions)
-            self.logger.debug("Try to parse plan text to object")
-            learning_obj = parse_json_prompt(
-                user_input.category,
-                user_input.learning_language,
-                user_input.translated_language,
-                questions,
-                user_input.level_type,
-            )
-            category = self._add_lesson_to_database(learning_obj, user_id)
-            # Yield category_id
-            yield {
-                "category_id": category.category_id,
-                "learning_language": category.learning_language,
-            }.__str__()
-        except JSONDecodeError as e:
+            questions = stream.load()
+        except ValueError as e:
             self.logger.error(e.__str__())
+            self.metrics.increment(LESSON_PARSE_METRIC, labels={"outcome": "failed"})
             raise PromptParserException()
+        if stream.salvaged:
+            outcome = "salvaged"
+            self.logger.warning(
+                f"Salvaged {len(questions[user_input.learning_language]['questions'])}"
+                " questions of a lesson which did not parse"
+            )
+        elif stream.repaired:
+            outcome = "repaired"
+            self.logger.info("Repaired a lesson which did not parse")
+        else:
+            outcome = "clean"
+        self.metrics.increment(LESSON_PARSE_METRIC, labels={"outcome": outcome})
+        self.logger.debug("Try to parse plan text to object")
+        learning_obj = parse_json_prompt(
+            user_input.category,
+            user_input.learning_language,
+            user_input.translated_language,
+            questions,
+            user_input.level_type,
+        )
+        # Only complete lessons are replayed to the next requests, a repaired
+        # lesson is replayed as the JSON it was repaired to
+        if self.lesson_cache is not None and not from_cache and not stream.salvaged:
+            self.lesson_cache.set(
+                cache_key, json.dumps(questions) if stream.repaired else stream.text
+            )
+        return learning_obj
 
-    def _add_lesson_to_database(
+    def get_new_vocabulary_lessons_async(
+        self,
+        user_id: str,
+        user_input: GetVocabularyQuestions,
+        ready: Optional[ReadyLesson] = None,
+    ) -> AsyncGenerator[str, None]:
+        return self._stream_lesson(user_id, LessonStream(user_input), ready)
+
+    async def _stream_lesson(
+        self, user_id: str, stream: LessonStream, ready: Optional[ReadyLesson] = None
+    ) -> AsyncGenerator[str, None]:
+        user_input = stream.user_input
+        cache_key = user_lesson_cache_key(user_input)
+        if ready is None:
+            ready = self._ready_lesson(user_input, cache_key)
+        ready_lesson, from_cache = ready
+        if ready_lesson is not None:
+            self.logger.debug("Replay ready-made lesson")
+            for chunk in stream.feed(ready_lesson):
+                yield chunk
+        else:
+            async for text in self.voca_generator.generate_vocabulary_questions_async(
+                category=user_input.category,
+                translated_language=user_input.translated_language,
+                learning_language=user_input.learning_language,
+                num_questions=user_input.num_questions,
+                num_answers=user_input.num_answers,
+                level=user_input.level_type,
+                user_id=user_id,
+            ):
+                for chunk in stream.feed(text):
+                    yield chunk
+        for chunk in stream.separator():
+            yield chunk
+        try:
+            learning_obj = self._parse_lesson(stream, cache_key, from_cache)
+        except PromptParserException as e:
+            # A structured stream reports the failure instead of dropping the
+            # connection halfway through the response
+            if stream.stream_format == TEXT_STREAM:
+                raise
+            yield stream.error(e)
+            return
+        if self.persistence_queue is not None:
+            # The stream ends without waiting for the database
+            yield stream.queued(
+                self._queue_lesson(self.persistence_queue, learning_obj, user_id)
+            )
+            return
+        category = await self._add_lesson_to_database_async(learning_obj, user_id)
+        yield stream.created(category)
+
+    async def get_new_vocabulary_lesson_batch_async(
+        self,
+        user_id: str,
+        lessons: List[GetVocabularyQuestions],
+        stream_format: str = NDJSON_STREAM,
+        admission: Optional[AdmissionController] = None,
+    ) -> AsyncGenerator[str, None]:
+        """Generate the lessons concurrently, at most `batch_fan_out` at once.
+
+        The events of every lesson are streamed as they come, tagged with the
+        lesson index, and each lesson is stored as soon as it is complete. A
+        failed lesson sends an error event and the others go on. Each
+        generation takes a slot of `admission` while it runs. A lesson which
+        never ran, or was replayed from the cache or the pool, is refunded to
+        the user.
+        """
+        queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+        fan_out = asyncio.Semaphore(self.batch_fan_out)
+        failed = 0
+
+        async def generate(item: int, user_input: GetVocabularyQuestions) -> None:
+            nonlocal failed
+            stream = LessonStream(user_input, item=item)
+            ready = self.ready_lesson(user_input)
+            # A ready-made lesson is replayed without a generation slot
+            generates = ready[0] is None
+            started = False
+            try:
+                slot = (
+                    admission.slot()
+                    if admission is not None and generates
+                    else nullcontext()
+                )
+                async with fan_out, slot:
+                    started = generates
+                    lesson = self._stream_lesson(user_id, stream, ready)
+                    async with aclosing(lesson):
+                        async for chunk in lesson:
+                            await queue.put(chunk)
+            except Exception as e:
+                self.logger.exception(f"Lesson {item} of a batch failed")
+                await queue.put(stream.error(e))
+            finally:
+                if admission is not None and not started:
+                    # The user is only charged for a generation
+                    admission.refund_user(user_id)
+                if not stream.finished:
+                    failed += 1
+                await queue.put(None)
+
+        tasks = [
+            asyncio.create_task(generate(item, user_input))
+            for item, user_input in enumerate(lessons)
+        ]
+        remaining = len(tasks)
+        try:
+            while remaining:
+                chunk = await queue.get()
+                if chunk is None:
+                    remaining -= 1
+                else:
+                    yield chunk
+        finally:
+            # The client went away, stop the generations still running and
+            # wait for them to free their slots
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        yield frame_event(
+            {"event": "batch_done", "lessons": len(lessons), "failed": failed},
+            stream_format,
+        )
+
+    @staticmethod
+    def _queue_lesson(
+        persistence_queue: PersistenceQueue,
+        learning_obj: VocabularyPromptCreate,
+        user_id: str,
+    ) -> str:
+        job = persistence_queue.submit(
+            LESSON_JOB, {"lesson": learning_obj.dict(), "user_id": user_id}, user_id
+        )
+        return job.id
+
+    async def _add_lesson_to_database_async(
         self, learning_obj: VocabularyPromptCreate, user_id: str
     ) -> CreateWithCategoryResponse:
         self.logger.debug("Add lesson to database")
-        return self.voca_repository.create_with_category(learning_obj, user_id)
+        if self.async_mode:
+            return await self.voca_repository.create_with_category_async(
+                learning_obj, user_id
+            )
+        # Keep the blocking psycopg2 write off the event loop
+        return await run_in_threadpool(
+            self.voca_repository.create_with_category, learning_obj, user_id
+        )
 
-    def get_history_lessons(
+    async def get_history_lessons(
         self,
         user_input: GetVocabularyHistoryQuestion,
         user_id: str,
         page: int,
         size: int,
+        cursor: Optional[str] = None,
+        include_total: bool = True,
     ) -> PagedResponseSchema[VocabularyPrompt]:
-        return self.voca_repository.get_history_questions(
-            user_input, user_id, page, size
+        if self.async_mode:
+            return await self.voca_repository.get_history_questions_async(
+                user_input, user_id, page, size, cursor, include_total
+            )
+        return await run_in_threadpool(
+            self.voca_repository.get_history_questions,
+            user_input,
+            user_id,
+            page,
+            size,
+            cursor,
+            include_total,
         )
 
 
@@ -0,0 +1,157 @@
+import asyncio
+
+import pytest
+
+from app.infrastructure.metrics.metrics import MetricsRegistry
+from app.services.admission import (
+    QUEUE_FULL,
+    QUEUE_TIMEOUT,
+    USER_RATE,
+    AdmissionController,
+    AdmissionRejected,
+    AdmittedResponse,
+)
+
+
+async def chunks():
+    yield "a"
+    yield "b"
+
+
+@pytest.mark.asyncio()
+async def test_user_bucket_limits_burst():
+    controller = AdmissionController(user_burst=2, user_refill_seconds=20)
+
+    await controller.acquire("user1")
+    await controller.acquire("user1")
+    with pytest.raises(AdmissionRejected) as e:
+        await controller.acquire("user1")
+    await controller.acquire("user2")
+
+    assert e.value.reason == USER_RATE
+    assert e.value.retry_after == 20
+
+
+def test_batch_is_charged_a_token_per_generation():
+    controller = AdmissionController(user_burst=3, user_refill_seconds=20)
+
+    with pytest.raises(AdmissionRejected) as e:
+        controller.charge_user("user1", 4)
+    controller.charge_user("user1", 3)
+    controller.refund_user("user1")
+    controller.charge_user("user1")
+
+    assert e.value.retry_after == 20
+    assert controller.max_user_generations == 3
+
+
+@pytest.mark.asyncio()
+async def test_waiting_request_gets_the_released_slot():
+    metrics = MetricsRegistry()
+    controller = AdmissionController(
+        max_concurrent=1, max_queue=1, user_burst=0, metrics=metrics
+    )
+    await controller.acquire("user1")
+    waiting = asyncio.create_task(controller.acquire("user2"))
+    await asyncio.sleep(0)
+
+    assert metrics.snapshot()["gauges"]["admission_queue_depth"] == 1
+    with pytest.raises(AdmissionRejected) as e:
+        await controller.acquire("user3")
+    assert e.value.reason == QUEUE_FULL
+
+    controller.release()
+    await waiting
+    snapshot = metrics.snapshot()
+    assert snapshot["gauges"]["admission_active"] == 1
+    assert snapshot["gauges"]["admission_queue_depth"] == 0
+    assert snapshot["histograms"]["admission_wait_seconds"]["count"] == 2
+    assert snapshot["counters"]['admission_rejected_total{reason="queue_full"}'] == 1
+
+
+@pytest.mark.asyncio()
+async def test_queue_timeout_refunds_user_token():
+    controller = AdmissionController(
+        max_concurrent=1, queue_timeout=0.01, user_burst=1, user_refill_seconds=60
+    )
+    await controller.acquire("user1")
+
+    with pytest.raises(AdmissionRejected) as e:
+        await controller.acquire("user2")
+
+    assert e.value.reason == QUEUE_TIMEOUT
+    controller.release()
+    # The timed out request did not use the generation of user2
+    await controller.acquire("user2")
+
+
+@pytest.mark.asyncio()
+async def test_response_frees_the_slot():
+    controller = AdmissionController(max_concurrent=1, user_burst=0)
+    await controller.acquire("user1")
+    sent = []
+
+    async def receive():
+        await asyncio.sleep(1)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await AdmittedResponse(controller, chunks())({"type": "http"}, receive, send)
+
+    assert [message.get("body") for message in sent] == [None, b"a", b"b", b""]
+    await asyncio.wait_for(controller.acquire("user1"), 1)
+
+
+@pytest.mark.asyncio()
+async def test_client_gone_before_the_stream_frees_the_slot():
+    controller = AdmissionController(max_concurrent=1, user_burst=0)
+    await controller.acquire("user1")
+    started = False
+
+    async def stream():
+        nonlocal started
+        started = True
+        yield "a"
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        await asyncio.sleep(1)
+
+    await AdmittedResponse(controller, stream())({"type": "http"}, receive, send)
+
+    assert not started
+    await asyncio.wait_for(controller.acquire("user1"), 1)
+
+
+@pytest.mark.asyncio()
+async def test_slot_is_freed_when_its_generation_is_cancelled():
+    controller = AdmissionController(max_concurrent=1, user_burst=0)
+
+    async def generate():
+        async with controller.slot():
+            await asyncio.sleep(1)
+
+    task = asyncio.create_task(generate())
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    await asyncio.wait_for(controller.acquire("user1"), 1)
+
+
+@pytest.mark.asyncio()
+async def test_retry_after_follows_generation_time():
+    controller = AdmissionController(max_concurrent=1, max_queue=0, user_burst=0)
+    await controller.acquire("user1")
+    controller.release(held_for=30)
+    await controller.acquire("user1")
+
+    with pytest.raises(AdmissionRejected) as e:
+        await controller.acquire("user2")
+
+    assert e.value.retry_after == 30
@@ -0,0 +1,15 @@
+import pytest
+
+
+@pytest.fixture()
+def _fresh_admission_controller():
+    """Give every test user a full generation budget.
+
+    The app is only imported by the endpoint tests which use the fixture.
+    """
+    from app.main import app
+    from app.services.admission import AdmissionController
+
+    app.container.admission_controller.override(AdmissionController())
+    yield
+    app.container.admission_controller.reset_override()
@@ -0,0 +1,82 @@
+import pytest
+from pydantic import BaseModel
+from sqlalchemy import create_engine
+
+from app.infrastructure.db.database import Base, Database, parse_replica_urls
+from app.infrastructure.db.routing import read_your_writes
+from app.models.db.language import Language
+from app.repositories.base_repository import BaseRepository
+
+CLIENT = "Bearer token"
+
+
+class LanguageCreate(BaseModel):
+    language_name: str
+
+
+@pytest.fixture()
+def database(tmp_path):
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    # The replica is a separate file which never receives the primary writes,
+    # so a read tells which database served it.
+    Base.metadata.create_all(create_engine(replica_url))
+    db = Database(
+        db_url=f"sqlite:///{tmp_path / 'primary.db'}",
+        replica_urls=replica_url,
+        primary_stickiness=60,
+    )
+    db.create_database()
+    return db
+
+
+@pytest.fixture()
+def repository(database):
+    return BaseRepository(model=Language, session_factory=database.session)
+
+
+def create_language(repository, name="ENGLISH"):
+    repository.create(obj_in=LanguageCreate(language_name=name))
+
+
+def test_parse_replica_urls():
+    assert parse_replica_urls(None) == []
+    assert parse_replica_urls("") == []
+    assert parse_replica_urls("postgresql://a/db, postgresql://b/db,") == [
+        "postgresql://a/db",
+        "postgresql://b/db",
+    ]
+    assert parse_replica_urls(["postgresql://a/db"]) == ["postgresql://a/db"]
+
+
+def test_reads_go_to_replica(database, repository):
+    assert database.has_replicas
+    create_language(repository)
+    assert repository.get_multi(1, 10).total == 0
+    with database.session() as session:
+        assert session.query(Language).count() == 1
+
+
+def test_request_reads_its_own_writes(database, repository):
+    with read_your_writes(CLIENT):
+        assert repository.get_multi(1, 10).total == 0
+        create_language(repository)
+        assert repository.get_multi(1, 10).total == 1
+
+
+def test_client_sticks_to_primary_after_write(database, repository):
+    with read_your_writes(CLIENT):
+        create_language(repository)
+    with read_your_writes(CLIENT):
+        assert repository.get_multi(1, 10).total == 1
+    with read_your_writes("Bearer other"):
+        assert repository.get_multi(1, 10).total == 0
+    with read_your_writes():
+        assert repository.get_multi(1, 10).total == 0
+
+
+def test_stickiness_expires(database, repository):
+    database.router.stickiness = 0
+    with read_your_writes(CLIENT):
+        create_language(repository)
+    with read_your_writes(CLIENT):
+        assert repository.get_multi(1, 10).total == 0
@@ -16,10 +16,14 @@ from app.repositories.caption_repository import (
     CaptionRepository,
     TranslatedCaptionRepository,
 )
+from app.tests.utils import async_stream
 
 APPLICATION_JSON = "application/json"
 
 
+pytestmark = pytest.mark.usefixtures("_fresh_admission_controller")
+
+
 @pytest.fixture()
 def client():
     return TestClient(app)
@@ -66,7 +70,7 @@ def test_generate_caption(client):
     primary_caption_repository_mock = mock.AsyncMock(spec=CaptionRepository)
     learning_caption_repository_mock = mock.AsyncMock(spec=TranslatedCaptionRepository)
     open_ai_mock = mock.Mock(spec=OpenAI)
-    open_ai_mock.stream.return_value = mock_chat_gpt_response()
+    open_ai_mock.astream.return_value = async_stream(mock_chat_gpt_response())
 
     replicate_caption_mock = mock.Mock(spec=Client)
     replicate_caption_mock.run.return_value = mock_replicate_caption_response()
@@ -111,7 +115,7 @@ def test_generate_caption_fail(client):
     primary_caption_repository_mock = mock.AsyncMock(spec=CaptionRepository)
     learning_caption_repository_mock = mock.AsyncMock(spec=TranslatedCaptionRepository)
     open_ai_mock = mock.Mock(spec=OpenAI)
-    open_ai_mock.stream.return_value = mock_fail_response()
+    open_ai_mock.astream.return_value = async_stream(mock_fail_response())
 
     replicate_caption_mock = mock.Mock(spec=Client)
     replicate_caption_mock.run.return_value = mock_replicate_caption_response()
@@ -0,0 +1,30 @@
+import threading
+from unittest import mock
+
+import pytest
+
+from app.models.db.language import Language
+from app.repositories.base_repository import BaseRepository
+from app.services.base_service import BaseService
+
+
+@pytest.mark.asyncio()
+async def test_sync_repository_runs_off_the_event_loop():
+    loop_thread = threading.get_ident()
+    threads = []
+    repository = mock.Mock(spec=BaseRepository)
+    for method in ("get", "query", "get_multi", "create", "update", "remove"):
+        getattr(repository, method).side_effect = lambda *args, **kwargs: (
+            threads.append(threading.get_ident())
+        )
+    service = BaseService(repository=repository)
+
+    await service.get(1)
+    await service.query(query=Language.id > 0, page=1, size=3)
+    await service.get_multi(page=1, size=3)
+    await service.create(mock.Mock())
+    await service.update(Language(), {"language_name": "ENGLISH"})
+    await service.remove(1)
+
+    assert len(threads) == 6
+    assert loop_thread not in threads
@@ -0,0 +1,81 @@
+import pytest
+
+from app.models.db.difficulty_levels import DifficultyLevels
+from app.models.db.language import Language
+from app.repositories.base_repository import BaseRepository
+from app.repositories.reference_data_repository import (
+    InvalidLanguage,
+    InvalidLessonLevel,
+    ReferenceDataRepository,
+    resolve_language,
+)
+from app.tests.utils import assert_num_queries, create_test_database
+
+
+@pytest.fixture()
+def database(tmp_path):
+    db = create_test_database(tmp_path)
+    with db.session() as session:
+        session.add_all(
+            [
+                Language(language_name="ENGLISH"),
+                Language(language_name="VIETNAMESE"),
+                DifficultyLevels(name="EASY"),
+            ]
+        )
+        session.commit()
+    return db
+
+
+def test_lookup_without_round_trip(database):
+    reference_data = ReferenceDataRepository(session_factory=database.session)
+    reference_data.refresh()
+    assert reference_data.version == 1
+
+    with database.session() as session, assert_num_queries(0):
+        assert reference_data.language_id(session, "english") == 1
+        assert resolve_language(session, "Vietnamese", reference_data) == 2
+        assert reference_data.difficulty_level_id(session, "easy") == 1
+
+
+def test_unknown_names(database):
+    reference_data = ReferenceDataRepository(session_factory=database.session)
+    with database.session() as session:
+        with pytest.raises(InvalidLanguage):
+            reference_data.language_id(session, "klingon")
+        with pytest.raises(InvalidLessonLevel):
+            reference_data.difficulty_level_id(session, "impossible")
+
+
+def test_reload_when_stale_or_invalidated(database):
+    reference_data = ReferenceDataRepository(
+        session_factory=database.session, refresh_interval=3600
+    )
+    with database.session() as session:
+        # Loaded lazily on the first lookup
+        with assert_num_queries(2):
+            reference_data.language_id(session, "english")
+
+        session.add(Language(language_name="FRENCH"))
+        session.commit()
+        with pytest.raises(InvalidLanguage):
+            reference_data.language_id(session, "french")
+
+        reference_data.invalidate()
+        assert reference_data.language_id(session, "french") == 3
+        assert reference_data.version == 2
+
+
+def test_invalidated_after_committed_write(database):
+    reference_data = ReferenceDataRepository(
+        session_factory=database.session, refresh_interval=3600
+    )
+    repository = BaseRepository(
+        model=Language,
+        session_factory=database.session,
+        after_commit=reference_data.invalidate,
+    )
+    with database.session() as session:
+        reference_data.language_id(session, "english")
+        repository.create(obj_in={"language_name": "FRENCH"})
+        assert reference_data.language_id(session, "french") == 3
@@ -0,0 +1,206 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import pytest
+from langchain import OpenAI
+
+from app.infrastructure.llm.single_flight import StreamCoalescer
+from app.infrastructure.llm.usage import LLMCall, TokenCounter, UsageRecorder
+from app.infrastructure.llm.vocabulary import ChatGPTVocabularyGenerator
+from app.infrastructure.metrics.metrics import MetricsRegistry
+from app.repositories.llm_usage_repository import LLMUsageRepository
+from app.services.usage_service import UsageService
+from app.tests.utils import async_stream, create_test_database
+
+LABELS = 'endpoint="vocabulary",level="EASY",shape="2q3a"'
+
+
+class WordCounter:
+    """Counts a token per word, tiktoken needs to download its encodings."""
+
+    def count(self, text: str, model: str) -> int:
+        return len(text.split())
+
+
+def usage_recorder(metrics: MetricsRegistry, sink=None) -> UsageRecorder:
+    recorder = UsageRecorder(
+        sink=sink,
+        prompt_token_price=1,
+        completion_token_price=2,
+        metrics=metrics,
+    )
+    recorder.token_counter = WordCounter()
+    return recorder
+
+
+def llm_call(user_id: str, cost: float, shape: str = "5q3a") -> LLMCall:
+    return LLMCall(
+        endpoint="vocabulary",
+        model="text-davinci-003",
+        user_id=user_id,
+        level="EASY",
+        shape=shape,
+        prompt_tokens=100,
+        completion_tokens=400,
+        time_to_first_token=0.5,
+        latency=4.5,
+        cost=cost,
+    )
+
+
+async def generate(generator: ChatGPTVocabularyGenerator) -> list[str]:
+    return [
+        text
+        async for text in generator.generate_vocabulary_questions_async(
+            category="football",
+            translated_language="VIETNAMESE",
+            learning_language="ENGLISH",
+            num_questions=2,
+            num_answers=3,
+            level="EASY",
+            user_id="user1",
+        )
+    ]
+
+
+@pytest.mark.asyncio()
+async def test_llm_call_is_recorded():
+    metrics = MetricsRegistry()
+    calls = []
+    recorder = usage_recorder(metrics, sink=calls.extend)
+    open_ai_mock = mock.Mock(spec=OpenAI)
+    open_ai_mock.astream.return_value = async_stream(["one two ", "three four"])
+    generator = ChatGPTVocabularyGenerator(model=open_ai_mock, usage=recorder)
+
+    await generate(generator)
+    recorder.flush()
+
+    [call] = calls
+    assert (call.user_id, call.level, call.shape) == ("user1", "EASY", "2q3a")
+    assert call.completion_tokens == 4
+    assert call.prompt_tokens > 0
+    assert call.cost == (call.prompt_tokens + 2 * call.completion_tokens) / 1000
+    assert 0 <= call.time_to_first_token <= call.latency
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"][f"llm_calls_total{{{LABELS}}}"] == 1
+    assert snapshot["counters"][f"llm_completion_tokens_total{{{LABELS}}}"] == 4
+    for histogram in (
+        "llm_prompt_tokens",
+        "llm_time_to_first_token_seconds",
+        "llm_tokens_per_second",
+        "llm_latency_seconds",
+    ):
+        assert snapshot["histograms"][f"{histogram}{{{LABELS}}}"]["count"] == 1
+
+
+@pytest.mark.asyncio()
+async def test_coalesced_call_costs_nothing():
+    calls = []
+    recorder = usage_recorder(MetricsRegistry(), sink=calls.extend)
+    released = asyncio.Event()
+
+    async def upstream(prompt, **kwargs):
+        yield "one"
+        # Still in flight when the second request arrives
+        await released.wait()
+
+    open_ai_mock = mock.Mock(spec=OpenAI)
+    open_ai_mock.astream.side_effect = upstream
+    coalescer = StreamCoalescer()
+    generator = ChatGPTVocabularyGenerator(
+        model=open_ai_mock, coalescer=coalescer, usage=recorder
+    )
+
+    first = generator.generate_vocabulary_questions_async(
+        "football", "VIETNAMESE", "ENGLISH", 2, 3, "EASY", user_id="user1"
+    )
+    assert await first.__anext__() == "one"
+    second = asyncio.create_task(generate(generator))
+    await asyncio.sleep(0)
+    released.set()
+    assert [text async for text in first] == []
+    assert await second == ["one"]
+    recorder.flush()
+
+    assert open_ai_mock.astream.call_count == 1
+    assert sorted((call.coalesced, call.cost > 0) for call in calls) == [
+        (False, True),
+        (True, False),
+    ]
+
+
+def test_encoding_is_loaded_off_the_calling_thread():
+    counter = TokenCounter()
+    threads = []
+    encoding = mock.Mock()
+    encoding.encode.side_effect = str.split
+
+    def encoding_for_model(model):
+        threads.append(threading.get_ident())
+        return encoding
+
+    with mock.patch("tiktoken.encoding_for_model", side_effect=encoding_for_model):
+        # Estimated from the length while the encoding loads
+        assert counter.count("a b c d", "gpt") == 1
+        for _ in range(100):
+            if counter.count("a b c d", "gpt") == 4:
+                break
+            time.sleep(0.01)
+        else:
+            pytest.fail("The encoding was not loaded")
+
+    assert len(threads) == 1
+    assert threading.get_ident() not in threads
+
+
+def test_failed_flush_is_counted():
+    metrics = MetricsRegistry()
+    recorder = usage_recorder(metrics, sink=mock.Mock(side_effect=RuntimeError))
+
+    recorder.record(llm_call("user1", 1))
+    recorder.flush()
+
+    assert metrics.snapshot()["counters"]["llm_usage_dropped_total"] == 1
+
+
+def test_usage_is_grouped_by_lesson_shape(tmp_path):
+    db = create_test_database(tmp_path)
+    repository = LLMUsageRepository(session_factory=db.session)
+    repository.add_many(
+        [
+            llm_call("user1", 1),
+            llm_call("user1", 1),
+            llm_call("user2", 5, shape="10q4a"),
+        ]
+    )
+    since = datetime.now(timezone.utc) - timedelta(hours=1)
+
+    usage = repository.get_usage(since)
+    user_usage = repository.get_usage(since, user_id="user1")
+
+    assert [(summary.shape, summary.calls, summary.cost) for summary in usage] == [
+        ("10q4a", 1, 5),
+        ("5q3a", 2, 2),
+    ]
+    assert usage[1].prompt_tokens == 200
+    assert usage[1].avg_latency == 4.5
+    # 400 completion tokens streamed in 4 seconds after the first
+    assert usage[1].tokens_per_second == 100
+    assert [(summary.shape, summary.calls) for summary in user_usage] == [("5q3a", 2)]
+
+
+@pytest.mark.asyncio()
+async def test_sync_usage_runs_off_the_event_loop():
+    threads = []
+    repository = mock.Mock(spec=LLMUsageRepository)
+    repository.get_usage.side_effect = lambda since, user_id: threads.append(
+        threading.get_ident()
+    )
+
+    await UsageService(usage_repository=repository).get_usage(hours=1)
+
+    assert len(threads) == 1
+    assert threading.get_ident() not in threads
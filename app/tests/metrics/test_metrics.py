@@ -0,0 +1,56 @@
+from unittest import mock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.infrastructure.metrics.metrics import MetricsRegistry, metric_key
+from app.main import app
+from app.routes.api_v1.endpoints.auth import METRICS_PERMISSION
+from app.tests.utils import get_http_header, mock_user
+
+
+@pytest.fixture()
+def client():
+    return TestClient(app)
+
+
+def test_metric_key():
+    assert metric_key("requests") == "requests"
+    assert metric_key("requests", {"b": 2, "a": "x"}) == 'requests{a="x",b="2"}'
+
+
+def test_metrics_registry_snapshot():
+    metrics = MetricsRegistry()
+    metrics.increment("calls", labels={"endpoint": "lesson"})
+    metrics.increment("calls", 2, labels={"endpoint": "lesson"})
+    metrics.set_gauge("in_flight", 3)
+    for value in range(1, 101):
+        metrics.observe("latency", value)
+    metrics.register_collector(lambda registry: registry.set_gauge("live", 7))
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == {'calls{endpoint="lesson"}': 3}
+    assert snapshot["gauges"] == {"in_flight": 3, "live": 7}
+    assert snapshot["histograms"]["latency"]["count"] == 100
+    assert snapshot["histograms"]["latency"]["p50"] == 50
+    assert snapshot["histograms"]["latency"]["p99"] == 99
+    assert snapshot["histograms"]["latency"]["max"] == 100
+
+
+def test_get_metrics(client):
+    metrics_mock = mock.Mock(spec=MetricsRegistry)
+    metrics_mock.snapshot.return_value = {"counters": {}, "gauges": {}}
+    app.container.auth.override(mock_user(["read", METRICS_PERMISSION]))
+    app.container.metrics.override(metrics_mock)
+
+    response = client.get("/api/v1/metrics", headers=get_http_header())
+    assert response.status_code == 200
+    assert response.json() == {"counters": {}, "gauges": {}}
+
+
+@pytest.mark.parametrize("url", ["/api/v1/metrics", "/api/v1/metrics/usage"])
+def test_get_metrics_requires_permission(client, url):
+    app.container.auth.override(mock_user())
+
+    response = client.get(url, headers=get_http_header())
+    assert response.status_code == 403
@@ -0,0 +1,242 @@
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import pytest
+from pydantic import BaseModel
+
+from app.models.common.pagination import (
+    CACHED_COUNT,
+    WINDOW_COUNT,
+    CountCache,
+    InvalidCountStrategy,
+    InvalidCursor,
+    Keyset,
+    PageCount,
+    decode_cursor,
+    encode_cursor,
+    paginate,
+)
+
+# The vocabulary models reference the difficulty levels table
+from app.models.db.difficulty_levels import DifficultyLevels  # noqa: F401
+from app.models.db.language import Language
+from app.models.db.users import UserInfo
+from app.models.db.vocabulary import Category, VocabularyPrompt
+from app.repositories.base_repository import BaseRepository, user_count_scope
+from app.tests.utils import assert_num_queries, create_test_database
+
+
+class LanguageCreate(BaseModel):
+    language_name: str
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2023, 9, 1, 12, 30, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(created_at, 42)) == (created_at, 42)
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", "e30=", "WzEsIDJd"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_keyset_for_model():
+    assert Keyset.for_model(Language).created_at is Language.created_at
+    assert Keyset.for_model(object) is None
+
+
+def test_get_multi_with_cursor(tmp_path):
+    db = create_test_database(tmp_path)
+    with db.session() as session:
+        session.add_all(
+            [
+                Language(
+                    language_name=f"LANGUAGE_{index}",
+                    created_at=datetime(2023, 9, 1) + timedelta(minutes=index // 2),
+                )
+                for index in range(7)
+            ]
+        )
+        session.commit()
+    repository = BaseRepository(model=Language, session_factory=db.session)
+
+    first_page = repository.get_multi(page=1, size=3)
+    assert first_page.total == 7
+    second_page = repository.get_multi(page=1, size=3, cursor=first_page.next_cursor)
+    third_page = repository.get_multi(page=1, size=3, cursor=second_page.next_cursor)
+    assert second_page.total is None
+    assert third_page.next_cursor is None
+
+    names = [
+        language.language_name
+        for page in (first_page, second_page, third_page)
+        for language in page.items
+    ]
+    assert names == [f"LANGUAGE_{index}" for index in reversed(range(7))]
+
+
+def test_keyset_replaces_query_order(tmp_path):
+    db = create_test_database(tmp_path)
+    with db.session() as session:
+        session.add_all(
+            [
+                Language(
+                    language_name=f"LANGUAGE_{index}",
+                    created_at=datetime(2023, 9, 1) + timedelta(minutes=index),
+                )
+                for index in range(4)
+            ]
+        )
+        session.commit()
+        query = session.query(Language).order_by(Language.language_name)
+        keyset = Keyset.for_model(Language)
+
+        first_page = paginate(1, 2, query, keyset)
+        second_page = paginate(1, 2, query, keyset, first_page.next_cursor)
+
+    names = [
+        language.language_name
+        for page in (first_page, second_page)
+        for language in page.items
+    ]
+    assert names == [f"LANGUAGE_{index}" for index in reversed(range(4))]
+
+
+def test_sort_by_falls_back_to_offset(tmp_path):
+    db = create_test_database(tmp_path)
+    repository = BaseRepository(model=UserInfo, session_factory=db.session)
+    page = repository.get_multi(page=1, size=3, sort_by=UserInfo.full_name.asc())
+    assert page.total == 0
+    assert page.next_cursor is None
+
+
+def test_count_cache_expiry_and_invalidation():
+    count_cache = CountCache(ttl=60)
+    count_cache.set("languages", "", 3)
+    count_cache.set("user:1", "history", 5)
+    assert count_cache.get("languages", "") == 3
+
+    count_cache.invalidate("languages")
+    assert count_cache.get("languages", "") is None
+    assert count_cache.get("user:1", "history") == 5
+
+    expired_cache = CountCache(ttl=0)
+    expired_cache.set("languages", "", 3)
+    assert expired_cache.get("languages", "") is None
+
+
+def test_invalid_count_strategy():
+    with pytest.raises(InvalidCountStrategy):
+        PageCount(strategy="estimate")
+
+
+def test_window_count_past_last_page(tmp_path):
+    db = create_test_database(tmp_path)
+    with db.session() as session:
+        session.add(Language(language_name="ENGLISH"))
+        session.commit()
+    repository = BaseRepository(
+        model=Language, session_factory=db.session, count_strategy=WINDOW_COUNT
+    )
+    assert repository.get_multi(page=1, size=3).total == 1
+    past_last_page = repository.get_multi(page=2, size=3)
+    assert past_last_page.total == 1
+    assert past_last_page.items == []
+
+
+def test_cached_count_invalidated_on_create(tmp_path):
+    db = create_test_database(tmp_path)
+    repository = BaseRepository(
+        model=Language,
+        session_factory=db.session,
+        count_strategy=CACHED_COUNT,
+        count_cache=CountCache(ttl=60),
+    )
+    assert repository.get_multi(page=1, size=3).total == 0
+    repository.create(obj_in=LanguageCreate(language_name="ENGLISH"))
+    assert repository.get_multi(page=1, size=3).total == 1
+
+
+def test_query_filter_keys_only_cached_counts(tmp_path):
+    db = create_test_database(tmp_path)
+    with db.session() as session:
+        session.add_all(
+            [Language(language_name="ENGLISH"), Language(language_name="X")]
+        )
+        session.commit()
+    english = Language.language_name == "ENGLISH"
+    cached = BaseRepository(
+        model=Language,
+        session_factory=db.session,
+        count_strategy=CACHED_COUNT,
+        count_cache=CountCache(ttl=60),
+    )
+    assert cached.query(query=english, page=1, size=3).total == 1
+    assert cached.query(query=Language.id > 0, page=1, size=3).total == 2
+
+    repository = BaseRepository(model=Language, session_factory=db.session)
+    with mock.patch.object(english, "compile") as compile_filter:
+        assert repository.query(query=english, page=1, size=3).total == 1
+    compile_filter.assert_not_called()
+
+
+class CategoryCreate(BaseModel):
+    category_name: str
+    user_id: str
+
+
+def test_cached_count_scoped_per_user(tmp_path):
+    db = create_test_database(tmp_path)
+    repository = BaseRepository(
+        model=Category,
+        session_factory=db.session,
+        count_strategy=CACHED_COUNT,
+        count_cache=CountCache(ttl=60),
+        user_scope_column="user_id",
+    )
+
+    def total(user_id):
+        return repository.query(
+            query=Category.user_id == user_id,
+            page=1,
+            size=3,
+            count_scope=user_count_scope(user_id),
+        ).total
+
+    assert total("alice") == 0
+    assert total("bob") == 0
+    repository.create(obj_in=CategoryCreate(category_name="food", user_id="bob"))
+    with assert_num_queries(1):
+        # Only the page, the total of alice is still cached
+        assert total("alice") == 0
+    assert total("bob") == 1
+
+
+def test_cached_count_kept_without_commit(tmp_path):
+    db = create_test_database(tmp_path)
+    cache = CountCache(ttl=60)
+    repository = BaseRepository(
+        model=Language,
+        session_factory=db.session,
+        count_strategy=CACHED_COUNT,
+        count_cache=cache,
+    )
+    assert repository.get_multi(page=1, size=3).total == 0
+    # The session ends without a commit, the write is rolled back
+    repository.create(obj_in=LanguageCreate(language_name="ENGLISH"), commit=False)
+    assert cache.get(Language.__tablename__, "") == 0
+    assert repository.get_multi(page=1, size=3).total == 0
+
+
+def test_cached_count_key_of_any_bind_type(tmp_path):
+    db = create_test_database(tmp_path)
+    repository = BaseRepository(
+        model=VocabularyPrompt,
+        session_factory=db.session,
+        count_strategy=CACHED_COUNT,
+        count_cache=CountCache(ttl=60),
+    )
+    # JSON values have no literal rendering
+    document = VocabularyPrompt.lesson_document == {"questions": []}
+    assert repository.query(query=document, page=1, size=3).total == 0
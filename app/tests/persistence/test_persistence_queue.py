@@ -0,0 +1,218 @@
+import json
+import time
+from unittest import mock
+
+import pytest
+
+from app.infrastructure.metrics.metrics import MetricsRegistry, metric_key
+from app.models.schemas.vocabulary import NDJSON_STREAM
+from app.repositories.persistence_job_repository import PersistenceJobRepository
+from app.repositories.vocabulary_repository import (
+    CreateWithCategoryResponse,
+    VocabularyRepository,
+)
+from app.services.persistence_queue import FAILED, PENDING, STORED, PersistenceQueue
+from app.services.vocabulary_service import LESSON_JOB, LessonWriter
+from app.tests.utils import create_test_database
+from app.tests.vocabulary.test_vocabulary_stream import (
+    lesson_chunks,
+    lesson_request,
+    vocabulary_service,
+)
+
+
+class Handler:
+    """Store every payload, fail the ones in `failures` that many times."""
+
+    def __init__(self, failures: dict[str, int] | None = None) -> None:
+        self.failures = failures or {}
+        self.batches: list[list[dict]] = []
+
+    def __call__(self, payloads: list[dict]) -> list:
+        self.batches.append(payloads)
+        results: list = []
+        for payload in payloads:
+            if self.failures.get(payload["name"], 0) > 0:
+                self.failures[payload["name"]] -= 1
+                results.append(RuntimeError("database is down"))
+            else:
+                results.append({"stored": payload["name"]})
+        return results
+
+
+def queue(handler: Handler, **kwargs) -> PersistenceQueue:
+    return PersistenceQueue(
+        handlers={"item": handler}, **{"batch_size": 2, "retry_backoff": 0, **kwargs}
+    )
+
+
+def test_jobs_are_stored_in_batches():
+    handler = Handler()
+    persistence_queue = queue(handler)
+    jobs = [
+        persistence_queue.submit("item", {"name": f"item {index}"}, "user123")
+        for index in range(3)
+    ]
+
+    assert persistence_queue.status(jobs[0].id).status == PENDING
+    persistence_queue.drain()
+
+    assert [len(batch) for batch in handler.batches] == [2, 1]
+    assert persistence_queue.status(jobs[2].id).status == STORED
+    assert persistence_queue.status(jobs[2].id).result == {"stored": "item 2"}
+
+
+def test_failed_job_is_retried():
+    metrics = MetricsRegistry()
+    handler = Handler(failures={"item 0": 1})
+    persistence_queue = queue(handler, metrics=metrics)
+    job = persistence_queue.submit("item", {"name": "item 0"}, "user123")
+
+    persistence_queue.drain()
+
+    assert job.status == STORED
+    assert job.attempts == 2
+    retries = metric_key("persistence_retries_total", {"kind": "item"})
+    assert metrics.snapshot()["counters"][retries] == 1
+
+
+def test_job_fails_after_max_attempts():
+    handler = Handler(failures={"item 0": 5})
+    persistence_queue = queue(handler, max_attempts=3)
+    job = persistence_queue.submit("item", {"name": "item 0"}, "user123")
+
+    persistence_queue.drain()
+
+    assert job.status == FAILED
+    assert job.attempts == 3
+    assert job.error == "database is down"
+
+
+def test_retry_waits_for_the_backoff():
+    handler = Handler(failures={"item 0": 1})
+    persistence_queue = queue(handler, retry_backoff=60)
+    job = persistence_queue.submit("item", {"name": "item 0"}, "user123")
+
+    persistence_queue.drain()
+
+    assert job.status == PENDING
+    assert job.error == "database is down"
+    assert len(handler.batches) == 1
+
+
+def test_unknown_kind_is_rejected():
+    with pytest.raises(ValueError, match="No persistence handler"):
+        queue(Handler()).submit("caption", {}, "user123")
+
+
+def test_background_thread_stores_the_jobs():
+    persistence_queue = queue(Handler(), flush_interval=0.01)
+    persistence_queue.start()
+    try:
+        job = persistence_queue.submit("item", {"name": "item 0"}, "user123")
+        deadline = time.monotonic() + 5
+        while job.status == PENDING and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        persistence_queue.stop()
+
+    assert job.status == STORED
+
+
+def test_status_is_shared_with_the_other_workers(tmp_path):
+    repository = PersistenceJobRepository(
+        session_factory=create_test_database(tmp_path).session
+    )
+    shared = {"status_sink": repository.save_many, "status_source": repository.get}
+    worker = queue(Handler(), **shared)
+    other_worker = queue(Handler(), **shared)
+    job = worker.submit("item", {"name": "item 0"}, "user123")
+
+    assert other_worker.status(job.id) is None
+    worker.drain()
+
+    status = other_worker.status(job.id)
+    assert status.status == STORED
+    assert status.user_id == "user123"
+    assert status.result == {"stored": "item 0"}
+
+
+def test_jobs_of_a_dead_process_are_recovered(tmp_path):
+    dead = queue(Handler(), journal_dir=str(tmp_path))
+    dead._open_journal()
+    stored = dead.submit("item", {"name": "item 0"}, "user123")
+    lost = dead.submit("item", {"name": "item 1"}, "user123")
+    dead._finish(stored, STORED)
+    # The process died: its journal is no longer locked
+    dead._journal.close()
+
+    handler = Handler()
+    persistence_queue = queue(handler, journal_dir=str(tmp_path))
+    persistence_queue._open_journal()
+    persistence_queue.drain()
+
+    assert handler.batches == [[{"name": "item 1"}]]
+    assert persistence_queue.status(lost.id).status == STORED
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_journal_of_a_running_process_is_left_alone(tmp_path):
+    running = queue(Handler(), journal_dir=str(tmp_path))
+    running._open_journal()
+    running.submit("item", {"name": "item 0"}, "user123")
+
+    handler = Handler()
+    persistence_queue = queue(handler, journal_dir=str(tmp_path))
+    persistence_queue._open_journal()
+    persistence_queue.drain()
+
+    assert handler.batches == []
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_lesson_writer_returns_the_category_of_each_lesson():
+    repository = mock.Mock(spec=VocabularyRepository)
+    repository.create_many_with_category.return_value = [
+        CreateWithCategoryResponse(category_id=1, learning_language="ENGLISH"),
+        RuntimeError("database is down"),
+    ]
+    lesson = {
+        "category": "football",
+        "learning_language": "ENGLISH",
+        "translated_language": "VIETNAMESE",
+        "difficulty_level": "EASY",
+        "prompt": "lesson",
+        "translation": "lesson",
+        "questions": [],
+    }
+
+    results = LessonWriter(repository)([{"lesson": lesson, "user_id": "user123"}] * 2)
+
+    assert results[0] == {"category_id": 1, "learning_language": "ENGLISH"}
+    assert isinstance(results[1], RuntimeError)
+
+
+@pytest.mark.asyncio()
+async def test_queued_lesson_ends_the_stream_before_it_is_stored():
+    service, _, repository = vocabulary_service(lesson_chunks(), async_mode=True)
+    handler = mock.Mock(side_effect=lambda payloads: [{}] * len(payloads))
+    service.persistence_queue = PersistenceQueue(handlers={LESSON_JOB: handler})
+
+    events = [
+        json.loads(line)
+        async for line in service.get_new_vocabulary_lessons_async(
+            "user123", lesson_request(NDJSON_STREAM)
+        )
+    ]
+
+    done = events[-1]
+    assert done["event"] == "done"
+    assert "category_id" not in done
+    repository.create_with_category_async.assert_not_called()
+    handler.assert_not_called()
+    job = service.persistence_queue.status(done["persistence_id"])
+    assert job.user_id == "user123"
+
+    service.persistence_queue.drain()
+
+    assert job.status == STORED
@@ -0,0 +1,164 @@
+"""EXPLAIN the hot repository queries on postgres, any sequential scan of a
+large table fails the suite.
+
+Needs a throwaway database, its tables are dropped and created here:
+
+    EXPLAIN_DB_URL=postgresql+psycopg2://... pytest app/tests/query_plans
+"""
+import os
+from typing import Any, Callable, Iterator, List, Set, Tuple
+
+import pytest
+from sqlalchemy import event
+
+from app.infrastructure.db.database import Base, Database
+from app.models.common.pagination import QUERY_COUNT, WINDOW_COUNT
+from app.models.db.image_caption import ImageCaptionPrimaryLanguage
+from app.models.db.vocabulary import Category, VocabularyPrompt
+from app.models.schemas.vocabulary import GetVocabularyHistoryQuestion
+from app.repositories.base_repository import BaseRepository
+from app.repositories.user_repository import UserRepository
+from app.repositories.vocabulary_repository import (
+    VocabularyRepository,
+    _load_lesson_trees,
+)
+from app.tests.vocabulary.test_vocabulary_repository import USER_ID, seed_lessons
+
+EXPLAIN_DB_URL = os.environ.get("EXPLAIN_DB_URL")
+
+pytestmark = [
+    pytest.mark.integration,
+    pytest.mark.skipif(not EXPLAIN_DB_URL, reason="EXPLAIN_DB_URL is not set"),
+]
+
+# Tables which grow with the users, small lookup tables may be scanned
+HOT_TABLES = {
+    "category",
+    "vocabulary_prompts",
+    "vocabulary_prompt_translations",
+    "vocabulary_questions",
+    "vocabulary_question_translations",
+    "vocabulary_answers",
+    "vocabulary_answer_translations",
+    "image_caption",
+    "image_caption_translation",
+    "user_info",
+}
+
+
+@pytest.fixture(scope="module")
+def database() -> Iterator[Database]:
+    db = Database(db_url=EXPLAIN_DB_URL or "")
+    Base.metadata.drop_all(db._engine)
+    db.create_database()
+    try:
+        yield db
+    finally:
+        Base.metadata.drop_all(db._engine)
+
+
+@pytest.fixture(scope="module")
+def category_id(database: Database) -> int:
+    return seed_lessons(database)
+
+
+def capture_selects(db: Database, run: Callable[[], Any]) -> List[Tuple[str, Any]]:
+    statements: List[Tuple[str, Any]] = []
+
+    def before_cursor_execute(  # type: ignore
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(db._engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        run()
+    finally:
+        event.remove(db._engine, "before_cursor_execute", before_cursor_execute)
+    assert statements, "no query was captured"
+    return statements
+
+
+def seq_scans(plan: dict) -> Set[str]:
+    scanned = set()
+    if plan["Node Type"] == "Seq Scan":
+        scanned.add(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        scanned |= seq_scans(child)
+    return scanned
+
+
+def assert_no_seq_scan(db: Database, run: Callable[[], Any]) -> None:
+    statements = capture_selects(db, run)
+    with db._engine.connect() as connection:
+        # The test tables are tiny, without this the planner prefers scanning
+        # them. A sequential scan is then only picked when no index applies.
+        connection.exec_driver_sql("SET enable_seqscan = off")
+        for statement, parameters in statements:
+            plan = connection.exec_driver_sql(
+                f"EXPLAIN (FORMAT JSON) {statement}", parameters
+            ).scalar_one()
+            scanned = seq_scans(plan[0]["Plan"]) & HOT_TABLES
+            assert not scanned, f"sequential scan of {scanned} in:\n{statement}"
+
+
+@pytest.mark.parametrize("count_strategy", [WINDOW_COUNT, QUERY_COUNT])
+def test_history_questions_plan(database, category_id, count_strategy):
+    repository = VocabularyRepository(
+        model=VocabularyPrompt,
+        session_factory=database.session,
+        count_strategy=count_strategy,
+    )
+    question_input = GetVocabularyHistoryQuestion(
+        category_id=category_id, learning_language="english"
+    )
+    first_page = repository.get_history_questions(question_input, USER_ID, 1, 5)
+
+    assert_no_seq_scan(
+        database,
+        lambda: repository.get_history_questions(question_input, USER_ID, 2, 5),
+    )
+    assert_no_seq_scan(
+        database,
+        lambda: repository.get_history_questions(
+            question_input, USER_ID, 1, 5, first_page.next_cursor
+        ),
+    )
+
+
+def test_lesson_children_plan(database, category_id):
+    with database.session() as session:
+        prompt_ids = [id for (id,) in session.query(VocabularyPrompt.id).limit(5)]
+
+    def load_children() -> None:
+        with database.session() as session:
+            _load_lesson_trees(session, prompt_ids)
+
+    assert_no_seq_scan(database, load_children)
+
+
+def test_categories_plan(database, category_id):
+    repository = BaseRepository(
+        model=Category,
+        session_factory=database.session,
+        count_strategy=WINDOW_COUNT,
+    )
+    assert_no_seq_scan(
+        database, lambda: repository.query(Category.user_id == USER_ID, 1, 10)
+    )
+
+
+def test_user_plan(database, category_id):
+    repository = UserRepository(session_factory=database.session)
+    assert_no_seq_scan(database, lambda: repository.get_by_id(USER_ID))
+
+
+def test_image_caption_plan(database, category_id):
+    def user_captions() -> None:
+        with database.session() as session:
+            session.query(ImageCaptionPrimaryLanguage).filter(
+                ImageCaptionPrimaryLanguage.user_id == USER_ID
+            ).all()
+
+    assert_no_seq_scan(database, user_captions)
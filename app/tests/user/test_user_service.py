@@ -0,0 +1,24 @@
+import threading
+from unittest import mock
+
+import pytest
+
+from app.models.db.users import UserInfo
+from app.repositories.user_repository import UserRepository
+from app.services.user_service import UserService
+
+
+@pytest.mark.asyncio()
+async def test_sync_repository_runs_off_the_event_loop():
+    loop_thread = threading.get_ident()
+    threads = []
+    repository = mock.Mock(spec=UserRepository)
+    repository.add.side_effect = lambda user_info: threads.append(threading.get_ident())
+    repository.update.side_effect = repository.add.side_effect
+    service = UserService(user_repository=repository)
+
+    await service.create_user(UserInfo(user_id="user123"))
+    await service.update_user(UserInfo(user_id="user123"))
+
+    assert len(threads) == 2
+    assert loop_thread not in threads
@@ -1,7 +1,13 @@
-from typing import Any
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterable, Iterator
 from unittest import mock
 
+from httpx import Response
+
 from app.infrastructure.auth0.auth0 import Auth0Service
+from app.infrastructure.db.database import Database
+from app.infrastructure.db.instrumentation import QueryStats, track_queries
 from app.models.schemas.users import Auth0User
 
 
@@ -12,9 +18,38 @@ def get_http_header(bearer_key: str = "xyz") -> dict[str, Any]:
     }
 
 
-def mock_user() -> mock.Mock:
+def mock_user(permissions: Iterable[str] = ("read", "write")) -> mock.Mock:
     auth_service_mock = mock.Mock(spec=Auth0Service)
     auth_service_mock.verify_token.return_value = Auth0User(
-        sub="user123", permissions=["read", "write"]
+        sub="user123", permissions=list(permissions)
     )
     return auth_service_mock
+
+
+async def async_stream(chunks: Iterable[str]) -> AsyncIterator[str]:
+    """Replay `chunks` the way `OpenAI.astream` streams a completion."""
+    for chunk in chunks:
+        yield chunk
+
+
+def assert_query_count(response: Response, expected: int) -> None:
+    query_count = int(response.headers["X-DB-Query-Count"])
+    assert (
+        query_count == expected
+    ), f"{response.url} ran {query_count} queries, expected {expected}"
+
+
+@contextmanager
+def assert_num_queries(expected: int) -> Iterator[QueryStats]:
+    with track_queries() as stats:
+        yield stats
+    statements = "\n".join(statement for _, statement in stats.slowest_statements)
+    assert (
+        stats.count == expected
+    ), f"ran {stats.count} queries, expected {expected}, slowest:\n{statements}"
+
+
+def create_test_database(path: Path) -> Database:
+    db = Database(db_url=f"sqlite:///{path / 'test.db'}")
+    db.create_database()
+    return db
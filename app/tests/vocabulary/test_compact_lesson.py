@@ -0,0 +1,162 @@
+import json
+from unittest import mock
+
+import pytest
+from langchain import OpenAI
+
+from app.infrastructure.llm.compact_lesson import (
+    CompactLessonDecoder,
+    decode_compact_question,
+)
+from app.infrastructure.llm.fake import FakeLLM
+from app.infrastructure.llm.usage import LLMCall, UsageRecorder
+from app.infrastructure.llm.vocabulary import (
+    COMPACT_LESSON_FORMAT,
+    VERBOSE_LESSON_FORMAT,
+    ChatGPTVocabularyGenerator,
+)
+from app.repositories.vocabulary_repository import VocabularyRepository
+from app.services.vocabulary_service import VocabularyService
+from app.tests.vocabulary.test_vocabulary_stream import CREATED, lesson_request
+
+COMPACT = [
+    "lesson",
+    "bai hoc",
+    [
+        ["q0", "cau 0", ["A", "B"], ["a", "b"], 1],
+        ["q1", "cau 1", ["C", "D"], ["c", "d"], 0],
+    ],
+]
+
+
+def decode(text: str) -> str:
+    decoder = CompactLessonDecoder("ENGLISH", "VIETNAMESE")
+    # One character per chunk, the way tokens arrive
+    return "".join(decoder.feed(char) for char in text) + decoder.finish()
+
+
+def test_compact_lesson_is_decoded_to_the_bilingual_document():
+    lesson = json.loads(decode(json.dumps(COMPACT)))
+
+    assert lesson == {
+        "ENGLISH": {
+            "lesson": "lesson",
+            "questions": [
+                {"question": "q0", "options": ["A", "B"], "answer": "B"},
+                {"question": "q1", "options": ["C", "D"], "answer": "C"},
+            ],
+        },
+        "VIETNAMESE": {
+            "lesson": "bai hoc",
+            "questions": [
+                {"question": "cau 0", "options": ["a", "b"], "answer": "b"},
+                {"question": "cau 1", "options": ["c", "d"], "answer": "c"},
+            ],
+        },
+    }
+
+
+def test_learning_questions_are_streamed_as_they_complete():
+    decoder = CompactLessonDecoder("ENGLISH", "VIETNAMESE")
+    text = json.dumps(COMPACT)
+
+    decoded = decoder.feed(text[: text.index('["q1"')])
+
+    assert decoded.endswith('"answer": "B"}')
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        ["q0", "cau 0", ["A", "B"], ["a", "b"], 2],
+        ["q0", "cau 0", ["A", "B"], ["a"], 0],
+        ["q0", "cau 0", ["A", "B"], ["a", "b"]],
+        {"question": "q0"},
+    ],
+)
+def test_malformed_question(question):
+    assert decode_compact_question(question) is None
+
+
+def test_malformed_question_is_dropped_from_both_languages():
+    compact = [*COMPACT[:2], [["q0", "cau 0", ["A"], ["a"], 3], *COMPACT[2]]]
+
+    lesson = json.loads(decode(json.dumps(compact)))
+
+    assert [question["question"] for question in lesson["VIETNAMESE"]["questions"]] == [
+        "cau 0",
+        "cau 1",
+    ]
+    assert len(lesson["ENGLISH"]["questions"]) == 2
+
+
+def test_truncated_lesson_keeps_its_complete_questions():
+    text = json.dumps(COMPACT)
+
+    lesson = json.loads(decode(text[: text.index('"q1"') + 6]))
+
+    assert [question["question"] for question in lesson["ENGLISH"]["questions"]] == [
+        "q0"
+    ]
+    assert lesson["VIETNAMESE"]["lesson"] == "bai hoc"
+
+
+def test_text_without_lesson():
+    assert decode("I can not write this lesson") == ""
+
+
+@pytest.mark.asyncio()
+async def test_compact_lesson_is_stored_with_its_answers():
+    repository = mock.Mock(spec=VocabularyRepository)
+    repository.create_with_category.return_value = CREATED
+    service = VocabularyService(
+        voca_generator=ChatGPTVocabularyGenerator(
+            model=FakeLLM(first_token_delay=0, tokens_per_second=0),
+            lesson_format=COMPACT_LESSON_FORMAT,
+        ),
+        voca_repository=repository,
+    )
+
+    [
+        chunk
+        async for chunk in service.get_new_vocabulary_lessons_async(
+            "user123", lesson_request()
+        )
+    ]
+
+    learning_obj = repository.create_with_category.call_args.args[0]
+    assert learning_obj.translation.startswith("A EASY VIETNAMESE lesson")
+    answers = learning_obj.questions[0].answers
+    assert [answer.is_correct for answer in answers] == [True, False]
+    assert answers[1].translation == "VIETNAMESE option 1"
+
+
+@pytest.mark.asyncio()
+async def test_compact_lesson_takes_fewer_completion_tokens():
+    async def completion_tokens(lesson_format: str) -> int:
+        calls: list[LLMCall] = []
+        generator = ChatGPTVocabularyGenerator(
+            model=FakeLLM(first_token_delay=0, tokens_per_second=0),
+            usage=UsageRecorder(sink=calls.extend),
+            lesson_format=lesson_format,
+        )
+        [
+            chunk
+            async for chunk in generator.generate_vocabulary_questions_async(
+                category="football",
+                translated_language="VIETNAMESE",
+                learning_language="ENGLISH",
+            )
+        ]
+        generator.usage.flush()
+        return calls[0].completion_tokens
+
+    verbose = await completion_tokens(VERBOSE_LESSON_FORMAT)
+    compact = await completion_tokens(COMPACT_LESSON_FORMAT)
+
+    assert compact < 0.8 * verbose
+
+
+def test_unknown_lesson_format():
+    with pytest.raises(ValueError, match="Unknown lesson format"):
+        ChatGPTVocabularyGenerator(model=mock.Mock(spec=OpenAI), lesson_format="x")
@@ -0,0 +1,127 @@
+import json
+from io import BytesIO
+from unittest import mock
+
+import pytest
+from dependency_injector import containers
+from openai.error import ServiceUnavailableError
+from replicate.exceptions import ModelError
+
+from app.container.containers import Container
+from app.infrastructure.llm.caption import ChatGPTCaptionGenerator
+from app.infrastructure.llm.fake import FakeLLM
+from app.infrastructure.llm.vocabulary import ChatGPTVocabularyGenerator
+from app.infrastructure.replicate.fake import FakeReplicateClient
+from app.models.schemas.vocabulary import NDJSON_STREAM
+from app.repositories.vocabulary_repository import VocabularyRepository
+from app.services.vocabulary_service import VocabularyService
+from app.tests.vocabulary.test_vocabulary_stream import CREATED, lesson_request
+
+
+def fake_llm(**kwargs) -> FakeLLM:
+    return FakeLLM(first_token_delay=0, tokens_per_second=0, seed=1, **kwargs)
+
+
+async def generate_lesson(model: FakeLLM) -> str:
+    generator = ChatGPTVocabularyGenerator(model=model)
+    chunks = [
+        chunk
+        async for chunk in generator.generate_vocabulary_questions_async(
+            category="football",
+            translated_language="VIETNAMESE",
+            learning_language="ENGLISH",
+            num_questions=3,
+            num_answers=4,
+            level="ADVANCED",
+        )
+    ]
+    return "".join(chunks)
+
+
+@pytest.mark.asyncio()
+async def test_fake_lesson_follows_the_prompt():
+    lesson = json.loads(await generate_lesson(fake_llm()))
+
+    assert list(lesson) == ["ENGLISH", "VIETNAMESE"]
+    assert "football" in lesson["ENGLISH"]["lesson"]
+    assert len(lesson["VIETNAMESE"]["questions"]) == 3
+    question = lesson["ENGLISH"]["questions"][0]
+    assert len(question["options"]) == 4
+    assert question["answer"] in question["options"]
+
+
+@pytest.mark.asyncio()
+async def test_fake_lesson_is_stored_by_the_service():
+    repository = mock.Mock(spec=VocabularyRepository)
+    repository.create_with_category.return_value = CREATED
+    service = VocabularyService(
+        voca_generator=ChatGPTVocabularyGenerator(model=fake_llm()),
+        voca_repository=repository,
+    )
+
+    events = [
+        json.loads(line)
+        async for line in service.get_new_vocabulary_lessons_async(
+            "user123", lesson_request(NDJSON_STREAM)
+        )
+    ]
+
+    assert events[-1]["event"] == "done"
+    assert not events[-1]["salvaged"]
+    repository.create_with_category.assert_called_once()
+
+
+@pytest.mark.asyncio()
+async def test_fake_caption_follows_the_prompt():
+    generator = ChatGPTCaptionGenerator(model=fake_llm())
+
+    chunks = [
+        chunk
+        async for chunk in generator.rewrite_caption_async(
+            "english", "vietnamese", "a cat"
+        )
+    ]
+    caption = json.loads("".join(chunks))
+
+    assert caption == {"english": "english: a cat", "vietnamese": "vietnamese: a cat"}
+
+
+@pytest.mark.asyncio()
+async def test_fake_llm_injects_errors():
+    with pytest.raises(ServiceUnavailableError):
+        await generate_lesson(fake_llm(error_rate=1))
+
+
+@pytest.mark.asyncio()
+async def test_fake_llm_truncates_completions():
+    complete = await generate_lesson(fake_llm())
+    truncated = await generate_lesson(fake_llm(truncate_rate=1))
+
+    assert complete.startswith(truncated)
+    assert len(truncated) < len(complete)
+
+
+def test_fake_replicate_client():
+    client = FakeReplicateClient(latency=0)
+
+    assert "".join(client.run("model", input={"image": BytesIO(b"image")})) == (
+        "a photo of 5 bytes"
+    )
+    with pytest.raises(ModelError):
+        FakeReplicateClient(latency=0, error_rate=1).run(
+            "model", input={"image": BytesIO(b"image")}
+        )
+
+
+class OfflineContainer(Container):
+    # Wiring would point the endpoints at this container instead of the app's
+    wiring_config = containers.WiringConfiguration()
+
+
+def test_container_selects_the_fakes():
+    container = OfflineContainer()
+    container.config.infrastructures.open_ai.backend.from_value("fake")
+    container.config.infrastructures.replicate.backend.from_value("fake")
+
+    assert isinstance(container.chatgpt_caption().model, FakeLLM)
+    assert isinstance(container.caption_client(), FakeReplicateClient)
@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+from app.infrastructure.llm.json_repair import repair_json
+
+
+@pytest.mark.parametrize(
+    ("text", "repaired"),
+    [
+        ('{"a": [1, 2,], "b": "c",}', {"a": [1, 2], "b": "c"}),
+        ('{"a": "line one\nline two"}', {"a": "line one\nline two"}),
+        ('{"a": "a \\"quoted\\" word\\n"}', {"a": 'a "quoted" word\n'}),
+        ('Here is the lesson:\n```json\n{"a": 1}\n```', {"a": 1}),
+        ('{"a": [1, 2], "b": "trunc', {"a": [1, 2]}),
+        ('{"a": [{"q": "x", "o": ["A", "B', {"a": [{"q": "x", "o": ["A"]}]}),
+        ('{"a": 1, "b": tru', {"a": 1}),
+        ('{"a": 1, "b":', {"a": 1}),
+        ('{"a": {"b": 1}, ', {"a": {"b": 1}}),
+        ('{"ENGLISH": ', {}),
+    ],
+)
+def test_near_valid_json_is_repaired(text, repaired):
+    assert json.loads(repair_json(text)) == repaired
+
+
+def test_valid_json_is_unchanged():
+    text = '{"a": [1, {"b": "c"}], "d": null}'
+
+    assert repair_json(text) == text
+
+
+def test_text_without_document():
+    assert repair_json("I can not write this lesson") == ""
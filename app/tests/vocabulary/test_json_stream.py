@@ -0,0 +1,68 @@
+from app.infrastructure.llm.json_stream import IncrementalJSONParser
+
+LESSON = """Here is your lesson: {
+    "english": {
+        "lesson": "line one
+                   line two",
+        "questions": [
+            {"question": "a \\"quoted\\" word?", "options": ["A", "B"], "answer": "A"},
+            {"question": "q2", "options": ["C", "D"], "answer": "D", "points": 10}
+        ]
+    },
+    "vietnamese": {"lesson": "bai hoc", "questions": []}
+} trailing text"""
+
+
+def feed_by_char(parser: IncrementalJSONParser, text: str) -> list:
+    completed = []
+    for char in text:
+        completed += parser.feed(char)
+    return completed
+
+
+def test_values_are_returned_once_complete():
+    parser = IncrementalJSONParser(depths=(2, 3))
+
+    completed = feed_by_char(parser, LESSON)
+
+    assert [path for path, _ in completed] == [
+        ("english", "lesson"),
+        ("english", "questions", 0),
+        ("english", "questions", 1),
+        ("english", "questions"),
+        ("vietnamese", "lesson"),
+        ("vietnamese", "questions"),
+    ]
+    assert completed[0][1].split() == ["line", "one", "line", "two"]
+    assert completed[1][1] == {
+        "question": 'a "quoted" word?',
+        "options": ["A", "B"],
+        "answer": "A",
+    }
+    assert completed[2][1]["points"] == 10
+    assert parser.complete
+
+
+def test_question_is_returned_before_the_document_ends():
+    parser = IncrementalJSONParser(depths=(3,))
+    end_of_first_question = LESSON.index('"A"}') + len('"A"}')
+
+    assert parser.feed(LESSON[: end_of_first_question - 1]) == []
+    completed = parser.feed(LESSON[end_of_first_question - 1 : end_of_first_question])
+
+    assert completed == [
+        (
+            ("english", "questions", 0),
+            {"question": 'a "quoted" word?', "options": ["A", "B"], "answer": "A"},
+        )
+    ]
+    assert not parser.complete
+
+
+def test_broken_value_is_dropped():
+    parser = IncrementalJSONParser(depths=(1,))
+
+    completed = parser.feed('{"a": [1, 2,], "b": {"c": true}, "d": nul}')
+
+    assert completed == [(("b",), {"c": True})]
+    assert parser.complete
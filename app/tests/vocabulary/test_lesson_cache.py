@@ -0,0 +1,146 @@
+import json
+import time
+from unittest import mock
+
+import pytest
+
+from app.infrastructure.llm.lesson_cache import LessonCache, lesson_cache_key
+from app.infrastructure.llm.vocabulary import ChatGPTVocabularyGenerator
+from app.infrastructure.metrics.metrics import MetricsRegistry
+from app.models.schemas.vocabulary import GetVocabularyQuestions
+from app.repositories.vocabulary_repository import (
+    CreateWithCategoryResponse,
+    VocabularyRepository,
+)
+from app.services.vocabulary_service import PromptParserException, VocabularyService
+from app.tests.utils import async_stream
+
+LESSON = {
+    "english": {
+        "lesson": "lesson",
+        "questions": [{"question": "q", "options": ["A", "B"], "answer": "A"}],
+    },
+    "vietnamese": {
+        "lesson": "bai hoc",
+        "questions": [{"question": "cau hoi", "options": ["A", "B"], "answer": "A"}],
+    },
+}
+
+
+def lesson_request(**kwargs) -> GetVocabularyQuestions:
+    return GetVocabularyQuestions(
+        **{
+            "category": "football",
+            "learning_language": "english",
+            "translated_language": "vietnamese",
+            "num_questions": 1,
+            "num_answers": 2,
+            **kwargs,
+        }
+    )
+
+
+@pytest.fixture()
+def generator():
+    generator = mock.Mock(spec=ChatGPTVocabularyGenerator)
+    generator.generate_vocabulary_questions_async.side_effect = lambda **_: (
+        async_stream([json.dumps(LESSON)[:10], json.dumps(LESSON)[10:]])
+    )
+    return generator
+
+
+@pytest.fixture()
+def service(generator):
+    repository = mock.Mock(spec=VocabularyRepository)
+    repository.create_with_category.return_value = CreateWithCategoryResponse(
+        1, "english"
+    )
+    return VocabularyService(
+        voca_generator=generator,
+        voca_repository=repository,
+        lesson_cache=LessonCache(max_size=10, ttl=60),
+    )
+
+
+async def generate(service: VocabularyService, user_id: str, **kwargs) -> list[str]:
+    return [
+        chunk
+        async for chunk in service.get_new_vocabulary_lessons_async(
+            user_id, lesson_request(**kwargs)
+        )
+    ]
+
+
+def test_lesson_cache_key_normalization():
+    assert lesson_cache_key(
+        "  Premier   League ", "english", "vietnamese", "easy", 5, 3
+    ) == lesson_cache_key("premier league", "english", "vietnamese", "EASY", 5, 3)
+    # The generated JSON is keyed by the languages as requested
+    assert lesson_cache_key(
+        "football", "English", "vietnamese", "EASY", 5, 3
+    ) != lesson_cache_key("football", "english", "vietnamese", "EASY", 5, 3)
+
+
+def test_lesson_cache_lru_eviction():
+    metrics = MetricsRegistry()
+    cache = LessonCache(max_size=2, ttl=60, metrics=metrics)
+    cache.set(("a",), "lesson a")  # type: ignore
+    cache.set(("b",), "lesson b")  # type: ignore
+    assert cache.get(("a",)) == "lesson a"  # type: ignore
+    cache.set(("c",), "lesson c")  # type: ignore
+
+    assert cache.get(("b",)) is None  # type: ignore
+    assert cache.get(("a",)) == "lesson a"  # type: ignore
+    assert cache.get(("c",)) == "lesson c"  # type: ignore
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["lesson_cache_evictions_total"] == 1
+    assert snapshot["counters"]["lesson_cache_hits_total"] == 3
+    assert snapshot["counters"]["lesson_cache_misses_total"] == 1
+    assert snapshot["gauges"]["lesson_cache_size"] == 2
+
+
+def test_lesson_cache_ttl():
+    cache = LessonCache(max_size=2, ttl=0.01)
+    cache.set(("a",), "lesson a")  # type: ignore
+    time.sleep(0.02)
+    assert cache.get(("a",)) is None  # type: ignore
+
+
+def test_lesson_cache_disabled():
+    cache = LessonCache(max_size=0)
+    cache.set(("a",), "lesson a")  # type: ignore
+    assert cache.get(("a",)) is None  # type: ignore
+
+
+@pytest.mark.asyncio()
+async def test_cached_lesson_is_replayed(service, generator):
+    first = await generate(service, "user1")
+    second = await generate(service, "user2", category="Football ")
+
+    assert generator.generate_vocabulary_questions_async.call_count == 1
+    # The whole lesson is replayed in one chunk, the lesson is still saved
+    # for the second user
+    assert second[0] == "".join(first[:2])
+    assert second[1:] == first[2:]
+    assert service.voca_repository.create_with_category.call_args[0][1] == "user2"
+
+
+@pytest.mark.asyncio()
+async def test_fresh_lesson_skips_cache(service, generator):
+    await generate(service, "user1")
+    await generate(service, "user1", fresh=True)
+
+    assert generator.generate_vocabulary_questions_async.call_count == 2
+
+
+@pytest.mark.asyncio()
+async def test_unparsable_lesson_is_not_cached(service, generator):
+    generator.generate_vocabulary_questions_async.side_effect = lambda **_: (
+        async_stream(["{"])
+    )
+    with pytest.raises(PromptParserException):
+        await generate(service, "user1")
+    with pytest.raises(PromptParserException):
+        await generate(service, "user1")
+
+    assert generator.generate_vocabulary_questions_async.call_count == 2
@@ -0,0 +1,112 @@
+import json
+from unittest import mock
+
+import pytest
+from langchain import OpenAI
+
+from app.infrastructure.llm.fake import FakeLLM
+from app.infrastructure.llm.vocabulary import (
+    ChatGPTVocabularyGenerator,
+    lesson_token_budget,
+)
+from app.repositories.vocabulary_repository import VocabularyRepository
+from app.services.vocabulary_service import VocabularyService
+from app.tests.vocabulary.test_vocabulary_stream import lesson_text
+
+LESSON = lesson_text()
+
+
+class Upstream:
+    """A completion which goes on after its JSON document."""
+
+    def __init__(self, chunks: list[str]) -> None:
+        self.chunks = chunks
+        self.sent = 0
+        self.closed = False
+
+    def stream(self, prompt: str, **kwargs):
+        try:
+            for chunk in self.chunks:
+                self.sent += 1
+                yield chunk
+        finally:
+            self.closed = True
+
+    async def astream(self, prompt: str, **kwargs):
+        for chunk in self.stream(prompt):
+            yield chunk
+
+
+def generator_for(upstream: Upstream, **kwargs) -> ChatGPTVocabularyGenerator:
+    model = mock.Mock(spec=OpenAI)
+    model.astream.side_effect = upstream.astream
+    return ChatGPTVocabularyGenerator(model=model, **kwargs)
+
+
+async def generate(generator: ChatGPTVocabularyGenerator, **kwargs) -> str:
+    chunks = [
+        chunk
+        async for chunk in generator.generate_vocabulary_questions_async(
+            "football", "VIETNAMESE", "ENGLISH", **kwargs
+        )
+    ]
+    return "".join(chunks)
+
+
+@pytest.mark.asyncio()
+async def test_stream_stops_at_the_end_of_the_document():
+    upstream = Upstream([LESSON[:10], LESSON[10:] + "\n\nI hope", " this helps!"])
+
+    assert await generate(generator_for(upstream)) == LESSON
+    assert upstream.sent == 2
+    assert upstream.closed
+
+
+@pytest.mark.asyncio()
+async def test_max_tokens_is_budgeted_from_the_lesson_shape():
+    upstream = Upstream([LESSON])
+    generator = generator_for(upstream, max_completion_tokens=3000)
+
+    await generate(generator, num_questions=2, num_answers=3)
+    await generate(generator, num_questions=50, num_answers=10)
+
+    max_tokens = [
+        call.kwargs["max_tokens"] for call in generator.model.astream.call_args_list
+    ]
+    assert max_tokens == [lesson_token_budget(2, 3, languages=2), 3000]
+    assert lesson_token_budget(2, 3, 2) < lesson_token_budget(5, 3, 2)
+
+
+@pytest.mark.asyncio()
+async def test_fake_llm_stops_at_max_tokens():
+    model = FakeLLM(first_token_delay=0, tokens_per_second=0)
+
+    chunks = [chunk async for chunk in model.astream("prompt", max_tokens=2)]
+
+    assert len(chunks) == 2
+
+
+def test_lesson_shape_limits():
+    service = VocabularyService(
+        voca_generator=mock.Mock(spec=ChatGPTVocabularyGenerator),
+        voca_repository=mock.Mock(spec=VocabularyRepository),
+        max_questions=10,
+        max_answers=6,
+    )
+
+    assert service.valid_shape(10, 6)
+    assert service.valid_shape(1, 1)
+    assert not service.valid_shape(11, 3)
+    assert not service.valid_shape(5, 7)
+    assert not service.valid_shape(0, 3)
+
+
+@pytest.mark.asyncio()
+async def test_budgeted_lesson_is_complete():
+    generator = ChatGPTVocabularyGenerator(
+        model=FakeLLM(first_token_delay=0, tokens_per_second=0)
+    )
+
+    lesson = json.loads(await generate(generator, num_questions=10, num_answers=6))
+
+    assert len(lesson["VIETNAMESE"]["questions"]) == 10
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import timedelta
+from typing import AsyncIterator
+from unittest import mock
+
+import pytest
+
+from app.infrastructure.llm.vocabulary import ChatGPTVocabularyGenerator
+from app.models.db.vocabulary import VocabularyPrompt
+from app.models.schemas.vocabulary import GetVocabularyQuestions
+from app.repositories.vocabulary_repository import (
+    CreateWithCategoryResponse,
+    PopularLesson,
+    VocabularyRepository,
+)
+from app.services.lesson_pool import LessonPool
+from app.services.vocabulary_service import VocabularyService
+from app.tests.utils import async_stream, create_test_database
+from app.tests.vocabulary.test_vocabulary_repository import (
+    CREATED_AT,
+    NUM_PROMPTS,
+    seed_lessons,
+)
+
+POPULAR = PopularLesson("football", "ENGLISH", "VIETNAMESE", "EASY", NUM_PROMPTS)
+
+
+def generated_lesson(**kwargs) -> list[str]:
+    part = {
+        "lesson": "lesson",
+        "questions": [{"question": "q", "options": ["A", "B"], "answer": "A"}],
+    }
+    return [
+        json.dumps(
+            {kwargs["learning_language"]: part, kwargs["translated_language"]: part}
+        )
+    ]
+
+
+def generated_stream(**kwargs) -> AsyncIterator[str]:
+    return async_stream(generated_lesson(**kwargs))
+
+
+def lesson_request(**kwargs) -> GetVocabularyQuestions:
+    return GetVocabularyQuestions(
+        **{
+            "category": "Football",
+            "learning_language": "english",
+            "translated_language": "vietnamese",
+            **kwargs,
+        }
+    )
+
+
+def wait_for_pool(pool: LessonPool, expected: int) -> None:
+    deadline = time.monotonic() + 5
+    while pool._pooled() < expected or any(pool._pending.values()):
+        assert time.monotonic() < deadline, "the pool was not filled"
+        time.sleep(0.01)
+
+
+@pytest.fixture()
+def generator():
+    generator = mock.Mock(spec=ChatGPTVocabularyGenerator)
+    generator.generate_vocabulary_questions_async.side_effect = generated_stream
+    return generator
+
+
+@pytest.fixture()
+def pool(generator):
+    repository = mock.Mock(spec=VocabularyRepository)
+    repository.get_popular_lessons.return_value = [POPULAR]
+    pool = LessonPool(generator, repository, size=2)
+    yield pool
+    pool.stop()
+
+
+def test_get_popular_lessons(tmp_path):
+    database = create_test_database(tmp_path)
+    seed_lessons(database)
+    repository = VocabularyRepository(
+        model=VocabularyPrompt, session_factory=database.session
+    )
+
+    assert repository.get_popular_lessons(CREATED_AT - timedelta(days=1), 5) == [
+        POPULAR
+    ]
+    assert repository.get_popular_lessons(CREATED_AT + timedelta(days=1), 5) == []
+
+
+def test_pop_pooled_lesson(pool, generator):
+    pool.refresh()
+    wait_for_pool(pool, 2)
+    assert generator.generate_vocabulary_questions_async.call_count == 2
+
+    lesson = json.loads(pool.pop(lesson_request()))
+    # The lesson is keyed by the languages as requested
+    assert set(lesson) == {"english", "vietnamese"}
+    wait_for_pool(pool, 2)
+    assert generator.generate_vocabulary_questions_async.call_count == 3
+
+
+def test_pop_without_pooled_lesson(pool, generator):
+    assert pool.pop(lesson_request()) is None
+    pool.refresh()
+    wait_for_pool(pool, 2)
+    assert pool.pop(lesson_request(category="movie")) is None
+    assert pool.pop(lesson_request(num_questions=2)) is None
+
+
+def test_failed_generation_is_not_pooled(pool, generator):
+    generator.generate_vocabulary_questions_async.side_effect = lambda **_: (
+        async_stream(["{"])
+    )
+    pool.refresh()
+    wait_for_pool(pool, 0)
+    assert pool.pop(lesson_request()) is None
+    assert pool.metrics.snapshot()["counters"]["lesson_pool_failures_total"] == 2
+
+
+@pytest.mark.asyncio()
+async def test_service_serves_pooled_lesson(generator):
+    pool = mock.Mock(spec=LessonPool)
+    pool.pop.return_value = "".join(
+        generated_lesson(learning_language="english", translated_language="vietnamese")
+    )
+    repository = mock.Mock(spec=VocabularyRepository)
+    repository.create_with_category.return_value = CreateWithCategoryResponse(
+        1, "english"
+    )
+    service = VocabularyService(
+        voca_generator=generator, voca_repository=repository, lesson_pool=pool
+    )
+
+    chunks = [
+        chunk
+        async for chunk in service.get_new_vocabulary_lessons_async(
+            "user1", lesson_request()
+        )
+    ]
+
+    assert chunks[0] == pool.pop.return_value
+    generator.generate_vocabulary_questions_async.assert_not_called()
+    repository.create_with_category.assert_called_once()
+
+
+def test_pool_generates_on_its_own_event_loops(pool, generator):
+    threads = []
+
+    def generated_on_a_loop(**kwargs):
+        asyncio.get_running_loop()
+        threads.append(threading.get_ident())
+        return generated_stream(**kwargs)
+
+    generator.generate_vocabulary_questions_async.side_effect = generated_on_a_loop
+    pool.refresh()
+    wait_for_pool(pool, 2)
+
+    assert len(threads) == 2
+    assert threading.get_ident() not in threads
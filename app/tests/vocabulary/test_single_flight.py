@@ -0,0 +1,216 @@
+import asyncio
+import json
+from io import BytesIO
+from unittest import mock
+
+import pytest
+from langchain import OpenAI
+from replicate import Client
+
+from app.infrastructure.llm.caption import ChatGPTCaptionGenerator
+from app.infrastructure.llm.single_flight import StreamCoalescer
+from app.infrastructure.llm.vocabulary import ChatGPTVocabularyGenerator
+from app.infrastructure.metrics.metrics import MetricsRegistry
+from app.infrastructure.replicate.caption import CaptionGenerator
+from app.repositories.caption_repository import (
+    CaptionRepository,
+    TranslatedCaptionRepository,
+)
+from app.repositories.vocabulary_repository import (
+    CreateWithCategoryResponse,
+    VocabularyRepository,
+)
+from app.services.caption_service import CaptionService
+from app.services.vocabulary_service import VocabularyService
+from app.tests.vocabulary.test_vocabulary_stream import lesson_request, lesson_text
+
+NUM_CALLERS = 5
+
+
+class GatedUpstream:
+    """An upstream stream which waits for `release` before streaming, so the
+    concurrent callers are all in flight at the same time."""
+
+    def __init__(self, chunks: list[str]) -> None:
+        self.chunks = chunks
+        self.calls = 0
+        self.released = asyncio.Event()
+        self.cancelled = False
+
+    async def stream(self, *args, **kwargs):
+        self.calls += 1
+        await self.released.wait()
+        try:
+            for chunk in self.chunks:
+                yield chunk
+                await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+async def release_when_waiting(upstream: GatedUpstream) -> None:
+    # Let every caller start and attach before the first chunk
+    for _ in range(10):
+        await asyncio.sleep(0)
+    upstream.released.set()
+
+
+async def collect(stream) -> list[str]:
+    return [chunk async for chunk in stream]
+
+
+@pytest.mark.asyncio()
+async def test_concurrent_identical_streams_share_one_upstream_call():
+    upstream = GatedUpstream(["a", "b", "c"])
+    metrics = MetricsRegistry()
+    coalescer = StreamCoalescer(metrics=metrics)
+
+    results = await asyncio.gather(
+        *(
+            collect(coalescer.stream("key", upstream.stream))
+            for _ in range(NUM_CALLERS)
+        ),
+        release_when_waiting(upstream),
+    )
+
+    assert upstream.calls == 1
+    assert results[:NUM_CALLERS] == [["a", "b", "c"]] * NUM_CALLERS
+    counters = metrics.snapshot()["counters"]
+    assert counters["llm_upstream_streams_total"] == 1
+    assert counters["llm_coalesced_streams_total"] == NUM_CALLERS - 1
+
+
+@pytest.mark.asyncio()
+async def test_late_subscriber_replays_streamed_chunks():
+    upstream = GatedUpstream(["a", "b", "c"])
+    coalescer = StreamCoalescer()
+    upstream.released.set()
+    first = coalescer.stream("key", upstream.stream)
+
+    assert await first.__anext__() == "a"
+    assert await collect(coalescer.stream("key", upstream.stream)) == ["a", "b", "c"]
+    assert await collect(first) == ["b", "c"]
+    assert upstream.calls == 1
+
+
+@pytest.mark.asyncio()
+async def test_finished_stream_is_not_reused():
+    upstream = GatedUpstream(["a"])
+    coalescer = StreamCoalescer()
+    upstream.released.set()
+
+    await collect(coalescer.stream("key", upstream.stream))
+    await collect(coalescer.stream("key", upstream.stream))
+
+    assert upstream.calls == 2
+
+
+@pytest.mark.asyncio()
+async def test_upstream_error_reaches_every_subscriber():
+    async def failing():
+        yield "a"
+        raise ValueError("upstream failed")
+
+    coalescer = StreamCoalescer()
+    results = await asyncio.gather(
+        collect(coalescer.stream("key", failing)),
+        collect(coalescer.stream("key", failing)),
+        return_exceptions=True,
+    )
+
+    assert [type(result) for result in results] == [ValueError, ValueError]
+
+
+@pytest.mark.asyncio()
+async def test_upstream_is_cancelled_without_subscribers():
+    upstream = GatedUpstream(["a", "b", "c"])
+    coalescer = StreamCoalescer()
+    upstream.released.set()
+    stream = coalescer.stream("key", upstream.stream)
+
+    assert await stream.__anext__() == "a"
+    await stream.aclose()
+    await asyncio.sleep(0)
+
+    assert upstream.cancelled
+
+
+@pytest.mark.asyncio()
+async def test_concurrent_lessons_share_one_completion():
+    upstream = GatedUpstream(list(lesson_text()))
+    open_ai_mock = mock.Mock(spec=OpenAI)
+    open_ai_mock.astream.side_effect = upstream.stream
+    repository = mock.Mock(spec=VocabularyRepository)
+    repository.create_with_category.side_effect = [
+        CreateWithCategoryResponse(category_id=index, learning_language="ENGLISH")
+        for index in range(NUM_CALLERS)
+    ]
+    service = VocabularyService(
+        voca_generator=ChatGPTVocabularyGenerator(
+            model=open_ai_mock, coalescer=StreamCoalescer()
+        ),
+        voca_repository=repository,
+    )
+
+    await asyncio.gather(
+        *(
+            collect(
+                service.get_new_vocabulary_lessons_async(
+                    f"user{index}", lesson_request()
+                )
+            )
+            for index in range(NUM_CALLERS)
+        ),
+        release_when_waiting(upstream),
+    )
+
+    assert open_ai_mock.astream.call_count == 1
+    # Every user gets its own copy of the lesson
+    assert sorted(
+        call.args[1] for call in repository.create_with_category.call_args_list
+    ) == [f"user{index}" for index in range(NUM_CALLERS)]
+
+
+@pytest.mark.asyncio()
+async def test_concurrent_captions_share_one_upstream_call():
+    caption = json.dumps({"english": "a cat", "vietnamese": "con meo"})
+    upstream = GatedUpstream([caption])
+    open_ai_mock = mock.Mock(spec=OpenAI)
+    open_ai_mock.astream.side_effect = upstream.stream
+    replicate_mock = mock.Mock(spec=Client)
+    replicate_mock.run.return_value = iter(["a cat"])
+    coalescer = StreamCoalescer()
+    primary_caption_repository = mock.Mock(spec=CaptionRepository)
+    service = CaptionService(
+        primary_caption_repository=primary_caption_repository,
+        learning_caption_repository=mock.Mock(spec=TranslatedCaptionRepository),
+        caption_generator=CaptionGenerator(
+            caption_client=replicate_mock, model_id="model", coalescer=coalescer
+        ),
+        chatgpt_caption=ChatGPTCaptionGenerator(
+            model=open_ai_mock, coalescer=coalescer
+        ),
+    )
+
+    await asyncio.gather(
+        *(
+            collect(
+                service.get_caption_from_image_async(
+                    f"user{index}",
+                    {
+                        "file": BytesIO(b"image"),
+                        "path": "user/image.jpg",
+                        "primary_language": "vietnamese",
+                        "learning_language": "english",
+                    },
+                )
+            )
+            for index in range(NUM_CALLERS)
+        ),
+        release_when_waiting(upstream),
+    )
+
+    assert replicate_mock.run.call_count == 1
+    assert open_ai_mock.astream.call_count == 1
+    assert primary_caption_repository.add_image_caption.call_count == NUM_CALLERS
@@ -0,0 +1,137 @@
+import json
+import time
+from unittest import mock
+
+import pytest
+from langchain import OpenAI
+
+from app.infrastructure.llm.fake import FakeLLM
+from app.infrastructure.llm.vocabulary import (
+    BILINGUAL_GENERATION,
+    SPLIT_GENERATION,
+    ChatGPTVocabularyGenerator,
+)
+from app.repositories.vocabulary_repository import VocabularyRepository
+from app.services.vocabulary_service import VocabularyService
+from app.tests.utils import async_stream
+from app.tests.vocabulary.test_vocabulary_stream import CREATED, lesson_request
+
+
+async def generate(generator: ChatGPTVocabularyGenerator, **kwargs) -> str:
+    chunks = [
+        chunk
+        async for chunk in generator.generate_vocabulary_questions_async(
+            category="football",
+            translated_language="VIETNAMESE",
+            learning_language="ENGLISH",
+            **{"num_questions": 3, "num_answers": 3, **kwargs},
+        )
+    ]
+    return "".join(chunks)
+
+
+@pytest.mark.asyncio()
+async def test_split_lesson_is_a_bilingual_document():
+    generator = ChatGPTVocabularyGenerator(
+        model=FakeLLM(first_token_delay=0, tokens_per_second=0),
+        generation_mode=SPLIT_GENERATION,
+    )
+
+    lesson = json.loads(await generate(generator))
+
+    assert list(lesson) == ["ENGLISH", "VIETNAMESE"]
+    translated = lesson["VIETNAMESE"]
+    assert translated["lesson"] == f"VIETNAMESE: {lesson['ENGLISH']['lesson']}"
+    assert len(translated["questions"]) == 3
+    question = translated["questions"][0]
+    assert question["question"].startswith("VIETNAMESE: ")
+    # The answer is the translation of the option the learning answer is
+    assert question["answer"] == question["options"][0]
+
+
+@pytest.mark.asyncio()
+async def test_split_lesson_is_stored_with_its_translation():
+    repository = mock.Mock(spec=VocabularyRepository)
+    repository.create_with_category.return_value = CREATED
+    service = VocabularyService(
+        voca_generator=ChatGPTVocabularyGenerator(
+            model=FakeLLM(first_token_delay=0, tokens_per_second=0),
+            generation_mode=SPLIT_GENERATION,
+        ),
+        voca_repository=repository,
+    )
+
+    [
+        chunk
+        async for chunk in service.get_new_vocabulary_lessons_async(
+            "user123", lesson_request()
+        )
+    ]
+
+    learning_obj = repository.create_with_category.call_args.args[0]
+    assert learning_obj.translation.startswith("VIETNAMESE: ")
+    assert len(learning_obj.questions) == 1
+    answers = learning_obj.questions[0].answers
+    assert [answer.is_correct for answer in answers] == [True, False]
+    assert answers[0].translation == f"VIETNAMESE: {answers[0].answer_text}"
+
+
+@pytest.mark.asyncio()
+async def test_split_lesson_takes_about_one_language():
+    def generator(mode: str) -> ChatGPTVocabularyGenerator:
+        return ChatGPTVocabularyGenerator(
+            model=FakeLLM(first_token_delay=0.05, tokens_per_second=400),
+            generation_mode=mode,
+        )
+
+    started = time.perf_counter()
+    await generate(generator(BILINGUAL_GENERATION), num_questions=5)
+    bilingual = time.perf_counter() - started
+    started = time.perf_counter()
+    await generate(generator(SPLIT_GENERATION), num_questions=5)
+    split = time.perf_counter() - started
+
+    assert split < 0.75 * bilingual
+
+
+@pytest.mark.asyncio()
+async def test_questions_after_a_failed_translation_are_dropped():
+    learning = {
+        "lesson": "lesson",
+        "questions": [
+            {"question": f"q{index}", "options": ["A", "B"], "answer": "B"}
+            for index in range(3)
+        ],
+    }
+
+    def astream(prompt: str, **kwargs):
+        if "Translate" not in prompt:
+            return async_stream([json.dumps(learning)])
+        if '"q1"' in prompt:
+            return async_stream(["I can not translate this"])
+        content = json.loads(prompt[prompt.index("{") :])
+        translated = {
+            key: [f"vi {option}" for option in value]
+            if isinstance(value, list)
+            else f"vi {value}"
+            for key, value in content.items()
+        }
+        return async_stream([json.dumps(translated)])
+
+    model = mock.Mock(spec=OpenAI)
+    model.astream.side_effect = astream
+    generator = ChatGPTVocabularyGenerator(
+        model=model, generation_mode=SPLIT_GENERATION
+    )
+
+    lesson = json.loads(await generate(generator))
+
+    assert lesson["VIETNAMESE"]["lesson"] == "vi lesson"
+    assert [question["question"] for question in lesson["VIETNAMESE"]["questions"]] == [
+        "vi q0"
+    ]
+
+
+def test_unknown_generation_mode():
+    with pytest.raises(ValueError, match="Unknown lesson generation mode"):
+        ChatGPTVocabularyGenerator(model=mock.Mock(spec=OpenAI), generation_mode="x")
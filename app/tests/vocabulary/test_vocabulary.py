@@ -1,3 +1,4 @@
+import asyncio
 import json
 from typing import Any, Iterator
 from unittest import mock
@@ -6,6 +7,8 @@ import pytest
 from fastapi.testclient import TestClient
 from langchain import OpenAI
 
+from app.infrastructure.llm.lesson_cache import LessonCache
+from app.infrastructure.llm.vocabulary import ChatGPTVocabularyGenerator
 from app.main import app
 from app.models.db.vocabulary import Category
 from app.models.schemas.vocabulary import (
@@ -14,19 +17,24 @@ from app.models.schemas.vocabulary import (
     VocabularyQuestionCreate,
 )
 from app.repositories.vocabulary_repository import VocabularyRepository
+from app.services.admission import AdmissionController
 from app.services.base_service import BaseService
 from app.services.vocabulary_service import (
     PromptParserException,
     VocabularyService,
     parse_json_prompt,
 )
-from app.tests.utils import get_http_header, mock_user
+from app.tests.utils import async_stream, get_http_header, mock_user
 
 LEARNING_LANGUAGE = "english"
 TRANSLATED_LANGUAGE = "vietnamese"
 APPLICATION_JSON = "application/json"
 CATEGORY = "mock_category"
 VOCABULARY_QUESTION_URL = "/api/v1/lesson/vocabulary/question"
+VOCABULARY_BATCH_URL = "/api/v1/lesson/vocabulary/question/batch"
+
+
+pytestmark = pytest.mark.usefixtures("_fresh_admission_controller")
 
 
 @pytest.fixture()
@@ -34,6 +42,14 @@ def client():
     return TestClient(app)
 
 
+@pytest.fixture(autouse=True)
+def _lesson_cache():
+    # Lessons generated by a test must not be replayed to the next ones
+    app.container.lesson_cache.override(LessonCache())
+    yield
+    app.container.lesson_cache.reset_override()
+
+
 def mock_category() -> list[Category]:
     return [
         Category(id=1, category_name="football"),
@@ -150,7 +166,7 @@ def test_func_generate_vocabulary_questions(client):
     voca_repo_mock = mock.Mock(spec=VocabularyRepository)
 
     open_ai_mock = mock.Mock(spec=OpenAI)
-    open_ai_mock.stream.return_value = mock_chat_gpt_response()
+    open_ai_mock.astream.return_value = async_stream(mock_chat_gpt_response())
 
     app.container.auth.override(auth_service_mock)
     app.container.vocabulary_repository.override(voca_repo_mock)
@@ -187,11 +203,112 @@ def test_func_generate_vocabulary_questions_invalid_level_type(client):
     assert response.json()["status_code"] == 10003
 
 
+def test_func_generate_vocabulary_questions_invalid_stream_format(client):
+    auth_service_mock = mock_user()
+    app.container.auth.override(auth_service_mock)
+    payload = {
+        "category": "football",
+        "translated_language": "english",
+        "learning_language": "vietnamese",
+        "stream_format": "xml",
+        "num_questions": 1,
+        "num_answers": 1,
+    }
+    response = client.post(
+        VOCABULARY_QUESTION_URL, headers=get_http_header(), json=payload
+    )
+    assert response.status_code == 200
+    assert response.json()["status_code"] == 10004
+
+
+def test_func_generate_vocabulary_questions_invalid_shape(client):
+    auth_service_mock = mock_user()
+    app.container.auth.override(auth_service_mock)
+    payload = {
+        "category": "football",
+        "translated_language": "english",
+        "learning_language": "vietnamese",
+        "num_questions": 1000,
+        "num_answers": 1,
+    }
+    response = client.post(
+        VOCABULARY_QUESTION_URL, headers=get_http_header(), json=payload
+    )
+    assert response.status_code == 200
+    assert response.json()["status_code"] == 10006
+
+
+def test_func_generate_vocabulary_questions_rate_limited(client):
+    auth_service_mock = mock_user()
+    admission_controller = AdmissionController(user_burst=1, user_refill_seconds=60)
+    asyncio.run(admission_controller.acquire("user123"))
+    app.container.auth.override(auth_service_mock)
+    app.container.admission_controller.override(admission_controller)
+    payload = {
+        "category": "football",
+        "translated_language": "english",
+        "learning_language": "vietnamese",
+        "num_questions": 1,
+        "num_answers": 1,
+    }
+    response = client.post(
+        VOCABULARY_QUESTION_URL, headers=get_http_header(), json=payload
+    )
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "60"
+
+
+def test_func_generate_vocabulary_question_batch(client):
+    auth_service_mock = mock_user()
+    voca_repo_mock = mock.Mock(spec=VocabularyRepository)
+    open_ai_mock = mock.Mock(spec=OpenAI)
+    open_ai_mock.astream.side_effect = lambda prompt, **kwargs: async_stream(
+        mock_chat_gpt_response()
+    )
+
+    app.container.auth.override(auth_service_mock)
+    app.container.vocabulary_repository.override(voca_repo_mock)
+    # The generator singleton may already hold the model of an earlier test
+    app.container.chatGPT_vocabulary_generator.override(
+        ChatGPTVocabularyGenerator(model=open_ai_mock)
+    )
+    lesson = {
+        "category": "football",
+        "translated_language": "vietnamese",
+        "learning_language": "english",
+        "num_questions": 1,
+        "num_answers": 1,
+    }
+    try:
+        response = client.post(
+            VOCABULARY_BATCH_URL,
+            headers=get_http_header(),
+            json={"lessons": [lesson, {**lesson, "category": "movie"}]},
+        )
+    finally:
+        app.container.chatGPT_vocabulary_generator.reset_override()
+        app.container.vocabulary_repository.reset_override()
+    assert response.status_code == 200
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert events[-1] == {"event": "batch_done", "lessons": 2, "failed": 0}
+    assert voca_repo_mock.create_with_category.call_count == 2
+
+
+def test_func_generate_vocabulary_question_batch_too_large(client):
+    auth_service_mock = mock_user()
+    app.container.auth.override(auth_service_mock)
+    response = client.post(
+        VOCABULARY_BATCH_URL, headers=get_http_header(), json={"lessons": []}
+    )
+    assert response.status_code == 200
+    assert response.json()["status_code"] == 10005
+
+
 def test_prompt_parse_failed(client):
     auth_service_mock = mock_user()
     voca_repo_mock = mock.Mock(spec=VocabularyRepository)
     open_ai_mock = mock.Mock(spec=OpenAI)
-    open_ai_mock.stream.return_value = mock_wrong_chat_gpt_response()
+    open_ai_mock.astream.return_value = async_stream(mock_wrong_chat_gpt_response())
     app.container.auth.override(auth_service_mock)
     app.container.open_ai.override(open_ai_mock)
     app.container.vocabulary_repository.override(voca_repo_mock)
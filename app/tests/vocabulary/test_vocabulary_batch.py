@@ -0,0 +1,197 @@
+import asyncio
+import json
+import time
+from unittest import mock
+
+import pytest
+
+from app.infrastructure.llm.fake import FakeLLM
+from app.infrastructure.llm.lesson_cache import LessonCache
+from app.infrastructure.llm.vocabulary import ChatGPTVocabularyGenerator
+from app.infrastructure.metrics.metrics import MetricsRegistry
+from app.models.schemas.vocabulary import NDJSON_STREAM, GetVocabularyQuestions
+from app.repositories.vocabulary_repository import (
+    CreateWithCategoryResponse,
+    VocabularyRepository,
+)
+from app.services.admission import AdmissionController, AdmissionRejected
+from app.services.vocabulary_service import (
+    VocabularyService,
+    user_lesson_cache_key,
+)
+
+LESSON_TIME = 0.5
+
+
+def batch_service(fan_out: int, repository: mock.Mock, **kwargs) -> VocabularyService:
+    model = FakeLLM(first_token_delay=LESSON_TIME, tokens_per_second=0)
+    return VocabularyService(
+        voca_generator=ChatGPTVocabularyGenerator(model=model),
+        voca_repository=repository,
+        batch_fan_out=fan_out,
+        **kwargs,
+    )
+
+
+def lesson_repository() -> mock.Mock:
+    repository = mock.Mock(spec=VocabularyRepository)
+    repository.create_with_category.side_effect = lambda lesson, user_id: (
+        CreateWithCategoryResponse(category_id=1, learning_language="ENGLISH")
+    )
+    return repository
+
+
+def lessons(count: int) -> list[GetVocabularyQuestions]:
+    return [
+        GetVocabularyQuestions(
+            category=f"category {index}",
+            learning_language="ENGLISH",
+            translated_language="VIETNAMESE",
+            num_questions=2,
+            num_answers=3,
+            stream_format=NDJSON_STREAM,
+        )
+        for index in range(count)
+    ]
+
+
+async def collect(service: VocabularyService, count: int, **kwargs) -> list[dict]:
+    return [
+        json.loads(line)
+        async for line in service.get_new_vocabulary_lesson_batch_async(
+            "user123", lessons(count), **kwargs
+        )
+    ]
+
+
+@pytest.mark.asyncio()
+async def test_batch_lessons_are_generated_concurrently():
+    repository = lesson_repository()
+    service = batch_service(fan_out=4, repository=repository)
+
+    started = time.perf_counter()
+    events = await collect(service, 4)
+    elapsed = time.perf_counter() - started
+
+    # Close to one lesson, far from the sum of the four
+    assert elapsed < 2 * LESSON_TIME
+    assert sorted(event["item"] for event in events if event["event"] == "done") == [
+        0,
+        1,
+        2,
+        3,
+    ]
+    assert all("item" in event for event in events[:-1])
+    assert events[-1] == {"event": "batch_done", "lessons": 4, "failed": 0}
+    assert repository.create_with_category.call_count == 4
+
+
+@pytest.mark.asyncio()
+async def test_batch_fan_out_is_bounded():
+    service = batch_service(fan_out=2, repository=lesson_repository())
+
+    started = time.perf_counter()
+    await collect(service, 4)
+
+    assert time.perf_counter() - started >= 2 * LESSON_TIME
+
+
+@pytest.mark.asyncio()
+async def test_failed_lesson_does_not_stop_the_batch():
+    def create_with_category(lesson, user_id):
+        if lesson.category == "category 1":
+            raise RuntimeError("database is down")
+        return CreateWithCategoryResponse(category_id=1, learning_language="ENGLISH")
+
+    repository = mock.Mock(spec=VocabularyRepository)
+    repository.create_with_category.side_effect = create_with_category
+    service = batch_service(fan_out=4, repository=repository)
+
+    events = await collect(service, 3)
+
+    errors = [event for event in events if event["event"] == "error"]
+    assert errors == [{"event": "error", "detail": "database is down", "item": 1}]
+    assert events[-1] == {"event": "batch_done", "lessons": 3, "failed": 1}
+
+
+@pytest.mark.asyncio()
+async def test_batch_lessons_take_admission_slots():
+    metrics = MetricsRegistry()
+    admission = AdmissionController(max_concurrent=1, metrics=metrics)
+    service = batch_service(fan_out=4, repository=lesson_repository())
+
+    started = time.perf_counter()
+    events = await collect(service, 2, admission=admission)
+
+    # One slot: the lessons ran one after the other
+    assert time.perf_counter() - started >= 2 * LESSON_TIME
+    assert events[-1]["failed"] == 0
+    assert metrics.snapshot()["counters"]["admission_admitted_total"] == 2
+    assert metrics.snapshot()["gauges"]["admission_active"] == 0
+
+
+@pytest.mark.asyncio()
+async def test_lesson_without_a_slot_is_refunded():
+    admission = AdmissionController(max_concurrent=1, max_queue=0, user_burst=3)
+    service = batch_service(fan_out=4, repository=lesson_repository())
+    admission.charge_user("user123", 2)
+
+    events = await collect(service, 2, admission=admission)
+
+    assert events[-1]["failed"] == 1
+    # The lesson rejected for a slot gave its token back
+    admission.charge_user("user123", 2)
+    with pytest.raises(AdmissionRejected):
+        admission.charge_user("user123")
+
+
+@pytest.mark.asyncio()
+async def test_closed_batch_waits_for_its_lessons():
+    service = batch_service(fan_out=4, repository=lesson_repository())
+    cleaned_up = []
+
+    async def stream_lesson(user_id, stream, ready=None):
+        try:
+            await asyncio.sleep(10)
+            yield ""
+        finally:
+            await asyncio.sleep(0.01)
+            cleaned_up.append(stream.item)
+
+    service._stream_lesson = stream_lesson
+    batch = service.get_new_vocabulary_lesson_batch_async("user123", lessons(3))
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(batch.__anext__(), LESSON_TIME / 2)
+
+    assert sorted(cleaned_up) == [0, 1, 2]
+
+
+@pytest.mark.asyncio()
+async def test_cached_lesson_takes_no_slot():
+    metrics = MetricsRegistry()
+    admission = AdmissionController(max_concurrent=1, user_burst=2, metrics=metrics)
+    cache = LessonCache(max_size=10, ttl=60)
+    part = {
+        "lesson": "lesson",
+        "questions": [{"question": "q", "options": ["A", "B"], "answer": "A"}],
+    }
+    cache.set(
+        user_lesson_cache_key(lessons(1)[0]),
+        json.dumps({"ENGLISH": part, "VIETNAMESE": part}),
+    )
+    service = batch_service(
+        fan_out=4, repository=lesson_repository(), lesson_cache=cache
+    )
+    admission.charge_user("user123", 2)
+
+    started = time.perf_counter()
+    events = await collect(service, 2, admission=admission)
+
+    # The cached lesson did not wait for the slot of the generated one
+    assert time.perf_counter() - started < 2 * LESSON_TIME
+    assert events[-1]["failed"] == 0
+    assert metrics.snapshot()["counters"]["admission_admitted_total"] == 1
+    # Its token was given back
+    admission.charge_user("user123")
+    with pytest.raises(AdmissionRejected):
+        admission.charge_user("user123")
@@ -0,0 +1,391 @@
+import itertools
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+from app.infrastructure.db.database import Database
+from app.models.common.pagination import (
+    CACHED_COUNT,
+    NO_COUNT,
+    WINDOW_COUNT,
+    CountCache,
+)
+from app.models.db.difficulty_levels import DifficultyLevels
+from app.models.db.language import Language
+from app.models.db.users import UserInfo
+from app.models.db.vocabulary import (
+    Category,
+    VocabularyAnswer,
+    VocabularyAnswerTranslation,
+    VocabularyPrompt,
+    VocabularyPromptTranslation,
+    VocabularyQuestion,
+    VocabularyQuestionTranslation,
+)
+from app.models.schemas.vocabulary import (
+    GetVocabularyHistoryQuestion,
+    VocabularyAnswerCreate,
+    VocabularyPromptCreate,
+    VocabularyQuestionCreate,
+)
+from app.repositories.reference_data_repository import ReferenceDataRepository
+from app.repositories.vocabulary_repository import (
+    BULK_LESSON_INSERT,
+    LESSON_MODELS,
+    ORM_LESSON_INSERT,
+    InvalidLessonInsertMode,
+    VocabularyRepository,
+    _columns,
+    _load_lesson_trees,
+    build_lesson_document,
+    build_lesson_rows,
+    insert_lesson_rows,
+    user_count_scope,
+)
+from app.tests.utils import assert_num_queries, create_test_database
+
+USER_ID = "user123"
+NUM_PROMPTS = 12
+NUM_QUESTIONS = 5
+NUM_ANSWERS = 3
+CREATED_AT = datetime(2023, 9, 1)
+
+
+def seed_lessons(db: Database) -> int:
+    with db.session() as session:
+        english = Language(language_name="ENGLISH")
+        vietnamese = Language(language_name="VIETNAMESE")
+        easy = DifficultyLevels(name="EASY")
+        user = UserInfo(
+            user_id=USER_ID,
+            full_name="user",
+            email="user@gmail.com",
+            phone_number="+84123456789",
+        )
+        category = Category(category_name="football", user_id=USER_ID)
+        session.add_all([english, vietnamese, easy, user, category])
+        session.flush()
+        for prompt_index in range(NUM_PROMPTS):
+            prompt = VocabularyPrompt(
+                prompt=f"lesson {prompt_index}",
+                # Pairs of prompts share a timestamp so the id breaks the tie
+                created_at=CREATED_AT + timedelta(minutes=prompt_index // 2),
+                category_id=category.id,
+                language_id=english.id,
+                difficulty_level=easy,
+            )
+            session.add(
+                VocabularyPromptTranslation(
+                    prompt=prompt,
+                    translated_text=f"bai hoc {prompt_index}",
+                    translated_language_id=vietnamese.id,
+                )
+            )
+            for question_index in range(NUM_QUESTIONS):
+                question = VocabularyQuestion(
+                    prompt=prompt,
+                    question_text=f"question {question_index}",
+                    language_id=english.id,
+                )
+                session.add(
+                    VocabularyQuestionTranslation(
+                        question=question,
+                        translated_text=f"cau hoi {question_index}",
+                        translated_language_id=vietnamese.id,
+                    )
+                )
+                for answer_index in range(NUM_ANSWERS):
+                    answer = VocabularyAnswer(
+                        question=question,
+                        answer_text=f"answer {answer_index}",
+                        is_correct=answer_index == 0,
+                        language_id=english.id,
+                    )
+                    session.add(
+                        VocabularyAnswerTranslation(
+                            answer=answer,
+                            translated_text=f"dap an {answer_index}",
+                            translated_language_id=vietnamese.id,
+                        )
+                    )
+        session.commit()
+        return category.id
+
+
+@pytest.fixture()
+def database(tmp_path):
+    return create_test_database(tmp_path)
+
+
+@pytest.fixture()
+def legacy_category_id(database):
+    return seed_lessons(database)
+
+
+@pytest.fixture()
+def category_id(database, legacy_category_id):
+    VocabularyRepository(
+        model=VocabularyPrompt, session_factory=database.session
+    ).rebuild_lesson_documents()
+    return legacy_category_id
+
+
+@pytest.fixture()
+def repository(database):
+    return VocabularyRepository(
+        model=VocabularyPrompt, session_factory=database.session
+    )
+
+
+def test_get_history_questions_query_count(repository, category_id):
+    question_input = GetVocabularyHistoryQuestion(
+        category_id=category_id, learning_language="english"
+    )
+    # One query for the page and one for the total, whatever the page holds
+    for size in (2, 5, NUM_PROMPTS):
+        with assert_num_queries(2):
+            result = repository.get_history_questions(question_input, USER_ID, 1, size)
+
+        assert result.total == NUM_PROMPTS
+        assert len(result.items) == size
+    lesson = result.items[0]
+    assert lesson["language"]["language_name"] == "ENGLISH"
+    assert lesson["difficulty_level"]["name"] == "EASY"
+    assert lesson["translations"][0]["translated_language"]["language_name"] == (
+        "VIETNAMESE"
+    )
+    assert len(lesson["questions"]) == NUM_QUESTIONS
+    assert len(lesson["questions"][0]["answers"]) == NUM_ANSWERS
+    assert lesson["questions"][0]["answers"][0]["translations"][0]["translated_text"]
+    assert "lesson_document" not in lesson
+
+
+def test_get_history_questions_without_document(
+    database, repository, legacy_category_id
+):
+    question_input = GetVocabularyHistoryQuestion(
+        category_id=legacy_category_id, learning_language="english"
+    )
+    # Children of the lessons without a document are loaded for the page
+    with assert_num_queries(2 + 6):
+        legacy_page = repository.get_history_questions(question_input, USER_ID, 1, 5)
+
+    assert repository.rebuild_lesson_documents(batch_size=5) == 5
+    assert repository.rebuild_lesson_documents() == NUM_PROMPTS - 5
+    assert repository.rebuild_lesson_documents() == 0
+    with assert_num_queries(2):
+        page = repository.get_history_questions(question_input, USER_ID, 1, 5)
+    assert jsonable_encoder(page) == jsonable_encoder(legacy_page)
+
+
+def test_get_history_questions_with_cursor(repository, category_id):
+    question_input = GetVocabularyHistoryQuestion(
+        category_id=category_id, learning_language="english"
+    )
+    first_page = repository.get_history_questions(question_input, USER_ID, 1, 5)
+    assert first_page.next_cursor is not None
+
+    seen = [prompt["id"] for prompt in first_page.items]
+    cursor = first_page.next_cursor
+    for _ in range(NUM_PROMPTS):
+        if cursor is None:
+            break
+        # Deep pages seek on (created_at, id) and skip the total count
+        with assert_num_queries(1):
+            next_page = repository.get_history_questions(
+                question_input, USER_ID, 1, 5, cursor
+            )
+        assert next_page.total is None
+        seen += [prompt["id"] for prompt in next_page.items]
+        cursor = next_page.next_cursor
+
+    assert len(seen) == NUM_PROMPTS
+    assert seen == sorted(seen, reverse=True)
+
+
+@pytest.mark.parametrize(
+    ("count_strategy", "expected_queries", "expected_total"),
+    [(WINDOW_COUNT, 1, NUM_PROMPTS), (NO_COUNT, 1, None)],
+)
+def test_get_history_questions_count_strategy(
+    database, category_id, count_strategy, expected_queries, expected_total
+):
+    repository = VocabularyRepository(
+        model=VocabularyPrompt,
+        session_factory=database.session,
+        count_strategy=count_strategy,
+    )
+    question_input = GetVocabularyHistoryQuestion(
+        category_id=category_id, learning_language="english"
+    )
+    with assert_num_queries(expected_queries):
+        result = repository.get_history_questions(question_input, USER_ID, 1, 5)
+    assert result.total == expected_total
+    assert len(result.items) == 5
+    assert len(result.items[0]["questions"]) == NUM_QUESTIONS
+
+
+def test_get_history_questions_cached_count(database, category_id):
+    count_cache = CountCache(ttl=60)
+    repository = VocabularyRepository(
+        model=VocabularyPrompt,
+        session_factory=database.session,
+        count_strategy=CACHED_COUNT,
+        count_cache=count_cache,
+    )
+    question_input = GetVocabularyHistoryQuestion(
+        category_id=category_id, learning_language="english"
+    )
+    with assert_num_queries(2):
+        repository.get_history_questions(question_input, USER_ID, 1, 5)
+    with assert_num_queries(1):
+        result = repository.get_history_questions(question_input, USER_ID, 2, 5)
+    assert result.total == NUM_PROMPTS
+
+    count_cache.invalidate(user_count_scope(USER_ID))
+    with assert_num_queries(2):
+        repository.get_history_questions(question_input, USER_ID, 1, 5)
+
+
+def build_lesson(category: str) -> VocabularyPromptCreate:
+    return VocabularyPromptCreate(
+        prompt="new lesson",
+        category=category,
+        learning_language="ENGLISH",
+        translated_language="VIETNAMESE",
+        translation="bai hoc moi",
+        difficulty_level="EASY",
+        questions=[
+            VocabularyQuestionCreate(
+                question_text=f"new question {question_index}",
+                translation=f"cau hoi moi {question_index}",
+                answers=[
+                    VocabularyAnswerCreate(
+                        answer_text=f"new answer {question_index}.{answer_index}",
+                        translation=f"dap an moi {question_index}.{answer_index}",
+                        is_correct=answer_index == 0,
+                    )
+                    for answer_index in range(NUM_ANSWERS)
+                ],
+            )
+            for question_index in range(NUM_QUESTIONS)
+        ],
+    )
+
+
+def unreserved_ids() -> dict:
+    # Past the ids of the seeded lessons
+    return {model: itertools.count(10_000) for model in LESSON_MODELS}
+
+
+def test_insert_lesson_rows(database, category_id):
+    with database.session() as session:
+        english = session.query(Language).filter_by(language_name="ENGLISH").one()
+        vietnamese = session.query(Language).filter_by(language_name="VIETNAMESE").one()
+        easy = session.query(DifficultyLevels).filter_by(name="EASY").one()
+        prompt = build_lesson_rows(
+            build_lesson("football"),
+            unreserved_ids(),
+            category_id,
+            easy.id,
+            english.id,
+            vietnamese.id,
+        )
+        # The document is built from the rows before they are stored
+        document = build_lesson_document(
+            prompt, _columns(english), _columns(easy), _columns(vietnamese)
+        )
+        with assert_num_queries(6):
+            insert_lesson_rows(session, prompt)
+        session.commit()
+        session.expire_all()
+
+        prompt = session.get(VocabularyPrompt, prompt.id)
+        _load_lesson_trees(session, [prompt.id])
+        assert without_timestamps(document) == without_timestamps(
+            build_lesson_document(prompt)
+        )
+        assert prompt.is_valid
+        assert prompt.translations[0].translated_text == "bai hoc moi"
+        assert len(prompt.questions) == NUM_QUESTIONS
+        for question in prompt.questions:
+            index = question.question_text.split()[-1]
+            assert question.translations[0].translated_text == f"cau hoi moi {index}"
+            assert len(question.answers) == NUM_ANSWERS
+            for answer in question.answers:
+                assert answer.answer_text.startswith(f"new answer {index}.")
+                assert answer.translations[0].translated_text == (
+                    answer.answer_text.replace("new answer", "dap an moi")
+                )
+
+
+def test_insert_lesson_rows_without_questions(database, category_id):
+    lesson = build_lesson("football")
+    lesson.questions = []
+    with database.session() as session:
+        english = session.query(Language).filter_by(language_name="ENGLISH").one()
+        vietnamese = session.query(Language).filter_by(language_name="VIETNAMESE").one()
+        easy = session.query(DifficultyLevels).filter_by(name="EASY").one()
+
+        prompt = build_lesson_rows(
+            lesson, unreserved_ids(), category_id, easy.id, english.id, vietnamese.id
+        )
+        with assert_num_queries(2):
+            insert_lesson_rows(session, prompt)
+        session.commit()
+
+        prompt = session.get(VocabularyPrompt, prompt.id)
+        assert prompt.questions == []
+        assert build_lesson_document(prompt)["questions"] == []
+        assert prompt.translations[0].translated_text == "bai hoc moi"
+
+
+def without_timestamps(document):
+    # SQLite reads the timestamps back without their time zone
+    if isinstance(document, dict):
+        return {
+            key: without_timestamps(value)
+            for key, value in document.items()
+            if key not in ("created_at", "updated_at")
+        }
+    if isinstance(document, list):
+        return [without_timestamps(value) for value in document]
+    return document
+
+
+@pytest.mark.parametrize("lesson_insert_mode", [ORM_LESSON_INSERT, BULK_LESSON_INSERT])
+def test_create_with_category_query_count(database, category_id, lesson_insert_mode):
+    reference_data = ReferenceDataRepository(session_factory=database.session)
+    reference_data.refresh()
+    repository = VocabularyRepository(
+        model=VocabularyPrompt,
+        session_factory=database.session,
+        reference_data=reference_data,
+        lesson_insert_mode=lesson_insert_mode,
+    )
+    # The category upsert reserving the ids, then one INSERT per table and no
+    # UPDATE for the document, nor reads of the language and difficulty level
+    with assert_num_queries(1 + 6):
+        repository.create_with_category(build_lesson("football"), USER_ID)
+    repository.create_with_category(build_lesson("football"), USER_ID)
+
+    with database.session() as session:
+        prompts = session.query(VocabularyPrompt).order_by(VocabularyPrompt.id.desc())
+        _load_lesson_trees(session, [prompt.id for prompt in prompts[:2]])
+        for prompt in prompts[:2]:
+            assert without_timestamps(prompt.lesson_document) == without_timestamps(
+                build_lesson_document(prompt)
+            )
+        # The second lesson got ids after the ones of the first
+        assert prompts[0].id == prompts[1].id + 1
+        assert prompts[0].questions[0].id == prompts[1].questions[-1].id + 1
+
+
+def test_invalid_lesson_insert_mode(database):
+    with pytest.raises(InvalidLessonInsertMode):
+        VocabularyRepository(
+            model=VocabularyPrompt,
+            session_factory=database.session,
+            lesson_insert_mode="copy",
+        )
@@ -0,0 +1,220 @@
+import json
+from unittest import mock
+
+import pytest
+from langchain import OpenAI
+
+from app.infrastructure.llm.vocabulary import ChatGPTVocabularyGenerator
+from app.infrastructure.metrics.metrics import MetricsRegistry, metric_key
+from app.models.schemas.vocabulary import (
+    NDJSON_STREAM,
+    SSE_STREAM,
+    TEXT_STREAM,
+    GetVocabularyQuestions,
+)
+from app.repositories.vocabulary_repository import (
+    CreateWithCategoryResponse,
+    VocabularyRepository,
+)
+from app.services.vocabulary_service import (
+    LESSON_PARSE_METRIC,
+    PromptParserException,
+    VocabularyService,
+)
+from app.tests.utils import async_stream
+
+CREATED = CreateWithCategoryResponse(category_id=1, learning_language="ENGLISH")
+
+
+def lesson_text(num_questions: int = 1) -> str:
+    part = {
+        "lesson": "lesson",
+        "questions": [
+            {"question": f"q{index}", "options": ["A", "B"], "answer": "A"}
+            for index in range(num_questions)
+        ],
+    }
+    return json.dumps({"ENGLISH": part, "VIETNAMESE": part})
+
+
+def lesson_chunks() -> list[str]:
+    lesson = lesson_text()
+    return [lesson[:10], lesson[10:]]
+
+
+def lesson_request(stream_format: str = TEXT_STREAM) -> GetVocabularyQuestions:
+    return GetVocabularyQuestions(
+        category="football",
+        learning_language="ENGLISH",
+        translated_language="VIETNAMESE",
+        level_type="EASY",
+        num_questions=1,
+        num_answers=2,
+        stream_format=stream_format,
+    )
+
+
+def vocabulary_service(chunks: list[str], async_mode: bool = False):
+    open_ai_mock = mock.Mock(spec=OpenAI)
+    open_ai_mock.astream.return_value = async_stream(chunks)
+    repository = mock.AsyncMock(spec=VocabularyRepository)
+    repository.create_with_category = mock.Mock(return_value=CREATED)
+    repository.create_with_category_async.return_value = CREATED
+    service = VocabularyService(
+        voca_generator=ChatGPTVocabularyGenerator(model=open_ai_mock),
+        voca_repository=repository,
+        async_mode=async_mode,
+    )
+    return service, open_ai_mock, repository
+
+
+async def collect(
+    service: VocabularyService, stream_format: str = TEXT_STREAM
+) -> list[str]:
+    return [
+        text
+        async for text in service.get_new_vocabulary_lessons_async(
+            "user123", lesson_request(stream_format)
+        )
+    ]
+
+
+@pytest.mark.asyncio()
+async def test_async_lesson_streams_chunks_as_generated():
+    chunks = lesson_chunks()
+    service, open_ai_mock, repository = vocabulary_service(chunks)
+
+    streamed = await collect(service)
+
+    assert streamed[:2] == chunks
+    assert streamed[2] == "\n \n \n"
+    assert streamed[3] == str({"category_id": 1, "learning_language": "ENGLISH"})
+    open_ai_mock.astream.assert_called_once()
+    # The sync repository is written from the threadpool
+    repository.create_with_category.assert_called_once()
+    repository.create_with_category_async.assert_not_called()
+
+
+@pytest.mark.asyncio()
+async def test_async_lesson_uses_async_repository_in_async_mode():
+    service, _, repository = vocabulary_service(lesson_chunks(), async_mode=True)
+
+    await collect(service)
+
+    repository.create_with_category_async.assert_awaited_once()
+    repository.create_with_category.assert_not_called()
+
+
+@pytest.mark.asyncio()
+async def test_async_lesson_parse_failed():
+    service, _, repository = vocabulary_service(['{"ENGLISH": '])
+
+    with pytest.raises(PromptParserException):
+        await collect(service)
+    repository.create_with_category.assert_not_called()
+
+
+@pytest.mark.asyncio()
+async def test_ndjson_stream_sends_an_event_per_question():
+    lesson = lesson_text(num_questions=2)
+    # One character per chunk, the way tokens arrive
+    service, _, _ = vocabulary_service(list(lesson))
+
+    events = [json.loads(line) for line in await collect(service, NDJSON_STREAM)]
+
+    assert [(event["event"], event.get("index")) for event in events] == [
+        ("lesson", None),
+        ("question", 0),
+        ("question", 1),
+        ("lesson", None),
+        ("question", 0),
+        ("question", 1),
+        ("done", None),
+    ]
+    assert events[1]["language"] == "ENGLISH"
+    assert events[1]["question"] == {
+        "question": "q0",
+        "options": ["A", "B"],
+        "answer": "A",
+    }
+    assert events[-1] == {
+        "event": "done",
+        "category_id": 1,
+        "learning_language": "ENGLISH",
+        "salvaged": False,
+    }
+
+
+@pytest.mark.asyncio()
+async def test_sse_stream_frames_events():
+    service, _, _ = vocabulary_service(lesson_chunks())
+
+    frames = await collect(service, SSE_STREAM)
+
+    assert (
+        frames[0]
+        == 'event: lesson\ndata: {"language": "ENGLISH", "lesson": "lesson"}\n\n'
+    )
+    assert frames[-1].startswith("event: done\ndata: ")
+    assert all(frame.endswith("\n\n") for frame in frames)
+
+
+@pytest.mark.asyncio()
+async def test_broken_lesson_is_salvaged():
+    # The model stopped in the middle of the second translated question
+    lesson = lesson_text(num_questions=3)
+    broken = lesson[: lesson.rindex('"q1"')]
+    service, _, repository = vocabulary_service([broken])
+
+    events = [json.loads(line) for line in await collect(service, NDJSON_STREAM)]
+
+    assert events[-1]["event"] == "done"
+    assert events[-1]["salvaged"]
+    learning_obj = repository.create_with_category.call_args.args[0]
+    assert [question.question_text for question in learning_obj.questions] == ["q0"]
+
+
+@pytest.mark.asyncio()
+async def test_structured_stream_reports_parse_failure():
+    service, _, repository = vocabulary_service(['{"ENGLISH": '])
+
+    events = [json.loads(line) for line in await collect(service, NDJSON_STREAM)]
+
+    assert events == [
+        {"event": "error", "detail": "Can not parse prompt response to json"}
+    ]
+    repository.create_with_category.assert_not_called()
+
+
+@pytest.mark.asyncio()
+async def test_near_valid_lesson_is_repaired():
+    # Raw newline in a string, trailing commas and no closing braces
+    lesson = lesson_text(num_questions=2).replace(
+        ': "lesson"', ': "line one\nline two"'
+    )
+    broken = lesson.replace('"A"]', '"A",]')[:-2]
+    metrics = MetricsRegistry()
+    service, _, repository = vocabulary_service([broken])
+    service.metrics = metrics
+
+    events = [json.loads(line) for line in await collect(service, NDJSON_STREAM)]
+
+    assert events[-1]["event"] == "done"
+    assert not events[-1]["salvaged"]
+    learning_obj = repository.create_with_category.call_args.args[0]
+    assert learning_obj.prompt == "line one\nline two"
+    assert len(learning_obj.questions) == 2
+    outcome = metric_key(LESSON_PARSE_METRIC, {"outcome": "repaired"})
+    assert metrics.snapshot()["counters"][outcome] == 1
+
+
+@pytest.mark.asyncio()
+async def test_lesson_without_complete_question_fails():
+    lesson = json.loads(lesson_text())
+    del lesson["VIETNAMESE"]["questions"][0]["answer"]
+    service, _, repository = vocabulary_service([json.dumps(lesson)])
+
+    events = [json.loads(line) for line in await collect(service, NDJSON_STREAM)]
+
+    assert events[-1]["event"] == "error"
+    repository.create_with_category.assert_not_called()
@@ -0,0 +1,31 @@
+"""Write the denormalized lesson document of the lessons created before it
+existed. Safe to re-run, only prompts without a document are touched:
+
+    DB_URL=postgresql+psycopg2://... python -m scripts.backfill_lesson_documents
+"""
+import argparse
+import os
+
+from app.infrastructure.db.database import Database
+from app.models.db.vocabulary import VocabularyPrompt
+from app.repositories.vocabulary_repository import VocabularyRepository
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    db = Database(os.environ["DB_URL"])
+    repository = VocabularyRepository(
+        model=VocabularyPrompt, session_factory=db.session
+    )
+    total = 0
+    # One transaction per batch keeps the row locks short
+    while written := repository.rebuild_lesson_documents(args.batch_size):
+        total += written
+        print(f"{total} lesson documents written")
+
+
+if __name__ == "__main__":
+    main()
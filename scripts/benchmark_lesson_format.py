@@ -0,0 +1,136 @@
+"""Compare the verbose and compact lesson formats on the offline fake LLM.
+
+Each run generates a bilingual lesson, streams it through the service parser
+and decodes it to a `VocabularyPromptCreate`. The completion tokens are
+counted with the tiktoken encoding of `--model` (estimated from the text
+length when it can not be loaded), the latencies are measured from the
+request to the first question event and to the decoded lesson:
+
+    python -m scripts.benchmark_lesson_format --runs 20 --questions 5
+"""
+import argparse
+import asyncio
+import math
+import time
+from dataclasses import dataclass
+from typing import List
+
+from app.infrastructure.llm.fake import FakeLLM
+from app.infrastructure.llm.usage import (
+    DEFAULT_MODEL,
+    LLMCall,
+    UsageRecorder,
+    token_counter,
+)
+from app.infrastructure.llm.vocabulary import (
+    LESSON_FORMATS,
+    ChatGPTVocabularyGenerator,
+)
+from app.models.schemas.vocabulary import NDJSON_STREAM, GetVocabularyQuestions
+from app.services.vocabulary_service import LessonStream, parse_json_prompt
+
+LEARNING_LANGUAGE = "ENGLISH"
+TRANSLATED_LANGUAGE = "VIETNAMESE"
+
+
+@dataclass
+class Run:
+    completion_tokens: int
+    first_question: float
+    latency: float
+
+
+def percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    rank = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+async def generate(args: argparse.Namespace, lesson_format: str, index: int) -> Run:
+    calls: List[LLMCall] = []
+    model = FakeLLM(
+        first_token_delay=args.first_token_delay,
+        tokens_per_second=args.tokens_per_second,
+    )
+    # The completion tokens are counted with the encoding of the model name
+    model.model_name = args.model
+    generator = ChatGPTVocabularyGenerator(
+        model=model,
+        usage=UsageRecorder(sink=calls.extend),
+        lesson_format=lesson_format,
+    )
+    user_input = GetVocabularyQuestions(
+        category=f"category {index}",
+        learning_language=LEARNING_LANGUAGE,
+        translated_language=TRANSLATED_LANGUAGE,
+        level_type="EASY",
+        num_questions=args.questions,
+        num_answers=args.answers,
+        stream_format=NDJSON_STREAM,
+    )
+    stream = LessonStream(user_input)
+    started = time.perf_counter()
+    first_question = math.nan
+    async for text in generator.generate_vocabulary_questions_async(
+        category=user_input.category,
+        translated_language=TRANSLATED_LANGUAGE,
+        learning_language=LEARNING_LANGUAGE,
+        num_questions=args.questions,
+        num_answers=args.answers,
+    ):
+        if stream.feed(text) and math.isnan(first_question):
+            first_question = time.perf_counter() - started
+    parse_json_prompt(
+        user_input.category,
+        LEARNING_LANGUAGE,
+        TRANSLATED_LANGUAGE,
+        stream.load(),
+        user_input.level_type,
+    )
+    latency = time.perf_counter() - started
+    # The completion the generator received, before it was decoded
+    generator.usage.flush()
+    return Run(
+        completion_tokens=calls[0].completion_tokens,
+        first_question=first_question,
+        latency=latency,
+    )
+
+
+async def benchmark(args: argparse.Namespace, lesson_format: str) -> List[Run]:
+    return list(
+        await asyncio.gather(
+            *(generate(args, lesson_format, index) for index in range(args.runs))
+        )
+    )
+
+
+def report(lesson_format: str, runs: List[Run]) -> None:
+    tokens = [run.completion_tokens for run in runs]
+    print(
+        f"{lesson_format:>8}: {sum(tokens) / len(tokens):.0f} completion tokens, "
+        f"first question p50 {percentile([r.first_question for r in runs], 50):.2f}s, "
+        f"lesson p50 {percentile([r.latency for r in runs], 50):.2f}s "
+        f"p99 {percentile([r.latency for r in runs], 99):.2f}s"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--answers", type=int, default=4)
+    parser.add_argument("--first-token-delay", type=float, default=0.5)
+    parser.add_argument("--tokens-per-second", type=float, default=50)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    args = parser.parse_args()
+
+    token_counter.load(args.model)
+    for lesson_format in LESSON_FORMATS:
+        report(lesson_format, asyncio.run(benchmark(args, lesson_format)))
+
+
+if __name__ == "__main__":
+    main()
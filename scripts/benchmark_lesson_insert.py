@@ -0,0 +1,128 @@
+"""Compare the ORM and bulk write paths of a generated vocabulary lesson.
+
+Run against a migrated postgres database, the reference rows (languages,
+difficulty level and a user) are created when missing:
+
+    DB_URL=postgresql+psycopg2://... python -m scripts.benchmark_lesson_insert
+"""
+import argparse
+import os
+import time
+import uuid
+
+from sqlalchemy.orm import Session
+
+from app.infrastructure.db.database import Database
+from app.infrastructure.db.instrumentation import track_queries
+from app.models.db.difficulty_levels import DifficultyLevels
+from app.models.db.language import Language
+from app.models.db.users import UserInfo
+from app.models.db.vocabulary import VocabularyPrompt
+from app.models.schemas.vocabulary import (
+    VocabularyAnswerCreate,
+    VocabularyPromptCreate,
+    VocabularyQuestionCreate,
+)
+from app.repositories.reference_data_repository import ReferenceDataRepository
+from app.repositories.vocabulary_repository import (
+    BULK_LESSON_INSERT,
+    ORM_LESSON_INSERT,
+    VocabularyRepository,
+)
+
+LEARNING_LANGUAGE = "ENGLISH"
+TRANSLATED_LANGUAGE = "VIETNAMESE"
+DIFFICULTY_LEVEL = "EASY"
+
+
+def build_lesson(category: str, questions: int, answers: int) -> VocabularyPromptCreate:
+    return VocabularyPromptCreate(
+        prompt="benchmark lesson",
+        category=category,
+        learning_language=LEARNING_LANGUAGE,
+        translated_language=TRANSLATED_LANGUAGE,
+        translation="bai hoc",
+        difficulty_level=DIFFICULTY_LEVEL,
+        questions=[
+            VocabularyQuestionCreate(
+                question_text=f"question {question_index}",
+                translation=f"cau hoi {question_index}",
+                answers=[
+                    VocabularyAnswerCreate(
+                        answer_text=f"answer {answer_index}",
+                        translation=f"dap an {answer_index}",
+                        is_correct=answer_index == 0,
+                    )
+                    for answer_index in range(answers)
+                ],
+            )
+            for question_index in range(questions)
+        ],
+    )
+
+
+def seed_reference_data(db: Database, user_id: str) -> None:
+    session: Session
+    with db.session() as session:
+        for language_name in (LEARNING_LANGUAGE, TRANSLATED_LANGUAGE):
+            if (
+                not session.query(Language)
+                .filter_by(language_name=language_name)
+                .first()
+            ):
+                session.add(Language(language_name=language_name))
+        if not session.query(DifficultyLevels).filter_by(name=DIFFICULTY_LEVEL).first():
+            session.add(DifficultyLevels(name=DIFFICULTY_LEVEL))
+        session.add(
+            UserInfo(
+                user_id=user_id,
+                full_name="benchmark",
+                email=f"{user_id}@benchmark.local",
+                phone_number=user_id[:20],
+            )
+        )
+        session.commit()
+
+
+def run(db: Database, mode: str, args: argparse.Namespace, user_id: str) -> None:
+    reference_data = ReferenceDataRepository(db.session)
+    reference_data.refresh()
+    repository = VocabularyRepository(
+        model=VocabularyPrompt,
+        session_factory=db.session,
+        reference_data=reference_data,
+        lesson_insert_mode=mode,
+    )
+    lesson = build_lesson(f"benchmark-{mode}", args.questions, args.answers)
+    rows = 2 + 2 * args.questions + 2 * args.questions * args.answers
+
+    with track_queries() as stats:
+        started = time.perf_counter()
+        for _ in range(args.lessons):
+            repository.create_with_category(lesson, user_id)
+        elapsed = time.perf_counter() - started
+
+    print(
+        f"{mode:>4}: {args.lessons} lessons, {rows * args.lessons} rows in "
+        f"{elapsed:.2f}s, {rows * args.lessons / elapsed:.0f} rows/s, "
+        f"{elapsed / args.lessons * 1000:.1f} ms/lesson, "
+        f"{stats.count / args.lessons:.0f} statements/lesson"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lessons", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--answers", type=int, default=4)
+    args = parser.parse_args()
+
+    db = Database(os.environ["DB_URL"])
+    user_id = f"benchmark-{uuid.uuid4().hex[:8]}"
+    seed_reference_data(db, user_id)
+    for mode in (ORM_LESSON_INSERT, BULK_LESSON_INSERT):
+        run(db, mode, args, user_id)
+
+
+if __name__ == "__main__":
+    main()
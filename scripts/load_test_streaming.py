@@ -0,0 +1,180 @@
+"""Load test the streaming lesson and caption endpoints.
+
+Drives a running app with concurrent streaming clients and reports the
+time to first byte, total latency and throughput. Start the app with the
+fake LLM and replicate backends so the test costs nothing, and without the
+per-user limit since every request comes from the same token:
+
+    LLM_BACKEND=fake REPLICATE_BACKEND=fake LLM_USER_BURST=0 \\
+        uvicorn app.main:app --port 5000
+    LOAD_TEST_TOKEN=<auth0 access token> python -m scripts.load_test_streaming \\
+        --requests 500 --concurrency 50
+
+The caption endpoint needs an uploaded image, pass its key with
+`--endpoint caption --image-key <user>/<image>`.
+"""
+import argparse
+import asyncio
+import math
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+VOCABULARY = "vocabulary"
+CAPTION = "caption"
+PATHS = {VOCABULARY: "/lesson/vocabulary/question", CAPTION: "/image/caption"}
+
+
+@dataclass
+class Result:
+    status: int
+    time_to_first_byte: Optional[float]
+    latency: float
+    size: int
+    error: Optional[str] = None
+
+
+def percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    rank = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def build_payload(args: argparse.Namespace, index: int) -> Dict[str, Any]:
+    if args.endpoint == CAPTION:
+        return {
+            "image_bucket_path_key": args.image_key,
+            "learning_language": args.learning_language,
+            "primary_language": args.primary_language,
+        }
+    # Distinct categories are neither replayed from the cache nor coalesced
+    category = f"{args.category} {index}" if args.distinct else args.category
+    return {
+        "category": category,
+        "learning_language": args.learning_language,
+        "translated_language": args.primary_language,
+        "level_type": args.level,
+        "num_questions": args.questions,
+        "num_answers": args.answers,
+        "fresh": args.distinct,
+        "stream_format": args.stream_format,
+    }
+
+
+async def send(
+    client: httpx.AsyncClient, args: argparse.Namespace, index: int
+) -> Result:
+    started = time.perf_counter()
+    first_byte: Optional[float] = None
+    size = 0
+    try:
+        async with client.stream(
+            "POST", PATHS[args.endpoint], json=build_payload(args, index)
+        ) as response:
+            async for chunk in response.aiter_bytes():
+                if first_byte is None and chunk:
+                    first_byte = time.perf_counter() - started
+                size += len(chunk)
+        status = response.status_code
+        error = None
+    except httpx.HTTPError as e:
+        status, error = 0, f"{e.__class__.__name__}: {e}"
+    return Result(
+        status=status,
+        time_to_first_byte=first_byte,
+        latency=time.perf_counter() - started,
+        size=size,
+        error=error,
+    )
+
+
+async def run(args: argparse.Namespace) -> List[Result]:
+    queue: "asyncio.Queue[int]" = asyncio.Queue()
+    for index in range(args.requests):
+        queue.put_nowait(index)
+    results: List[Result] = []
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        while not queue.empty():
+            results.append(await send(client, args, queue.get_nowait()))
+
+    async with httpx.AsyncClient(
+        base_url=args.base_url,
+        headers={"Authorization": f"Bearer {args.token}"},
+        timeout=args.timeout,
+        limits=httpx.Limits(max_connections=args.concurrency),
+    ) as client:
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+    return results
+
+
+def report(results: List[Result], elapsed: float) -> None:
+    ok = [result for result in results if result.status == 200]
+    statuses = Counter(result.status for result in results)
+    print(
+        f"{len(results)} requests in {elapsed:.2f}s, "
+        + ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items()))
+    )
+    for error, count in Counter(r.error for r in results if r.error).items():
+        print(f"  {count} x {error}")
+    if not ok:
+        return
+    time_to_first_byte = [
+        result.time_to_first_byte
+        for result in ok
+        if result.time_to_first_byte is not None
+    ]
+    latency = [result.latency for result in ok]
+    for name, values in (("TTFT", time_to_first_byte), ("latency", latency)):
+        print(
+            f"{name:>8}: p50 {percentile(values, 50) * 1000:.0f} ms, "
+            f"p99 {percentile(values, 99) * 1000:.0f} ms, "
+            f"max {max(values, default=math.nan) * 1000:.0f} ms"
+        )
+    size = sum(result.size for result in ok)
+    print(
+        f"throughput: {len(ok) / elapsed:.1f} streams/s, "
+        f"{size / elapsed / 1024:.1f} KiB/s"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--base-url", default="http://localhost:5000/api/v1")
+    parser.add_argument("--token", default=os.environ.get("LOAD_TEST_TOKEN", ""))
+    parser.add_argument("--endpoint", choices=sorted(PATHS), default=VOCABULARY)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--category", default="football")
+    parser.add_argument("--learning-language", default="ENGLISH")
+    parser.add_argument("--primary-language", default="VIETNAMESE")
+    parser.add_argument("--level", default="EASY")
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--answers", type=int, default=3)
+    parser.add_argument("--stream-format", default="text")
+    parser.add_argument("--image-key", default="")
+    parser.add_argument(
+        "--distinct",
+        action="store_true",
+        help="Give every lesson request its own category",
+    )
+    args = parser.parse_args()
+    if args.endpoint == CAPTION and not args.image_key:
+        parser.error("--image-key is required for the caption endpoint")
+
+    started = time.perf_counter()
+    results = asyncio.run(run(args))
+    report(results, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()